@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# Copyright (C) 2013 Peter Rowlands
+"""
+Import time benchmark
+
+Measures the cold start time of importing pysrcds modules in fresh
+interpreters.
+
+Usage: python benchmarks/import_time.py [-n RUNS] [module ...]
+
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+DEFAULT_MODULES = [
+    'srcds.objects',
+    'srcds.events.generic',
+    'srcds.events.csgo',
+    'srcds.logparser',
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module, runs):
+    """Return the median import time of module in seconds"""
+    code = '\n'.join([
+        'import time',
+        't = time.time()',
+        'import %s' % module if module else 'pass',
+        'print(time.time() - t)',
+    ])
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env)
+        times.append(float(output))
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    args = parser.parse_args()
+    # make sure imports read cached bytecode, as they do once installed
+    subprocess.check_call([sys.executable, '-m', 'compileall', '-q',
+                           os.path.join(ROOT, 'srcds')])
+    for module in args.modules:
+        print('%-24s %8.2f ms' % (module,
+                                  time_import(module, args.runs) * 1000))
+
+
+if __name__ == '__main__':
+    main()
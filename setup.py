@@ -23,7 +23,7 @@ setup(
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
     ],
-    install_requires=['future'],
+    install_requires=['future; python_version < "3"'],
     long_description='''
 =======
 pysrcds
@@ -0,0 +1,25 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Python 2/3 compatibility module
+
+The future package is only imported (and only required) on Python 2.
+
+"""
+
+import sys
+
+__all__ = ['integer_types', 'python_2_unicode_compatible']
+
+
+try:
+    integer_types = (int, long)
+except NameError:
+    integer_types = (int,)
+
+
+if sys.version_info[0] >= 3:
+    def python_2_unicode_compatible(cls):
+        """No-op on Python 3, where __str__ already returns unicode"""
+        return cls
+else:
+    from future.utils import python_2_unicode_compatible
@@ -0,0 +1,515 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+asyncio support module
+
+Requires Python 3.5 or later.
+
+"""
+
+import asyncio
+import inspect
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .dispatch import EventBus, Subscription
+from .logparser import SourceLogParser
+
+
+def _running_loop():
+    """Return the event loop running in this thread, or None"""
+    try:
+        get_running_loop = asyncio.get_running_loop
+    except AttributeError:
+        # Python < 3.7
+        return asyncio._get_running_loop()
+    try:
+        return get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class AsyncSubscription(Subscription):
+
+    """A handler subscribed to an AsyncEventBus
+
+    Each subscription has its own bounded queue and worker task, so a slow
+    handler only delays publishers once its queue is full and never delays
+    other subscribers' handlers.
+
+    Args:
+        event_type: Event class. Events of any subclass are also delivered.
+        handler: Callable or coroutine function which takes a single event,
+            or a list of events if batch_size is set.
+        batch_size: Optional maximum number of queued events to pass to
+            handler as a list. Batches are not padded, whatever is queued
+            (up to batch_size) is delivered as soon as the handler is free.
+        max_pending: Maximum number of queued events before publishers
+            block.
+
+    Attributes:
+        dropped: Number of events dropped by deliver() because the queue
+            was full.
+
+    """
+
+    def __init__(self, event_type, handler, batch_size=None,
+                 max_pending=1024):
+        super(AsyncSubscription, self).__init__(event_type, handler,
+                                                batch_size=batch_size)
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.error = None
+        self.dropped = 0
+        self._task = None
+        # loop the worker was started on
+        self._loop = None
+
+    def deliver(self, event):
+        """Queue an event without blocking
+
+        This is the synchronous EventBus.dispatch() path, used when an
+        AsyncEventBus is attached to a SourceLogParser. It cannot wait for
+        room in the queue, so the event is dropped (and counted in
+        ``dropped``) if the queue is full. If no event loop is running the
+        event is queued and the worker is started by the next publish() or
+        join() call.
+
+        asyncio queues are not thread safe, so when called from another
+        thread (i.e. a LogPipeline executor thread) while the worker's loop
+        is running, the event is handed to the loop with
+        call_soon_threadsafe().
+
+        """
+        loop = self._loop
+        if (loop is not None and loop.is_running()
+                and _running_loop() is not loop):
+            loop.call_soon_threadsafe(self._put_nowait, event)
+        else:
+            self._put_nowait(event)
+
+    def _put_nowait(self, event):
+        if self._task is None and _running_loop() is not None:
+            self.start()
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def flush(self):
+        # events are never held back waiting for a full batch
+        return None
+
+    def start(self):
+        """Start the worker task if it is not running"""
+        if self._task is None:
+            self._loop = asyncio.get_event_loop()
+            self._task = asyncio.ensure_future(self._worker())
+
+    def cancel(self):
+        """Cancel the worker task"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _worker(self):
+        queue = self.queue
+        while True:
+            event = await queue.get()
+            count = 1
+            if self.batch_size is None:
+                arg = event
+            else:
+                arg = [event]
+                while count < self.batch_size and not queue.empty():
+                    arg.append(queue.get_nowait())
+                    count += 1
+            try:
+                result = self.handler(arg)
+                if inspect.isawaitable(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                for _ in range(count):
+                    queue.task_done()
+
+
+class AsyncEventBus(EventBus):
+
+    """asyncio event dispatch bus
+
+    Handlers may be plain callables or coroutine functions, and run in a
+    worker task per subscription. Publishing waits while any matching
+    subscriber's queue is full, which applies backpressure to the producer
+    (i.e. a log reader) instead of buffering without bound.
+
+    Handler exceptions do not stop the worker, the first exception raised by
+    each subscription is re-raised by join().
+
+    Worker tasks are started on the current event loop when the first
+    event is published to a subscription.
+
+    """
+
+    def subscribe(self, event_type, handler, batch_size=None,
+                  max_pending=1024):
+        """Subscribe handler to event_type and return the Subscription"""
+        subscription = AsyncSubscription(event_type, handler,
+                                         batch_size=batch_size,
+                                         max_pending=max_pending)
+        self._subscriptions.setdefault(event_type, []).append(subscription)
+        self._table.clear()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a Subscription and cancel its worker
+
+        Any events still queued for the subscription are discarded, await
+        join() first to deliver them.
+
+        """
+        subscription.cancel()
+        super(AsyncEventBus, self).unsubscribe(subscription)
+
+    def start(self):
+        """Start the worker tasks of all subscriptions on the current loop
+
+        Events dispatched from other threads are only handed to the loop
+        thread safely once the workers have been started.
+
+        """
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.start()
+
+    async def publish(self, event):
+        """Queue an event for all matching handlers
+
+        Waits until there is room in each matching subscriber's queue.
+
+        """
+        try:
+            subscriptions = self._table[type(event)]
+        except KeyError:
+            subscriptions = self.subscriptions_for(type(event))
+        for subscription in subscriptions:
+            if subscription._task is None:
+                subscription.start()
+            queue = subscription.queue
+            if queue.full():
+                await queue.put(event)
+            else:
+                queue.put_nowait(event)
+
+    async def publish_all(self, events):
+        """Queue all events from an iterable"""
+        publish = self.publish
+        for event in events:
+            await publish(event)
+
+    async def join(self):
+        """Wait until all queued events have been handled
+
+        Raises the first handler exception from any subscription.
+
+        """
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in subscriptions:
+                if not subscription.queue.empty():
+                    # events delivered while no event loop was running
+                    subscription.start()
+                await subscription.queue.join()
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                if subscription.error is not None:
+                    error = subscription.error
+                    subscription.error = None
+                    raise error
+
+    async def close(self):
+        """Deliver all queued events and stop all workers"""
+        try:
+            await self.join()
+        finally:
+            for subscriptions in self._subscriptions.values():
+                for subscription in subscriptions:
+                    subscription.cancel()
+
+
+# parsers used by _parse_batch in worker processes, by event types
+_worker_parsers = {}
+
+
+def _parse_batch(event_types, lines):
+    """Parse a batch of lines in a worker process
+
+    Returns (events, leftover) where leftover holds the lines of a
+    multi-line block which was not finished in this batch. Leftover lines
+    must be passed back in at the start of the next batch.
+
+    """
+    parser = _worker_parsers.get(event_types)
+    if parser is None:
+        parser = SourceLogParser(default_events=False)
+        parser.add_event_types(event_types)
+        _worker_parsers[event_types] = parser
+    parser.parse_lines(lines)
+    leftover = []
+    if parser._block is not None:
+        (cls, match, block_lines) = parser._block
+        leftover = [match.string] + block_lines
+        parser._block = None
+    events = list(parser.events)
+    parser.events.clear()
+    return (events, leftover)
+
+
+def _parse_with(parser, lines):
+    """Parse a batch of lines with parser and return the new events"""
+    (events, _) = parser.parse_lines(lines)
+    parser.events.clear()
+    return events
+
+
+class LogProtocol(asyncio.DatagramProtocol):
+
+    """UDP log protocol (logaddress_add) which feeds a LogPipeline
+
+    Packets are ``\\xff\\xff\\xff\\xffR`` followed by a log line, or
+    ``\\xff\\xff\\xff\\xffS`` followed by the sv_logsecret and a log line
+    when the server has a log secret set. If secret is set, packets without
+    the matching secret are dropped.
+
+    """
+
+    header = b'\xff\xff\xff\xff'
+
+    def __init__(self, pipeline, secret=None, encoding='utf-8'):
+        self.pipeline = pipeline
+        if secret is not None and not isinstance(secret, bytes):
+            secret = str(secret).encode('ascii')
+        self.secret = secret
+        self.encoding = encoding
+        self.rejected = 0
+
+    def datagram_received(self, data, addr):
+        if not data.startswith(self.header):
+            self.rejected += 1
+            return
+        kind = data[4:5]
+        body = data[5:]
+        if kind == b'S':
+            if self.secret is None or not body.startswith(self.secret):
+                self.rejected += 1
+                return
+            body = body[len(self.secret):]
+        elif kind != b'R' or self.secret is not None:
+            self.rejected += 1
+            return
+        line = body.rstrip(b'\x00\r\n').decode(self.encoding, 'replace')
+        self.pipeline.feed_nowait(line)
+
+
+class LogPipeline(object):
+
+    """asyncio log ingestion pipeline
+
+    Lines are fed in from asyncio streams, UDP log packets or files, parsed
+    in batches in an executor so that regex matching never blocks the event
+    loop, and the parsed events are read back out with ``async for``.
+
+    Batches are parsed one at a time and in order, so events come out in
+    log order and multi-line blocks are reassembled across batches. All
+    queues are bounded: once the consumer falls max_pending batches behind,
+    feed() waits, stream and file readers stop reading, and feed_nowait()
+    (used for UDP, which cannot be paused) drops lines and counts them in
+    ``dropped``.
+
+    Args:
+        parser: Optional SourceLogParser. Events are removed from
+            parser.events as they are passed on (an index or bus attached to
+            the parser still sees every event). An aio.AsyncEventBus
+            attached to the parser is started on the pipeline's event loop,
+            and events dispatched from the executor thread are passed to it
+            thread safely. A parser with the default event types is created
+            if not set.
+        executor: Optional concurrent.futures executor. By default a single
+            worker ThreadPoolExecutor is created and owned by the pipeline.
+            With a ProcessPoolExecutor, batches are parsed by a parser in
+            the worker process using the same event types, so parser index
+            and bus options are not applied.
+        batch_size: Maximum number of lines per parse batch.
+        max_pending: Maximum number of parsed batches (and of batch_size
+            line batches) which may be queued.
+
+    """
+
+    def __init__(self, parser=None, executor=None, batch_size=256,
+                 max_pending=16):
+        if parser is None:
+            parser = SourceLogParser()
+        self.parser = parser
+        self._owned = None
+        if executor is None:
+            executor = self._owned = ThreadPoolExecutor(1)
+        self.executor = executor
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._lines = asyncio.Queue(maxsize=batch_size * max_pending)
+        self._out = asyncio.Queue(maxsize=max_pending)
+        self._events = deque()
+        self._task = None
+        self._error = None
+        # set once _run has exited
+        self._finished = False
+        self._done = False
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        bus = getattr(self.parser, 'bus', None)
+        if isinstance(bus, AsyncEventBus):
+            bus.start()
+        lines = self._lines
+        process = isinstance(self.executor, ProcessPoolExecutor)
+        if process:
+            event_types = tuple(cls for (_, cls) in self.parser.events_types)
+        leftover = []
+        eof = False
+        try:
+            while not eof:
+                batch = leftover
+                line = await lines.get()
+                while True:
+                    if line is _EOF:
+                        eof = True
+                        break
+                    batch.append(line)
+                    if len(batch) >= self.batch_size or lines.empty():
+                        break
+                    line = lines.get_nowait()
+                if not batch:
+                    continue
+                if process:
+                    (events, leftover) = await loop.run_in_executor(
+                        self.executor, _parse_batch, event_types, batch)
+                else:
+                    leftover = []
+                    events = await loop.run_in_executor(
+                        self.executor, _parse_with, self.parser, batch)
+                if events:
+                    await self._out.put(events)
+        except Exception as e:
+            self._error = e
+        finally:
+            if self._owned is not None:
+                self._owned.shutdown(wait=False)
+            self._finished = True
+            # waiting here would block forever if the consumer has stopped
+            # reading, __anext__ also checks _finished once the queue is
+            # empty
+            try:
+                self._out.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    async def feed(self, line):
+        """Queue a log line, waiting while the pipeline is full"""
+        self._start()
+        await self._lines.put(line)
+
+    def feed_nowait(self, line):
+        """Queue a log line without waiting
+
+        Returns False (and counts the line in ``dropped``) if the pipeline
+        is full.
+
+        """
+        self._start()
+        try:
+            self._lines.put_nowait(line)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def feed_stream(self, reader, encoding='utf-8'):
+        """Feed lines from an asyncio.StreamReader until EOF"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await self.feed(line.decode(encoding, 'replace'))
+
+    async def feed_file(self, filename, encoding='utf-8', hint=65536):
+        """Feed lines from a log file
+
+        File reads are done in the default executor so the event loop is
+        not blocked by disk I/O.
+
+        """
+        loop = asyncio.get_event_loop()
+        fd = await loop.run_in_executor(
+            None, lambda: open(filename, encoding=encoding, errors='replace'))
+        try:
+            while True:
+                lines = await loop.run_in_executor(None, fd.readlines, hint)
+                if not lines:
+                    break
+                for line in lines:
+                    await self.feed(line)
+        finally:
+            fd.close()
+
+    async def listen_udp(self, host='0.0.0.0', port=27500, secret=None):
+        """Listen for UDP log packets
+
+        Returns the (transport, protocol) pair, close the transport to stop
+        listening.
+
+        """
+        self._start()
+        loop = asyncio.get_event_loop()
+        return await loop.create_datagram_endpoint(
+            lambda: LogProtocol(self, secret=secret), local_addr=(host, port))
+
+    async def close(self):
+        """Mark the end of input
+
+        Lines which have already been queued are still parsed, iteration
+        ends once all of their events have been read.
+
+        """
+        self._start()
+        await self._lines.put(_EOF)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        events = self._events
+        while not events:
+            if self._done:
+                raise StopAsyncIteration
+            self._start()
+            if self._finished and self._out.empty():
+                batch = None
+            else:
+                batch = await self._out.get()
+            if batch is None:
+                self._done = True
+                if self._error is not None:
+                    error = self._error
+                    self._error = None
+                    raise error
+                raise StopAsyncIteration
+            events.extend(batch)
+        return events.popleft()
+
+
+_EOF = object()
@@ -0,0 +1,266 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Log checkpoint module
+
+Allows a log reader to save its position in a log file along with any
+incremental aggregates (i.e. MatchState) so that parsing can be resumed
+after a restart without re-reading the whole file.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import json
+import os
+import tempfile
+import zlib
+
+
+# Number of bytes at the start of a file used to detect inode reuse
+HEAD_SIZE = 256
+
+
+class LogCheckpoint(object):
+
+    """Saved position in a log file
+
+    A file is identified by its device and inode numbers plus a checksum of
+    its first HEAD_SIZE bytes, so a rotated or truncated file is detected
+    even if the inode number is reused.
+
+    """
+
+    def __init__(self, filename, offset=0, device=None, inode=None,
+                 head_crc=None, head_size=0, aggregates=None):
+        self.filename = filename
+        self.offset = offset
+        self.device = device
+        self.inode = inode
+        self.head_crc = head_crc
+        self.head_size = head_size
+        if aggregates is None:
+            aggregates = {}
+        self.aggregates = aggregates
+
+    @classmethod
+    def _head_crc(cls, fd, size=HEAD_SIZE):
+        fd.seek(0)
+        head = fd.read(size)
+        return (zlib.crc32(head) & 0xffffffff, len(head))
+
+    def matches(self, fd):
+        """Return True if fd is the file this checkpoint was taken from"""
+        stat = os.fstat(fd.fileno())
+        if (stat.st_dev, stat.st_ino) != (self.device, self.inode):
+            return False
+        if stat.st_size < self.offset:
+            # truncated
+            return False
+        return self._head_crc(fd, self.head_size) == (self.head_crc,
+                                                      self.head_size)
+
+    def update(self, fd, offset):
+        """Update this checkpoint for an open file and byte offset"""
+        stat = os.fstat(fd.fileno())
+        if ((stat.st_dev, stat.st_ino) != (self.device, self.inode)
+                or self.head_size < HEAD_SIZE):
+            (self.device, self.inode) = (stat.st_dev, stat.st_ino)
+            pos = fd.tell()
+            (self.head_crc, self.head_size) = self._head_crc(fd)
+            fd.seek(pos)
+        self.offset = offset
+
+    def to_dict(self):
+        """Return a JSON serializable dict for this checkpoint"""
+        return {
+            'filename': self.filename,
+            'offset': self.offset,
+            'device': self.device,
+            'inode': self.inode,
+            'head_crc': self.head_crc,
+            'head_size': self.head_size,
+            'aggregates': self.aggregates,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return a checkpoint constructed from a to_dict() dict"""
+        return cls(**data)
+
+    def save(self, path, fsync=False):
+        """Atomically write this checkpoint to path
+
+        The checkpoint is written to a temporary file in the same directory
+        and then renamed over path, so readers never see a partial file.
+
+        Args:
+            fsync: If True, flush the checkpoint to disk before renaming it.
+                This is only needed to survive power loss, not process
+                crashes.
+
+        """
+        atomic_write(path, json.dumps(self.to_dict(), separators=(',', ':')),
+                     fsync=fsync)
+
+    @classmethod
+    def load(cls, path):
+        """Return the checkpoint saved at path, or None if it does not exist"""
+        try:
+            with open(path) as fobj:
+                return cls.from_dict(json.load(fobj))
+        except (IOError, OSError):
+            return None
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # Python 2, rename is atomic on POSIX
+        os.rename(src, dst)
+
+
+def atomic_write(path, data, fsync=False):
+    """Atomically replace the file at path with text data
+
+    The data is written to a temporary file in the same directory which is
+    then renamed over path, so readers never see a partial file.
+
+    Args:
+        fsync: If True, flush the data to disk before renaming the file.
+
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    (fd, tmp_path) = tempfile.mkstemp(
+        dir=dirname, prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as fobj:
+            fobj.write(data)
+            if fsync:
+                fobj.flush()
+                os.fsync(fobj.fileno())
+        _replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class CheckpointedReader(object):
+
+    """Incremental log reader which can be checkpointed and resumed
+
+    Each call to poll() parses only the lines appended since the last call,
+    so resuming from a checkpoint is O(new lines). Aggregates are objects
+    with ``update(event)`` and ``snapshot()`` methods and a ``restore()``
+    classmethod (i.e. MatchState). They are fed every new event and their
+    snapshots are saved with the checkpoint.
+
+    Args:
+        parser: The SourceLogParser used to parse new lines.
+        filename: Log file path.
+        aggregates: Optional dict of name -> aggregate object.
+        checkpoint: Optional LogCheckpoint to resume from.
+
+    """
+
+    def __init__(self, parser, filename, aggregates=None, checkpoint=None):
+        self.parser = parser
+        self.filename = filename
+        if aggregates is None:
+            aggregates = {}
+        self.aggregates = aggregates
+        self.offset = 0
+        self._fd = None
+        if checkpoint is None:
+            checkpoint = LogCheckpoint(filename)
+        else:
+            for (name, snapshot) in checkpoint.aggregates.items():
+                if name in self.aggregates:
+                    cls = type(self.aggregates[name])
+                    self.aggregates[name] = cls.restore(snapshot)
+        self.checkpoint = checkpoint
+
+    @classmethod
+    def resume(cls, parser, filename, path, aggregates=None):
+        """Return a reader resumed from the checkpoint saved at path"""
+        return cls(parser, filename, aggregates=aggregates,
+                   checkpoint=LogCheckpoint.load(path))
+
+    def _open(self):
+        fd = open(self.filename, 'rb')
+        if (self._fd is None and self.checkpoint.inode is not None
+                and self.checkpoint.matches(fd)):
+            # first open after resuming
+            self.offset = self.checkpoint.offset
+        else:
+            if self._fd is not None:
+                self._fd.close()
+            # a new or different file (even with a reused inode), force the
+            # file identity to be recomputed
+            self.checkpoint.head_size = 0
+        self.checkpoint.offset = self.offset
+        self._fd = fd
+        self._fd.seek(self.offset)
+
+    def _rotated(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        current = os.fstat(self._fd.fileno())
+        return ((stat.st_dev, stat.st_ino) != (current.st_dev, current.st_ino)
+                or stat.st_size < self.offset)
+
+    def poll(self):
+        """Parse any new complete lines and return the number of new events
+
+        Rotation (a new file at the same path) and truncation restart
+        reading from the start of the file. Aggregates are kept.
+
+        """
+        if self._fd is None:
+            self._open()
+        elif self._rotated():
+            self.offset = 0
+            self._open()
+        parser = self.parser
+        events = parser.events
+        updates = [agg.update for agg in self.aggregates.values()]
+        count = 0
+        fd = self._fd
+        fd.seek(self.offset)
+        for line in fd:
+            if not line.endswith(b'\n'):
+                # partial line, wait for the rest of it
+                break
+            self.offset += len(line)
+            before = len(events)
+            parser.parse_line(line.decode('utf-8', 'replace'))
+            if len(events) > before:
+                count += 1
+                event = events[-1]
+                for update in updates:
+                    update(event)
+            if not parser.in_block:
+                self.checkpoint.offset = self.offset
+        self.checkpoint.update(fd, self.checkpoint.offset)
+        fd.seek(self.offset)
+        return count
+
+    def save(self, path, fsync=False):
+        """Save a checkpoint for the last fully parsed position
+
+        If a multi-line block is still being read, the checkpoint points to
+        the start of the block so that it is read again on resume.
+
+        """
+        self.checkpoint.filename = self.filename
+        self.checkpoint.aggregates = dict(
+            (name, agg.snapshot()) for (name, agg) in self.aggregates.items())
+        self.checkpoint.save(path, fsync=fsync)
+
+    def close(self):
+        """Close the log file"""
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
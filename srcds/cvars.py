@@ -0,0 +1,161 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Server cvar module
+
+Snapshots, diffs and applies server cvars over RCON using as few commands
+as possible.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import re
+
+
+# Maximum RCON command length, RCON packets are limited to 4096 bytes
+# including 10 bytes of header and terminators
+MAX_COMMAND_SIZE = 4086
+
+_CVAR_VALUE_RE = re.compile(r'^"(?P<name>[^"]+)" = "(?P<value>[^"]*)"',
+                            re.M | re.U)
+
+
+def batch_commands(commands, max_size=MAX_COMMAND_SIZE):
+    """Yield commands joined with ';' into batches of up to max_size bytes
+
+    Raises ValueError if a single command is longer than max_size.
+
+    """
+    batch = []
+    size = 0
+    for command in commands:
+        length = len(command.encode('utf-8'))
+        if length > max_size:
+            raise ValueError('Command too long: %s' % command)
+        # + 1 for the ';' separator
+        if batch and size + 1 + length > max_size:
+            yield ';'.join(batch)
+            batch = []
+            size = 0
+        if batch:
+            size += 1
+        batch.append(command)
+        size += length
+    if batch:
+        yield ';'.join(batch)
+
+
+def _text(body):
+    if isinstance(body, bytes):
+        return body.decode('utf-8', 'replace')
+    return body
+
+
+def parse_cvar_values(text):
+    """Parse cvar query responses (``"name" = "value" ...``) into a dict"""
+    return dict((m.group('name'), m.group('value'))
+                for m in _CVAR_VALUE_RE.finditer(_text(text)))
+
+
+def parse_cvarlist(text):
+    """Parse cvarlist output into a dict of cvar name to value
+
+    Console commands (listed with a value of ``cmd``) are skipped.
+
+    """
+    cvars = {}
+    for line in _text(text).splitlines():
+        parts = line.split(' : ', 2)
+        if len(parts) < 2:
+            continue
+        name = parts[0].strip()
+        value = parts[1].strip()
+        if not name or ' ' in name or value == 'cmd':
+            continue
+        cvars[name] = value
+    return cvars
+
+
+def fetch_cvars(conn, names, max_size=MAX_COMMAND_SIZE):
+    """Return a snapshot dict of the values of the named cvars
+
+    Cvar queries are batched into as few RCON commands as possible, so
+    hundreds of cvars are fetched in a handful of round trips. Unknown cvars
+    are left out of the snapshot.
+
+    Args:
+        conn: An RconConnection.
+        names: Iterable of cvar names.
+        max_size: Maximum command length.
+
+    """
+    names = list(names)
+    wanted = set(names)
+    cvars = {}
+    for command in batch_commands(names, max_size):
+        for (name, value) in parse_cvar_values(
+                conn.exec_command(command)).items():
+            if name in wanted:
+                cvars[name] = value
+    return cvars
+
+
+def fetch_all_cvars(conn):
+    """Return a snapshot dict of all cvars using a single cvarlist command"""
+    return parse_cvarlist(conn.exec_command('cvarlist'))
+
+
+def diff_cvars(old, new):
+    """Return the differences between two cvar snapshots
+
+    Returns:
+        A dict of cvar name to (old value, new value) for every cvar which
+        changed. Cvars missing from one snapshot have a value of None.
+
+    """
+    diff = {}
+    for (name, value) in new.items():
+        old_value = old.get(name)
+        if old_value != value:
+            diff[name] = (old_value, value)
+    for (name, value) in old.items():
+        if name not in new:
+            diff[name] = (value, None)
+    return diff
+
+
+def _set_command(name, value):
+    value = '%s' % value
+    if '"' in value or ';' in value or '\n' in value:
+        raise ValueError('Cannot set cvar %s to %r' % (name, value))
+    return '%s "%s"' % (name, value)
+
+
+def apply_cvars(conn, cvars, current=None, max_size=MAX_COMMAND_SIZE):
+    """Set cvars which differ from their current values
+
+    Only changed cvars are sent, batched into as few RCON commands as
+    possible.
+
+    Args:
+        conn: An RconConnection.
+        cvars: Dict of cvar name to desired value.
+        current: Optional snapshot of the current values. If not set, the
+            current values of the cvars are fetched first.
+        max_size: Maximum command length.
+
+    Returns:
+        A dict of cvar name to (old value, new value) for the cvars which
+        were set.
+
+    """
+    if current is None:
+        current = fetch_cvars(conn, cvars, max_size)
+    changed = dict((name, (current.get(name), '%s' % value))
+                   for (name, value) in cvars.items()
+                   if current.get(name) != '%s' % value)
+    commands = [_set_command(name, value)
+                for (name, (_, value)) in sorted(changed.items())]
+    for command in batch_commands(commands, max_size):
+        conn.exec_command(command)
+    return changed
@@ -0,0 +1,125 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Event dispatch module
+
+Lets many independent consumers subscribe to parsed events by event class
+instead of polling SourceLogParser.events and branching on isinstance.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+
+class Subscription(object):
+
+    """A handler subscribed to an event class
+
+    Args:
+        event_type: Event class. Events of any subclass are also delivered.
+        handler: Callable which takes a single event, or a list of events
+            if batch_size is set.
+        batch_size: Optional number of events to collect before calling
+            handler with a list of events.
+
+    """
+
+    def __init__(self, event_type, handler, batch_size=None):
+        self.event_type = event_type
+        self.handler = handler
+        self.batch_size = batch_size
+        self.pending = []
+
+    def deliver(self, event):
+        """Deliver a single event to the handler"""
+        if self.batch_size is None:
+            return self.handler(event)
+        self.pending.append(event)
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+
+    def flush(self):
+        """Deliver any pending batched events"""
+        if not self.pending:
+            return None
+        batch = self.pending
+        self.pending = []
+        return self.handler(batch)
+
+
+class EventBus(object):
+
+    """Event dispatch bus
+
+    Handlers subscribe to an event class and receive events of that class
+    and all of its subclasses, i.e. a PlayerTargetEvent subscriber receives
+    KillEvents and CsgoKillEvents.
+
+    The subscriptions for each concrete event class are computed once from
+    the class MRO and cached in a lookup table, so dispatching an event is
+    a single dict lookup no matter how many handlers are subscribed. The
+    table is rebuilt lazily when subscriptions change.
+
+    Handlers are called in MRO order (most specific class first) and then in
+    subscription order.
+
+    """
+
+    def __init__(self):
+        # event_type -> [Subscription]
+        self._subscriptions = {}
+        # concrete event class -> tuple of Subscriptions
+        self._table = {}
+
+    def subscribe(self, event_type, handler, batch_size=None):
+        """Subscribe handler to event_type and return the Subscription"""
+        subscription = Subscription(event_type, handler,
+                                    batch_size=batch_size)
+        self._subscriptions.setdefault(event_type, []).append(subscription)
+        self._table.clear()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a Subscription, flushing any pending batched events"""
+        subscription.flush()
+        self._subscriptions[subscription.event_type].remove(subscription)
+        self._table.clear()
+
+    def subscriptions_for(self, event_class):
+        """Return the tuple of Subscriptions for a concrete event class"""
+        try:
+            return self._table[event_class]
+        except KeyError:
+            subscriptions = []
+            for klass in event_class.__mro__:
+                subscriptions.extend(self._subscriptions.get(klass, ()))
+            subscriptions = tuple(subscriptions)
+            self._table[event_class] = subscriptions
+            return subscriptions
+
+    def dispatch(self, event):
+        """Deliver an event to all matching handlers"""
+        try:
+            subscriptions = self._table[type(event)]
+        except KeyError:
+            subscriptions = self.subscriptions_for(type(event))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def dispatch_all(self, events):
+        """Deliver all events from an iterable, then flush batches"""
+        table = self._table
+        lookup = self.subscriptions_for
+        for event in events:
+            event_class = type(event)
+            subscriptions = table.get(event_class)
+            if subscriptions is None:
+                subscriptions = lookup(event_class)
+            for subscription in subscriptions:
+                subscription.deliver(event)
+        self.flush()
+
+    def flush(self):
+        """Deliver any pending batched events"""
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.flush()
@@ -1 +1,17 @@
-"""pysrcds events package"""
+"""pysrcds events package
+
+Event modules are only imported when they are first used, i.e. on
+``from srcds.events import csgo`` or on access to ``srcds.events.csgo``
+(Python 3.7+).
+
+"""
+
+import importlib
+
+_modules = ('binary', 'csgo', 'generic')
+
+
+def __getattr__(name):
+    if name in _modules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,567 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Binary event serialization module
+
+Compact binary format for parsed events which can be reloaded much faster
+than re-parsing text logs.
+
+A file starts with MAGIC (which ends with a format version byte) followed by
+a stream of records. Each record starts
+with a varint tag:
+
+    0: string definition (varint length + UTF-8 bytes). Strings are
+       numbered in the order they are defined and referenced by number.
+    1: event type definition (varint string number of the qualified class
+       name, varint attribute count, attribute name string numbers). Types
+       are numbered in the order they are defined.
+    n >= 2: event of type n - 2, followed by one value per attribute.
+
+Each value starts with a kind byte (see the KIND_* constants). Integers are
+zigzag varints and strings (player names, weapons, etc) are string table
+references. Timestamps are epoch seconds, the first one is stored in full and
+later ones as the difference from the previous timestamp. SteamIds are
+SteamID64 integers (with a kind per SteamId.id_format), stored in full on
+first use and then referenced by number like strings. Players are stored in
+full (name, uid, SteamId and team) on first use and then referenced by
+number.
+
+Events are rebuilt by setting their attributes directly rather than by
+calling their constructors, which is what makes loading fast. Since strings
+and types are defined inline before their first use, files can be written
+as a stream and read back in a single pass, either from a file object or
+directly from a memory map.
+
+Only event classes registered with register_event_type() can be loaded (the
+standard and CS:GO events are registered), type names read from a file are
+never imported.
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import gc
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timedelta
+
+from . import csgo, generic
+from ..objects import BasePlayer, SteamId
+
+
+# Version 2 added the KIND_STEAM_ID3 and KIND_STEAM_ID64 kinds, version 1
+# files are a subset of version 2 and can still be read
+MAGIC = b'SRCDSEV\x02'
+_READ_VERSIONS = (1, 2)
+
+TAG_STRING = 0
+TAG_TYPE = 1
+TAG_EVENT = 2
+
+# kinds without a varint payload
+KIND_NONE = 0
+KIND_FALSE = 1
+KIND_TRUE = 2
+KIND_BOT = 3
+KIND_CONSOLE = 4
+KIND_FLOAT = 5
+# kinds followed by a varint
+KIND_INT = 6
+KIND_STR = 7
+KIND_TUPLE = 8
+KIND_LIST = 9
+KIND_DICT = 10
+KIND_TIMESTAMP = 11
+KIND_TIMESTAMP_DELTA = 12
+KIND_STEAM_ID = 13
+KIND_STEAM_ID_REF = 14
+KIND_PLAYER = 15
+KIND_PLAYER_REF = 16
+KIND_STEAM_ID3 = 17
+KIND_STEAM_ID64 = 18
+
+# SteamId kinds by SteamId.id_format
+_STEAM_ID_KINDS = {
+    'steam2': KIND_STEAM_ID,
+    'steam3': KIND_STEAM_ID3,
+    'id64': KIND_STEAM_ID64,
+}
+
+_PY2 = sys.version_info[0] == 2
+_EPOCH = datetime(1970, 1, 1)
+_DOUBLE = struct.Struct('<d')
+_BOT = SteamId('BOT')
+_CONSOLE = SteamId('Console')
+
+try:
+    _integer_types = (int, long)
+    _string_types = (str, unicode)
+except NameError:
+    _integer_types = (int,)
+    _string_types = (str,)
+
+# qualified name -> event class
+_registry = {}
+
+
+def _qualname(cls):
+    return '%s:%s' % (cls.__module__, cls.__name__)
+
+
+def register_event_type(cls):
+    """Register an event class so that it can be loaded by name"""
+    _registry[_qualname(cls)] = cls
+    return cls
+
+
+for _cls in [generic.BaseEvent] + generic.STANDARD_EVENTS + csgo.CSGO_EVENTS:
+    register_event_type(_cls)
+
+
+def _write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (result, pos)
+        shift += 7
+
+
+class BinaryEventWriter(object):
+
+    """Stream writer for the binary event format
+
+    Args:
+        fileobj: A file object opened in binary mode.
+        buffer_size: Encoded records are buffered and written in chunks of
+            at least this many bytes.
+
+    """
+
+    def __init__(self, fileobj, buffer_size=65536):
+        self._fileobj = fileobj
+        self.buffer_size = buffer_size
+        self._buf = bytearray(MAGIC)
+        # the event record being encoded and the string and type definitions
+        # it needs, both are only added to _buf once the whole event has
+        # been encoded
+        self._rec = bytearray()
+        self._defs = bytearray()
+        # (table, key) for refs defined by the record being encoded
+        self._added = []
+        self._strings = {}
+        self._steam_ids = {}
+        self._players = {}
+        self._last_seconds = None
+        # (cls, attribute names) -> tag
+        self._types = {}
+
+    def _string(self, value):
+        try:
+            return self._strings[value]
+        except KeyError:
+            ref = len(self._strings)
+            self._strings[value] = ref
+            self._added.append((self._strings, value))
+            data = value.encode('utf-8')
+            buf = self._defs
+            buf.append(TAG_STRING)
+            _write_varint(buf, len(data))
+            buf.extend(data)
+            return ref
+
+    def _type(self, cls, attrs):
+        try:
+            return self._types[(cls, attrs)]
+        except KeyError:
+            refs = [self._string(attr) for attr in attrs]
+            name_ref = self._string(_qualname(cls))
+            buf = self._defs
+            buf.append(TAG_TYPE)
+            _write_varint(buf, name_ref)
+            _write_varint(buf, len(refs))
+            for ref in refs:
+                _write_varint(buf, ref)
+            tag = TAG_EVENT + len(self._types)
+            self._types[(cls, attrs)] = tag
+            self._added.append((self._types, (cls, attrs)))
+            return tag
+
+    def _value(self, value):
+        buf = self._rec
+        if isinstance(value, _string_types):
+            ref = self._string(value)
+            buf.append(KIND_STR)
+            _write_varint(buf, ref)
+        elif value is None:
+            buf.append(KIND_NONE)
+        elif value is True:
+            buf.append(KIND_TRUE)
+        elif value is False:
+            buf.append(KIND_FALSE)
+        elif isinstance(value, _integer_types):
+            buf.append(KIND_INT)
+            _write_varint(buf, (value << 1) ^ (value >> 63))
+        elif isinstance(value, BasePlayer):
+            steam_id = value.steam_id
+            key = (value.name, value.uid, steam_id.id64(), steam_id.id_format,
+                   steam_id.is_bot, steam_id.is_console, value.team)
+            ref = self._players.get(key)
+            if ref is None:
+                self._players[key] = len(self._players)
+                self._added.append((self._players, key))
+                buf.append(KIND_PLAYER)
+                _write_varint(buf, self._string(value.name))
+                _write_varint(buf, value.uid)
+                self._value(steam_id)
+                self._value(value.team)
+            else:
+                buf.append(KIND_PLAYER_REF)
+                _write_varint(buf, ref)
+        elif isinstance(value, datetime):
+            delta = value - _EPOCH
+            seconds = delta.days * 86400 + delta.seconds
+            if self._last_seconds is None:
+                buf.append(KIND_TIMESTAMP)
+                diff = seconds
+            else:
+                buf.append(KIND_TIMESTAMP_DELTA)
+                diff = seconds - self._last_seconds
+            self._last_seconds = seconds
+            _write_varint(buf, (diff << 1) ^ (diff >> 63))
+        elif isinstance(value, SteamId):
+            if value.is_bot:
+                buf.append(KIND_BOT)
+            elif value.is_console:
+                buf.append(KIND_CONSOLE)
+            else:
+                id64 = value.id64()
+                key = (id64, value.id_format)
+                ref = self._steam_ids.get(key)
+                if ref is None:
+                    self._steam_ids[key] = len(self._steam_ids)
+                    self._added.append((self._steam_ids, key))
+                    buf.append(_STEAM_ID_KINDS.get(value.id_format,
+                                                   KIND_STEAM_ID))
+                    _write_varint(buf, id64)
+                else:
+                    buf.append(KIND_STEAM_ID_REF)
+                    _write_varint(buf, ref)
+        elif isinstance(value, float):
+            buf.append(KIND_FLOAT)
+            buf.extend(_DOUBLE.pack(value))
+        elif isinstance(value, (tuple, list)):
+            buf.append(KIND_TUPLE if isinstance(value, tuple) else KIND_LIST)
+            _write_varint(buf, len(value))
+            for item in value:
+                self._value(item)
+        elif isinstance(value, dict):
+            buf.append(KIND_DICT)
+            _write_varint(buf, len(value))
+            for (key, item) in value.items():
+                self._value(key)
+                self._value(item)
+        else:
+            raise TypeError('Cannot serialize %r' % value)
+
+    def write(self, event):
+        """Encode a single event
+
+        Raises TypeError if an attribute value cannot be serialized, in
+        which case nothing is written and the writer can still be used.
+
+        """
+        attrs = event.__dict__
+        rec = self._rec
+        last_seconds = self._last_seconds
+        try:
+            _write_varint(rec, self._type(type(event), tuple(attrs)))
+            value = self._value
+            for item in attrs.values():
+                value(item)
+        except Exception:
+            # forget the refs defined by the partial record
+            for (table, key) in self._added:
+                del table[key]
+            del self._defs[:]
+            del rec[:]
+            self._last_seconds = last_seconds
+            raise
+        finally:
+            del self._added[:]
+        if self._defs:
+            self._buf.extend(self._defs)
+            del self._defs[:]
+        self._buf.extend(rec)
+        del rec[:]
+        if len(self._buf) >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, events):
+        """Encode all events from an iterable"""
+        write = self.write
+        for event in events:
+            write(event)
+        self.flush()
+
+    def flush(self):
+        """Write any buffered records to the file object"""
+        if self._buf:
+            self._fileobj.write(bytes(self._buf))
+            del self._buf[:]
+
+
+def _resolve_type(name):
+    # Only registered classes are loaded, importing and instantiating
+    # arbitrary classes named by a file would be as unsafe as pickle.
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError('Unknown event type %s, it must be registered '
+                         'with register_event_type()' % name)
+
+
+def iter_events(data):
+    """Yield events decoded from a bytes-like object or memory map
+
+    Raises ValueError if the data is not a valid binary event file.
+
+    """
+    if _PY2:
+        data = bytearray(data)
+    if len(data) < len(MAGIC) or data[:len(MAGIC) - 1] != MAGIC[:-1]:
+        raise ValueError('Not a binary event file')
+    if data[len(MAGIC) - 1] not in _READ_VERSIONS:
+        raise ValueError('Unsupported binary event file version %d'
+                         % data[len(MAGIC) - 1])
+    strings = []
+    types = []
+    steam_ids = []
+    # player attribute dicts, each player gets its own copy
+    players = []
+    timestamps = {}
+    # [seconds] of the last timestamp, a list so read_value can update it
+    last_seconds = [0]
+    end = len(data)
+    pos = len(MAGIC)
+    read_varint = _read_varint
+    new = object.__new__
+    player_cls = BasePlayer
+    # constants as locals, global lookups are slow in the decode loop
+    k_int = KIND_INT
+    k_str = KIND_STR
+    k_player_ref = KIND_PLAYER_REF
+    k_timestamp_delta = KIND_TIMESTAMP_DELTA
+    k_steam_id_ref = KIND_STEAM_ID_REF
+    k_timestamp = KIND_TIMESTAMP
+    k_player = KIND_PLAYER
+    k_tuple = KIND_TUPLE
+    k_list = KIND_LIST
+    k_steam_id = KIND_STEAM_ID
+    k_dict = KIND_DICT
+    t_event = TAG_EVENT
+    t_string = TAG_STRING
+    t_type = TAG_TYPE
+
+    # Single byte varints are decoded inline, read_varint is only called
+    # for larger values.
+    def read_value(pos):
+        kind = data[pos]
+        if kind < k_int:
+            pos += 1
+            if kind == KIND_NONE:
+                return (None, pos)
+            elif kind == KIND_TRUE:
+                return (True, pos)
+            elif kind == KIND_FALSE:
+                return (False, pos)
+            elif kind == KIND_BOT:
+                return (_BOT, pos)
+            elif kind == KIND_CONSOLE:
+                return (_CONSOLE, pos)
+            return (_DOUBLE.unpack_from(data, pos)[0], pos + 8)
+        value = data[pos + 1]
+        if value < 0x80:
+            pos += 2
+        else:
+            (value, pos) = read_varint(data, pos + 1)
+        if kind == k_str:
+            return (strings[value], pos)
+        elif kind == k_player_ref:
+            player = new(player_cls)
+            player.__dict__ = players[value].copy()
+            return (player, pos)
+        elif kind == k_steam_id_ref:
+            return (steam_ids[value], pos)
+        elif kind == k_int:
+            return ((value >> 1) ^ -(value & 1), pos)
+        elif kind == k_timestamp_delta or kind == k_timestamp:
+            seconds = (value >> 1) ^ -(value & 1)
+            if kind == k_timestamp_delta:
+                seconds += last_seconds[0]
+            last_seconds[0] = seconds
+            try:
+                return (timestamps[seconds], pos)
+            except KeyError:
+                timestamp = _EPOCH + timedelta(seconds=seconds)
+                timestamps[seconds] = timestamp
+                return (timestamp, pos)
+        elif kind == k_player:
+            # value is the name string number
+            uid = data[pos]
+            if uid < 0x80:
+                pos += 1
+            else:
+                (uid, pos) = read_varint(data, pos)
+            (steam_id, pos) = read_value(pos)
+            (team, pos) = read_value(pos)
+            attrs = {'name': strings[value], 'uid': uid,
+                     'steam_id': steam_id, 'team': team}
+            players.append(attrs)
+            player = new(player_cls)
+            player.__dict__ = attrs.copy()
+            return (player, pos)
+        elif kind == k_tuple or kind == k_list:
+            items = []
+            for _ in range(value):
+                if data[pos] == k_int:
+                    # inline ints up to two bytes, i.e. locations
+                    item = data[pos + 1]
+                    if item < 0x80:
+                        items.append((item >> 1) ^ -(item & 1))
+                        pos += 2
+                        continue
+                    elif data[pos + 2] < 0x80:
+                        item = (item & 0x7f) | (data[pos + 2] << 7)
+                        items.append((item >> 1) ^ -(item & 1))
+                        pos += 3
+                        continue
+                (item, pos) = read_value(pos)
+                items.append(item)
+            return (tuple(items) if kind == k_tuple else items, pos)
+        elif kind == k_steam_id:
+            steam_id = SteamId(value)
+            steam_ids.append(steam_id)
+            return (steam_id, pos)
+        elif kind == KIND_STEAM_ID3 or kind == KIND_STEAM_ID64:
+            steam_id = SteamId(value, id_format=(
+                'steam3' if kind == KIND_STEAM_ID3 else 'id64'))
+            steam_ids.append(steam_id)
+            return (steam_id, pos)
+        elif kind == k_dict:
+            items = {}
+            for _ in range(value):
+                (key, pos) = read_value(pos)
+                (items[key], pos) = read_value(pos)
+            return (items, pos)
+        raise ValueError('Invalid value kind %d' % kind)
+
+    try:
+        while pos < end:
+            tag = data[pos]
+            if tag < 0x80:
+                pos += 1
+            else:
+                (tag, pos) = read_varint(data, pos)
+            if tag >= t_event:
+                (cls, attrs) = types[tag - t_event]
+                attr_values = {}
+                for attr in attrs:
+                    # decode the most common one and two byte values inline
+                    kind = data[pos]
+                    if kind >= k_int:
+                        value = data[pos + 1]
+                        if value < 0x80:
+                            npos = pos + 2
+                        elif data[pos + 2] < 0x80:
+                            value = (value & 0x7f) | (data[pos + 2] << 7)
+                            npos = pos + 3
+                        else:
+                            kind = None
+                        if kind == k_str:
+                            attr_values[attr] = strings[value]
+                            pos = npos
+                            continue
+                        elif kind == k_player_ref:
+                            player = new(player_cls)
+                            player.__dict__ = players[value].copy()
+                            attr_values[attr] = player
+                            pos = npos
+                            continue
+                        elif kind == k_timestamp_delta:
+                            seconds = last_seconds[0] + ((value >> 1) ^
+                                                         -(value & 1))
+                            if seconds in timestamps:
+                                last_seconds[0] = seconds
+                                attr_values[attr] = timestamps[seconds]
+                                pos = npos
+                                continue
+                        elif kind == k_int:
+                            attr_values[attr] = (value >> 1) ^ -(value & 1)
+                            pos = npos
+                            continue
+                    (attr_values[attr], pos) = read_value(pos)
+                event = new(cls)
+                event.__dict__ = attr_values
+                yield event
+            elif tag == t_string:
+                (length, pos) = read_varint(data, pos)
+                if pos + length > end:
+                    raise IndexError(pos + length)
+                strings.append(bytes(data[pos:pos + length]).decode('utf-8'))
+                pos += length
+            elif tag == t_type:
+                (name_ref, pos) = read_varint(data, pos)
+                (count, pos) = read_varint(data, pos)
+                attrs = []
+                for _ in range(count):
+                    (ref, pos) = read_varint(data, pos)
+                    attrs.append(strings[ref])
+                types.append((_resolve_type(strings[name_ref]), attrs))
+            else:
+                raise ValueError('Invalid record tag %d at offset %d'
+                                 % (tag, pos))
+    except (IndexError, struct.error):
+        raise ValueError('Truncated binary event file')
+
+
+def dump(events, fileobj):
+    """Write events to a binary mode file object"""
+    BinaryEventWriter(fileobj).write_all(events)
+
+
+def load(filename):
+    """Return a list of events read from a binary event file
+
+    The file is memory mapped rather than read into memory. Raises
+    ValueError if the file is not a valid binary event file.
+
+    """
+    with open(filename, 'rb') as fobj:
+        if os.fstat(fobj.fileno()).st_size < len(MAGIC):
+            raise ValueError('Not a binary event file')
+        mapped = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        # indexing a memoryview is faster than indexing the mmap directly
+        view = mapped if _PY2 else memoryview(mapped)
+        # the decoded events hold no reference cycles, so the cyclic garbage
+        # collector would only slow down allocating them
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(iter_events(view))
+        finally:
+            if gc_enabled:
+                gc.enable()
+            if view is not mapped:
+                view.release()
+            mapped.close()
@@ -6,8 +6,11 @@ Contains event classes for CS:S and CS:GO events
 """
 
 from __future__ import absolute_import, unicode_literals
-from future.utils import python_2_unicode_compatible
+from .._compat import python_2_unicode_compatible
 
+import re
+
+from ..objects import SteamId
 from .generic import (BaseEvent, PlayerEvent, PlayerTargetEvent, KillEvent,
                       AttackEvent)
 
@@ -19,7 +22,7 @@ class SwitchTeamEvent(PlayerEvent):
 
     regex = ''.join([
         BaseEvent.regex,
-        r'"(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:]*)>" ',
+        r'"(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:\[\]]*)>" ',
         r'switched from team <(?P<orig_team>\w*)> to <(?P<new_team>\w*)>',
     ])
 
@@ -276,6 +279,180 @@ class CsgoAttackEvent(AttackEvent):
         return cls(**kwargs)
 
 
+@python_2_unicode_compatible
+class RoundStatsEvent(BaseEvent):
+
+    """CS:GO JSON round statistics event
+
+    Round stats are logged as a multi-line ``JSON_BEGIN{ ... }}JSON_END``
+    block. ``regex`` matches the opening line of the block, the parser then
+    collects the remaining lines and builds the event with ``from_block``.
+
+    Player rows are stored as tuples of numbers in the order given by
+    ``fields``, so a single stat can be read without building a dict for
+    every player.
+
+    """
+
+    regex = ''.join([
+        BaseEvent.regex,
+        r'JSON_BEGIN\{$',
+    ])
+    block_end = '}}JSON_END'
+
+    item_regex = re.compile(
+        r'"(?P<key>\w+)"\s*:\s*(?:"(?P<value>[^"]*)"|\{)\s*,?$', re.U)
+
+    # SteamID64 of account ID 0 in the public universe
+    ACCOUNT_ID64_BASE = 76561197960265728
+
+    def __init__(self, timestamp, round_number, score_t, score_ct, mapname,
+                 server='', fields=(), players=(), name='round_stats'):
+        super(RoundStatsEvent, self).__init__(timestamp)
+        self.name = name
+        self.round_number = int(round_number)
+        self.score_t = int(score_t)
+        self.score_ct = int(score_ct)
+        self.mapname = mapname
+        self.server = server
+        self.fields = tuple(fields)
+        self.players = tuple(tuple(row) for row in players)
+        self._columns = dict((field, i) for (i, field) in
+                             enumerate(self.fields))
+        self._rows = None
+
+    def text(self):
+        prefix = 'L %s: ' % (self.timestamp_to_str(self.timestamp))
+        lines = [
+            'JSON_BEGIN{',
+            '"name" : "%s",' % (self.name),
+            '"round_number" : "%d",' % (self.round_number),
+            '"score_t" : "%d",' % (self.score_t),
+            '"score_ct" : "%d",' % (self.score_ct),
+            '"map" : "%s",' % (self.mapname),
+            '"server" : "%s",' % (self.server),
+            '"fields" : "%s",' % (', '.join(self.fields)),
+            '"players" : {',
+        ]
+        for (i, row) in enumerate(self.players):
+            lines.append('"player_%d" : "%s"%s' % (
+                i, ', '.join(self._format_value(v) for v in row),
+                ',' if i < len(self.players) - 1 else ''))
+        lines.append(self.block_end)
+        return '\n'.join([prefix + line for line in lines])
+
+    __str__ = text
+
+    @classmethod
+    def _format_value(cls, value):
+        if isinstance(value, float):
+            return '%.2f' % value
+        return '%d' % value
+
+    @classmethod
+    def _parse_value(cls, value):
+        value = value.strip()
+        if '.' in value:
+            return float(value)
+        return int(value)
+
+    @classmethod
+    def from_re_match(cls, match):
+        """Return an event constructed from a self.regex match"""
+        raise ValueError('RoundStatsEvent must be constructed from a block')
+
+    @classmethod
+    def from_block(cls, match, lines):
+        """Return an event constructed from a JSON block
+
+        Args:
+            match: The self.regex match for the opening block line.
+            lines: The remaining block lines with their timestamp prefixes
+                removed, not including the closing line.
+
+        """
+        kwargs = {'timestamp': match.group('timestamp')}
+        players = []
+        for line in lines:
+            item = cls.item_regex.match(line.strip())
+            if not item or item.group('value') is None:
+                continue
+            (key, value) = (item.group('key'), item.group('value'))
+            if key == 'fields':
+                kwargs['fields'] = [f.strip() for f in value.split(',')]
+            elif key.startswith('player_'):
+                players.append(tuple(cls._parse_value(v)
+                                     for v in value.split(',')))
+            elif key == 'map':
+                kwargs['mapname'] = value
+            elif key in ('name', 'round_number', 'score_t', 'score_ct',
+                         'server'):
+                kwargs[key] = value
+        kwargs['players'] = players
+        return cls(**kwargs)
+
+    def _row_index(self):
+        if self._rows is None:
+            # bots all have account ID 0, so they are not indexed
+            col = self._columns.get('accountid', 0)
+            self._rows = dict((row[col], row) for row in self.players
+                              if row[col])
+        return self._rows
+
+    def column(self, field):
+        """Return a list of values for field, one per player row"""
+        col = self._columns[field]
+        return [row[col] for row in self.players]
+
+    def player_row(self, steam_id):
+        """Return the stats row for the given player
+
+        Args:
+            steam_id: A SteamId, a SteamID64 integer or a 32-bit account ID.
+
+        Returns None if the player is not present in this round. Bots all
+        have account ID 0 and cannot be looked up by ID, see bot_rows().
+
+        """
+        if isinstance(steam_id, SteamId):
+            if steam_id.is_bot or steam_id.is_console:
+                return None
+            steam_id = steam_id.id64()
+        if steam_id >= self.ACCOUNT_ID64_BASE:
+            steam_id &= 0xffffffff
+        return self._row_index().get(steam_id)
+
+    def get(self, steam_id, field, default=None):
+        """Return a single stat value for the given player"""
+        row = self.player_row(steam_id)
+        if row is None:
+            return default
+        return row[self._columns[field]]
+
+    def player_stats(self, steam_id):
+        """Return a dict of all stats for the given player"""
+        row = self.player_row(steam_id)
+        if row is None:
+            return None
+        return dict(zip(self.fields, row))
+
+    def bot_rows(self):
+        """Return a dict of the stats rows for bots keyed by row position"""
+        col = self._columns.get('accountid', 0)
+        return dict((i, row) for (i, row) in enumerate(self.players)
+                    if not row[col])
+
+    def steam_ids(self):
+        """Return a list of SteamIds for all player rows
+
+        Bot rows are given a ``BOT`` SteamId.
+
+        """
+        col = self._columns.get('accountid', 0)
+        return [SteamId(self.ACCOUNT_ID64_BASE + row[col]) if row[col]
+                else SteamId('BOT') for row in self.players]
+
+
 CSGO_EVENTS = [
     SwitchTeamEvent,
     BuyEvent,
@@ -283,4 +460,5 @@ CSGO_EVENTS = [
     CsgoAssistEvent,
     CsgoKillEvent,
     CsgoAttackEvent,
+    RoundStatsEvent,
 ]
@@ -7,18 +7,44 @@ Complies with the HL Log Standard rev. 1.03
 
 """
 from __future__ import absolute_import, unicode_literals
-from future.utils import python_2_unicode_compatible
+from .._compat import python_2_unicode_compatible
 
+import re
 from datetime import datetime
 
 from ..objects import BasePlayer, SteamId
 
 
+# compiled event patterns by regex string, shared by all parsers
+_patterns = {}
+
+
+class _Pattern(object):
+
+    """Lazily compiled class regex
+
+    Accessing ``cls.pattern`` returns ``cls.regex`` compiled with re.U. Each
+    regex is only compiled once per process (on first use) and the compiled
+    pattern is shared between all classes with the same regex.
+
+    """
+
+    def __get__(self, instance, owner):
+        regex = owner.regex
+        try:
+            return _patterns[regex]
+        except KeyError:
+            pattern = _patterns[regex] = re.compile(regex, re.U)
+            return pattern
+
+
 @python_2_unicode_compatible
 class BaseEvent(object):
 
     """Base source event class"""
 
+    pattern = _Pattern()
+
     regex = ''.join([
         r'^L (?P<timestamp>(0[0-9]|1[0-2])/([0-2][0-9]|3[0-1])/\d{4} - ',
         r'([0-1][0-9]|2[0-3])(:[0-5][0-9]|60){2}):\s*',
@@ -179,25 +205,27 @@ class RconEvent(BaseEvent):
 
     regex = ''.join([
         BaseEvent.regex,
-        r'(Bad )?Rcon: "rcon challenge "(?P<password>\w*)" from ',
-        r'"(?P<host>\w*):(?P<port>\d{0-5})"',
+        r'(?P<bad>Bad )?Rcon: "rcon (?P<challenge>\w*) "(?P<password>[^"]*)" ',
+        r'(?P<command>.*)" from "(?P<host>[\w.]*):(?P<port>\d{1,5})"',
     ])
 
-    def __init__(self, timestamp, password, address, passed=False):
+    def __init__(self, timestamp, password, address, passed=False,
+                 challenge='', command=''):
         super(RconEvent, self).__init__(timestamp)
         self.password = password
-        if not isinstance(tuple, address) or len(address) != 2:
+        if not isinstance(address, tuple) or len(address) != 2:
             raise TypeError('Expected 2-tuple (host, port) for address')
         self.address = address
         self.passed = passed
+        self.challenge = challenge
+        self.command = command
 
     def text(self):
-        if self.passed:
-            msg = 'Rcon: "rcon challenge "%s" command" from "%s:%d"' % (
-                self.password, self.address[0], self.address[1])
-        else:
-            msg = 'Bad Rcon: "rcon challenge "%s" command" from "%s:%d"' % (
-                self.password, self.address[0], self.address[1])
+        msg = 'Rcon: "rcon %s "%s" %s" from "%s:%d"' % (
+            self.challenge, self.password, self.command, self.address[0],
+            self.address[1])
+        if not self.passed:
+            msg = 'Bad %s' % msg
         return ' '.join([super(RconEvent, self).text(), msg])
 
     __str__ = text
@@ -206,8 +234,8 @@ class RconEvent(BaseEvent):
     def from_re_match(cls, match):
         """Return an event constructed from a self.regex match"""
         kwargs = match.groupdict()
-        if not match.string.startswith('Bad'):
-            kwargs['passed'] = True
+        kwargs['passed'] = not kwargs.pop('bad')
+        kwargs['address'] = (kwargs.pop('host'), int(kwargs.pop('port')))
         return cls(**kwargs)
 
 
@@ -218,7 +246,7 @@ class PlayerEvent(BaseEvent):
 
     regex = ''.join([
         BaseEvent.regex,
-        r'"(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:]*)>',
+        r'"(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:\[\]]*)>',
         r'<(?P<team>\w*)>"\s*',
     ])
 
@@ -331,7 +359,7 @@ class KickEvent(PlayerEvent):
 
     regex = ''.join([
         BaseEvent.regex,
-        r'Kick: "(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:]*)>',
+        r'Kick: "(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:\[\]]*)>',
         r'<(?P<team>\w*)>" was kicked by "Console" ',
         r'\(message "(?P<message>.*)"\)',
     ])
@@ -449,11 +477,11 @@ class PlayerTargetEvent(BaseEvent):
 
     player_regex = ''.join([
         r'"(?P<player_name>.*)<(?P<player_uid>\d*)>',
-        r'<(?P<player_steam_id>[\w:]*)><(?P<player_team>\w*)>"\s*',
+        r'<(?P<player_steam_id>[\w:\[\]]*)><(?P<player_team>\w*)>"\s*',
     ])
     target_regex = ''.join([
         r'"(?P<target_name>.*)<(?P<target_uid>\d*)>',
-        r'<(?P<target_steam_id>[\w:]*)><(?P<target_team>\w*)>"\s*',
+        r'<(?P<target_steam_id>[\w:\[\]]*)><(?P<target_team>\w*)>"\s*',
     ])
 
     def __init__(self, timestamp, player_name, player_uid, player_steam_id,
@@ -717,7 +745,7 @@ class RoundEndPlayerEvent(PlayerEvent):
 
     regex = ''.join([
         BaseEvent.regex,
-        r'Player "(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:]*)>',
+        r'Player "(?P<player_name>.*)<(?P<uid>\d*)><(?P<steam_id>[\w:\[\]]*)>',
         r'<(?P<team>\w*)>"\s*',
         r'scored "(?P<score>\d+)"',
     ])
@@ -0,0 +1,181 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Event index module
+
+In-memory index over parsed events which answers player, event type, time
+range and round range queries without scanning every event.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import heapq
+from bisect import bisect_left, bisect_right
+
+from .events.generic import PlayerEvent, PlayerTargetEvent, WorldActionEvent
+from .objects import SteamId
+
+
+def _contains(positions, pos):
+    i = bisect_left(positions, pos)
+    return i < len(positions) and positions[i] == pos
+
+
+class EventIndex(object):
+
+    """Index of events by SteamID64, event type, timestamp and round
+
+    Events are added in log order with add(). Each event is assigned a
+    position (its index in ``events``) and all posting lists hold sorted
+    positions, so queries are answered by bisecting and intersecting the
+    smallest matching lists.
+
+    Rounds are numbered from 1 by counting ``Round_Start`` world triggers.
+
+    """
+
+    roles = ('player', 'target')
+
+    def __init__(self):
+        self.events = []
+        self._by_steam_id = {}
+        self._by_role = {}
+        self._by_type = {}
+        # (timestamp, position) pairs sorted by timestamp
+        self._times = []
+        self._time_positions = []
+        self._ordered = True
+        self._round_starts = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, event):
+        """Add an event to the index and return its position"""
+        pos = len(self.events)
+        self.events.append(event)
+        self._by_type.setdefault(type(event), []).append(pos)
+        if isinstance(event, PlayerTargetEvent):
+            self._add_player(event.player, 'player', pos)
+            self._add_player(event.target, 'target', pos)
+        elif isinstance(event, PlayerEvent):
+            self._add_player(event.player, 'player', pos)
+        elif (isinstance(event, WorldActionEvent)
+              and event.action == 'Round_Start'):
+            self._round_starts.append(pos)
+        timestamp = event.timestamp
+        if not self._times or timestamp >= self._times[-1]:
+            self._times.append(timestamp)
+            self._time_positions.append(pos)
+        else:
+            # out of order event, the time index is no longer in position
+            # order
+            i = bisect_right(self._times, timestamp)
+            self._times.insert(i, timestamp)
+            self._time_positions.insert(i, pos)
+            self._ordered = False
+        return pos
+
+    def _add_player(self, player, role, pos):
+        id64 = player.steam_id.canonical_id64()
+        positions = self._by_steam_id.setdefault(id64, [])
+        if not positions or positions[-1] != pos:
+            positions.append(pos)
+        self._by_role.setdefault((role, id64), []).append(pos)
+
+    def by_player(self, steam_id, role=None):
+        """Return the sorted positions of events involving a player
+
+        Args:
+            steam_id: A SteamId or SteamID64 integer.
+            role: Optional 'player' (i.e. attacker or killer) or 'target'
+                (i.e. victim) to only match players in that role in
+                PlayerTargetEvents. Single player events use the 'player'
+                role.
+
+        """
+        if isinstance(steam_id, SteamId):
+            steam_id = steam_id.canonical_id64()
+        if role is None:
+            return self._by_steam_id.get(steam_id, [])
+        if role not in self.roles:
+            raise ValueError('Invalid role: %s' % role)
+        return self._by_role.get((role, steam_id), [])
+
+    def by_type(self, event_type, subclasses=True):
+        """Return the sorted positions of events of the given type
+
+        If subclasses is True, events of any subclass of event_type are
+        also returned (i.e. CsgoKillEvent for KillEvent).
+
+        """
+        if not subclasses:
+            return self._by_type.get(event_type, [])
+        lists = [positions for (cls, positions) in self._by_type.items()
+                 if issubclass(cls, event_type)]
+        if len(lists) == 1:
+            return lists[0]
+        return list(heapq.merge(*lists))
+
+    def round_range(self, first, last=None):
+        """Return the (start, end) position range for rounds first to last
+
+        Positions before the first round start belong to round 0.
+
+        """
+        if last is None:
+            last = first
+        starts = self._round_starts
+        lo = 0 if first <= 0 else (
+            starts[first - 1] if first <= len(starts) else len(self.events))
+        hi = starts[last] if last < len(starts) else len(self.events)
+        return (lo, hi)
+
+    def time_positions(self, start=None, end=None):
+        """Return positions of events with start <= timestamp <= end"""
+        lo = 0 if start is None else bisect_left(self._times, start)
+        hi = (len(self._times) if end is None
+              else bisect_right(self._times, end))
+        return self._time_positions[lo:hi]
+
+    def query(self, steam_id=None, role=None, event_type=None, start=None,
+              end=None, rounds=None):
+        """Return a list of events matching all of the given criteria
+
+        Args:
+            steam_id: Optional SteamId or SteamID64 integer.
+            role: Optional player role, see by_player().
+            event_type: Optional event class (subclasses also match).
+            start: Optional minimum datetime timestamp.
+            end: Optional maximum datetime timestamp.
+            rounds: Optional (first, last) round number range, inclusive.
+
+        """
+        lists = []
+        if steam_id is not None:
+            lists.append(self.by_player(steam_id, role))
+        if event_type is not None:
+            lists.append(self.by_type(event_type))
+        (lo, hi) = (0, len(self.events))
+        if rounds is not None:
+            (lo, hi) = self.round_range(*rounds)
+        if start is not None or end is not None:
+            if self._ordered:
+                # time order is position order, so the time range is also a
+                # contiguous position range
+                positions = self.time_positions(start, end)
+                if not positions:
+                    return []
+                lo = max(lo, positions[0])
+                hi = min(hi, positions[-1] + 1)
+            else:
+                lists.append(sorted(self.time_positions(start, end)))
+        if not lists:
+            return self.events[lo:hi]
+        lists.sort(key=len)
+        smallest = lists[0]
+        candidates = smallest[bisect_left(smallest, lo):
+                              bisect_left(smallest, hi)]
+        others = lists[1:]
+        return [self.events[pos] for pos in candidates
+                if all(_contains(other, pos) for other in others)]
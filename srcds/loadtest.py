@@ -0,0 +1,260 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+RCON load generator
+
+Opens a ramp of concurrent RCON sessions against a server, runs a weighted
+mix of commands at a target rate and reports throughput, latency
+percentiles and errors by class.
+
+Usage: python -m srcds.loadtest HOST [options]
+
+"""
+
+from __future__ import (division, absolute_import, print_function,
+                        unicode_literals)
+
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+
+from .rcon import RconConnection
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+DEFAULT_COMMANDS = (
+    ('status', 5),
+    ('say pysrcds load test', 2),
+    ('sv_cheats', 2),
+    ('mp_roundtime', 1),
+)
+
+
+class LoadTestReport(object):
+
+    """Load test results
+
+    Attributes:
+        latencies: Sorted list of successful command latencies in seconds.
+        connect_latencies: Sorted list of connect and auth latencies.
+        errors: Counter of error class names (i.e. RconTimeoutError).
+        commands: Counter of successful commands by command string.
+        duration: Test duration in seconds.
+
+    """
+
+    def __init__(self, latencies=(), connect_latencies=(), errors=None,
+                 commands=None, duration=0.0):
+        self.latencies = sorted(latencies)
+        self.connect_latencies = sorted(connect_latencies)
+        self.errors = errors or Counter()
+        self.commands = commands or Counter()
+        self.duration = duration
+
+    @staticmethod
+    def _percentile(values, percent):
+        if not values:
+            return None
+        i = int(round(percent / 100 * (len(values) - 1)))
+        return values[i]
+
+    def percentile(self, percent):
+        """Return a command latency percentile (i.e. 99) in seconds"""
+        return self._percentile(self.latencies, percent)
+
+    @property
+    def throughput(self):
+        """Successful commands per second"""
+        if not self.duration:
+            return 0.0
+        return len(self.latencies) / self.duration
+
+    def summary(self):
+        """Return a human readable report"""
+        lines = [
+            'duration:    %.2fs' % self.duration,
+            'commands:    %d ok, %d errors' % (len(self.latencies),
+                                              sum(self.errors.values())),
+            'throughput:  %.1f commands/s' % self.throughput,
+            'connections: %d ok' % len(self.connect_latencies),
+        ]
+        for (label, values) in (('latency', self.latencies),
+                                ('connect', self.connect_latencies)):
+            if values:
+                lines.append('%s ms:  %s' % (label, ' '.join(
+                    '%s=%.2f' % (name,
+                                 self._percentile(values, percent) * 1000)
+                    for (name, percent) in (('p50', 50), ('p90', 90),
+                                            ('p99', 99), ('max', 100)))))
+        for (error, count) in sorted(self.errors.items()):
+            lines.append('error:       %s x%d' % (error, count))
+        return '\n'.join(lines)
+
+
+class _Session(threading.Thread):
+
+    def __init__(self, test, index):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.test = test
+        self.index = index
+        self.latencies = []
+        self.connect_latencies = []
+        self.errors = Counter()
+        self.commands = Counter()
+
+    def run(self):
+        test = self.test
+        rng = random.Random(test.seed + self.index)
+        # sessions connect one after another over the ramp up period
+        start = test.start + test.ramp_up * self.index / test.connections
+        _sleep_until(start)
+        began = _clock()
+        try:
+            conn = RconConnection(test.host, test.port, test.password,
+                                  connect_timeout=test.timeout,
+                                  read_timeout=test.timeout,
+                                  command_timeout=test.timeout)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            return
+        self.connect_latencies.append(_clock() - began)
+        next_time = _clock()
+        try:
+            while True:
+                if test.rate:
+                    # a stalled session does not send its missed commands
+                    # in a burst to catch up with the schedule
+                    next_time = max(next_time + 1 / test.rate, _clock())
+                    _sleep_until(next_time)
+                if _clock() >= test.end:
+                    break
+                command = test.choose(rng)
+                began = _clock()
+                try:
+                    conn.exec_command(command)
+                except Exception as e:
+                    self.errors[type(e).__name__] += 1
+                    if conn.closed:
+                        # timed out or closed, the session is over
+                        break
+                else:
+                    self.latencies.append(_clock() - began)
+                    self.commands[command] += 1
+        finally:
+            conn.close()
+
+
+def _sleep_until(deadline):
+    delay = deadline - _clock()
+    if delay > 0:
+        time.sleep(delay)
+
+
+class LoadTest(object):
+
+    """RCON load test
+
+    Args:
+        host: Server hostname or IP address.
+        port: Server RCON port.
+        password: RCON password.
+        connections: Number of concurrent RCON sessions.
+        duration: Test duration in seconds, including ramp up.
+        ramp_up: Seconds over which sessions are opened.
+        rate: Commands per second per session (None for as fast as
+            possible). The total rate ramps up with the sessions. Commands
+            missed while a session waits on a slow response are skipped,
+            not sent in a burst afterwards.
+        commands: Sequence of (command, weight) pairs.
+        timeout: Connect, read and command timeout in seconds.
+        seed: Random seed for the command mix.
+
+    """
+
+    def __init__(self, host, port=27015, password='', connections=10,
+                 duration=10.0, ramp_up=0.0, rate=None,
+                 commands=DEFAULT_COMMANDS, timeout=5.0, seed=0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.connections = connections
+        self.duration = duration
+        self.ramp_up = ramp_up
+        self.rate = rate
+        self.commands = [command for (command, _) in commands]
+        self.weights = [weight for (_, weight) in commands]
+        self.timeout = timeout
+        self.seed = seed
+        self.start = None
+        self.end = None
+
+    def choose(self, rng):
+        """Return a random command from the weighted mix"""
+        total = sum(self.weights)
+        point = rng.random() * total
+        for (command, weight) in zip(self.commands, self.weights):
+            point -= weight
+            if point < 0:
+                return command
+        return self.commands[-1]
+
+    def run(self):
+        """Run the load test and return a LoadTestReport"""
+        self.start = _clock()
+        self.end = self.start + self.duration
+        sessions = [_Session(self, i) for i in range(self.connections)]
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        report = LoadTestReport(duration=_clock() - self.start)
+        latencies = []
+        connect_latencies = []
+        for session in sessions:
+            latencies.extend(session.latencies)
+            connect_latencies.extend(session.connect_latencies)
+            report.errors.update(session.errors)
+            report.commands.update(session.commands)
+        report.latencies = sorted(latencies)
+        report.connect_latencies = sorted(connect_latencies)
+        return report
+
+
+def _command_weight(value):
+    (command, sep, weight) = value.rpartition(':')
+    if not sep or not weight.isdigit():
+        return (value, 1)
+    return (command, int(weight))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='RCON load generator', prog='python -m srcds.loadtest')
+    parser.add_argument('host')
+    parser.add_argument('-p', '--port', type=int, default=27015)
+    parser.add_argument('-P', '--password', default='')
+    parser.add_argument('-c', '--connections', type=int, default=10)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('-r', '--ramp-up', type=float, default=0.0)
+    parser.add_argument('--rate', type=float, default=None,
+                        help='commands per second per connection')
+    parser.add_argument('--command', action='append', type=_command_weight,
+                        dest='commands', metavar='COMMAND[:WEIGHT]',
+                        help='command in the mix (repeatable)')
+    parser.add_argument('-t', '--timeout', type=float, default=5.0)
+    args = parser.parse_args(argv)
+    test = LoadTest(args.host, args.port, args.password,
+                    connections=args.connections, duration=args.duration,
+                    ramp_up=args.ramp_up, rate=args.rate,
+                    commands=args.commands or DEFAULT_COMMANDS,
+                    timeout=args.timeout)
+    report = test.run()
+    print(report.summary())
+    return report
+
+
+if __name__ == '__main__':
+    main()
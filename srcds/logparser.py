@@ -7,8 +7,6 @@ Complies with the HL Log Standard rev. 1.03
 """
 
 from __future__ import division, absolute_import
-import os
-import re
 from collections import deque
 
 from .events import generic
@@ -22,41 +20,231 @@ class SourceLogParser(object):
 
     """HL Log Standard parser class"""
 
-    def __init__(self, default_events=True, skip_unknowns=True):
+    prefix_regex = generic.BaseEvent.pattern
+
+    def __init__(self, default_events=True, skip_unknowns=True, index=False,
+                 bus=None):
+        """Construct a SourceLogParser
+
+        Args:
+            default_events: If True, parse all generic.STANDARD_EVENTS.
+            skip_unknowns: If False, raise UnknownEventError for lines which
+                do not match any event type.
+            index: If True, build an EventIndex of parsed events in
+                ``self.index`` as events are added.
+            bus: Optional dispatch.EventBus which each parsed event is
+                dispatched to as it is added. With an aio.AsyncEventBus,
+                events which do not fit in a subscriber's queue are dropped
+                rather than raising (see AsyncSubscription.deliver()).
+
+        """
         self.events = deque()
         self.events_types = []
         self.skip_unknowns = skip_unknowns
+        self.index = None
+        if index:
+            from .index import EventIndex
+            self.index = EventIndex()
+        self.bus = bus
+        # (cls, match, lines) for a multi-line block that is being read
+        self._block = None
         if default_events:
             self.add_event_types(generic.STANDARD_EVENTS)
 
+    @property
+    def in_block(self):
+        """True if a multi-line block is currently being read"""
+        return self._block is not None
+
     def add_event_types(self, event_types=[]):
         """Add event types"""
         for cls in event_types:
-            regex = re.compile(cls.regex, re.U)
-            self.events_types.append((regex, cls))
+            self.events_types.append((cls.pattern, cls))
 
     def parse_line(self, line):
         """Parse a single log line"""
         line = line.strip()
+        if self._block is not None:
+            self._parse_block_line(line)
+            return
         for (regex, cls) in self.events_types:
             match = regex.match(line)
             if match:
-                event = cls.from_re_match(match)
-                self.events.append(event)
+                if getattr(cls, 'block_end', None):
+                    self._block = (cls, match, [])
+                    return
+                self._add_event(cls.from_re_match(match))
                 return
         if not self.skip_unknowns:
             raise UnknownEventError('Could not parse event: %s' % line)
 
-    def read(self, filename):
-        """Read in a log file"""
-        fd = open(filename)
-        for line in fd.readlines():
+    def _add_event(self, event):
+        self.events.append(event)
+        if self.index is not None:
+            self.index.add(event)
+        if self.bus is not None:
+            self.bus.dispatch(event)
+
+    def _parse_block_line(self, line):
+        """Add a line to the multi-line block that is being read
+
+        Block event classes define a ``block_end`` string which marks the
+        last line of the block and an ``item_regex`` which all other lines
+        in the block must match. The event is constructed once the last line
+        is read, so a block is only scanned once. If a line does not belong
+        to the block (i.e. the block was truncated) the block is dropped and
+        the line is parsed normally, then UnknownEventError is raised for
+        the dropped block unless skip_unknowns is set.
+
+        """
+        (consumed, event) = self._feed_block(line)
+        if event is not None:
+            self._add_event(event)
+        elif not consumed:
             self.parse_line(line)
-        fd.close()
-
-    def write(self, fileobject):
-        """Write the events back to a file object"""
-        lines = []
-        for event in self.events:
-            lines.append(str(self.event))
-        fileobject.write(os.linesep.join(lines))
+            if not self.skip_unknowns:
+                raise UnknownEventError('Truncated multi-line block before: '
+                                        '%s' % line)
+
+    def _feed_block(self, line):
+        """Feed a stripped line to the current block
+
+        Returns (consumed, event), event is set if the line ended the block.
+        If consumed is False the block was dropped and the line still needs
+        to be parsed.
+
+        """
+        (cls, match, lines) = self._block
+        prefix = self.prefix_regex.match(line)
+        body = line[prefix.end():] if prefix else line
+        if body.endswith(cls.block_end):
+            self._block = None
+            return (True, cls.from_block(match, lines))
+        elif body == '}' or cls.item_regex.match(body):
+            lines.append(body)
+            return (True, None)
+        self._block = None
+        return (False, None)
+
+    def parse_lines(self, lines):
+        """Parse a batch of log lines
+
+        Equivalent to calling parse_line() for each line, but with the
+        per-line overhead hoisted out of the loop. Parsed events are added
+        to the parser (and its index and bus) as usual.
+
+        Unknown lines never raise UnknownEventError, their positions are
+        returned instead, and truncated multi-line blocks are dropped. If an
+        exception is raised part way through the batch, the events parsed
+        before it are still added.
+
+        Returns:
+            An (events, unparsed) tuple of the list of new events and the
+            list of indices of lines which did not match any event type.
+            Lines which are part of a multi-line block are not unparsed.
+
+        """
+        events = []
+        unparsed = []
+        append = events.append
+        event_types = [(regex.match, cls, bool(getattr(cls, 'block_end', 0)))
+                       for (regex, cls) in self.events_types]
+        feed_block = self._feed_block
+        try:
+            for (i, line) in enumerate(lines):
+                line = line.strip()
+                if self._block is not None:
+                    (consumed, event) = feed_block(line)
+                    if consumed:
+                        if event is not None:
+                            append(event)
+                        continue
+                for (match_line, cls, block) in event_types:
+                    match = match_line(line)
+                    if match:
+                        if block:
+                            self._block = (cls, match, [])
+                        else:
+                            append(cls.from_re_match(match))
+                        break
+                else:
+                    unparsed.append(i)
+        finally:
+            # events parsed before an exception are still added
+            self.events.extend(events)
+            if self.index is not None:
+                add = self.index.add
+                for event in events:
+                    add(event)
+            if self.bus is not None:
+                dispatch = self.bus.dispatch
+                for event in events:
+                    dispatch(event)
+        return (events, unparsed)
+
+    def parse_buffer(self, text):
+        """Parse a buffer of newline separated log lines
+
+        The buffer is split into lines and passed to parse_lines(), see
+        parse_lines() for the return value. A single ``re.M`` finditer()
+        pass over the buffer is not used since event types are matched in
+        priority order and several event regexes share group names, so they
+        cannot be combined into one alternation.
+
+        """
+        return self.parse_lines(text.splitlines())
+
+    def iter_parse(self, lines):
+        """Parse log lines lazily, yielding events as they are parsed
+
+        Yielded events are not kept in ``self.events``, so memory use does
+        not grow with the number of lines (events are still added to the
+        index and bus, if set). Only events parsed from lines are yielded,
+        events already in ``self.events`` are left in place.
+
+        """
+        events = self.events
+        pop = events.pop
+        for line in lines:
+            before = len(events)
+            self.parse_line(line)
+            added = [pop() for _ in range(len(events) - before)]
+            while added:
+                yield added.pop()
+
+    def read(self, filename, start=None, end=None):
+        """Read in a log file
+
+        Args:
+            filename: Log file path.
+            start: Optional byte offset to start reading from, which must
+                be the start of a line (i.e. from a RoundIndex).
+            end: Optional byte offset to stop reading at.
+
+        """
+        if start is None and end is None:
+            fd = open(filename)
+            for line in fd.readlines():
+                self.parse_line(line)
+            fd.close()
+            return
+        with open(filename, 'rb') as fd:
+            fd.seek(start or 0)
+            if end is None:
+                data = fd.read()
+            else:
+                data = fd.read(max(end - (start or 0), 0))
+        for line in data.decode('utf-8', 'replace').splitlines():
+            self.parse_line(line)
+
+    def write(self, fileobject, **kwargs):
+        """Write the events back to a file object
+
+        Events are streamed through a LogWriter, any keyword arguments
+        (i.e. compress) are passed to the LogWriter constructor.
+
+        """
+        from .logwriter import LogWriter
+        writer = LogWriter(fileobject, **kwargs)
+        writer.write_all(self.events)
+        writer.close()
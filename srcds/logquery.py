@@ -0,0 +1,228 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Log query module
+
+Filtered queries over log files. Query predicates are compiled into
+substring tests which are applied to raw (undecoded) lines, so most lines
+of a selective query are rejected without being decoded or matched against
+any event regex. Only the surviving lines are parsed, and the parsed events
+are then checked against the full predicates.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+from .events import csgo, generic
+from .logparser import SourceLogParser
+from .objects import SteamId
+
+
+# Literal text which every line of an event type (and its subclasses)
+# contains, used to reject lines before regex matching. A tuple gives
+# alternatives, of which every line contains at least one.
+EVENT_KEYWORDS = {
+    generic.CvarEvent: 'Server cvar',
+    generic.LogFileEvent: 'Log file ',
+    generic.ChangeMapEvent: ' map "',
+    generic.RconEvent: 'Rcon: "rcon ',
+    generic.ConnectionEvent: 'connected, address "',
+    generic.ValidationEvent: 'STEAM USERID validated',
+    generic.EnterGameEvent: 'entered the game',
+    generic.DisconnectionEvent: 'disconnected',
+    generic.KickEvent: '" was kicked by "',
+    generic.SuicideEvent: 'committed suicide with "',
+    generic.TeamSelectionEvent: 'joined team "',
+    generic.RoleSelectionEvent: 'changed role to "',
+    generic.ChangeNameEvent: 'changed name to "',
+    generic.KillEvent: ' killed "',
+    generic.AttackEvent: ' attacked "',
+    generic.PlayerActionEvent: 'triggered "',
+    generic.TeamActionEvent: 'triggered "',
+    generic.WorldActionEvent: 'World triggered "',
+    generic.ChatEvent: ('" say "', '" say_team "'),
+    generic.TeamAllianceEvent: ' formed alliance with "',
+    generic.RoundEndTeamEvent: 'scored "',
+    generic.PrivateChatEvent: ' tell "',
+    generic.RoundEndPlayerEvent: 'scored "',
+    generic.WeaponSelectEvent: 'selected weapon "',
+    generic.WeaponPickupEvent: 'acquired weapon "',
+    csgo.SwitchTeamEvent: ' switched from team <',
+    csgo.BuyEvent: 'purchased "',
+    csgo.ThrowEvent: 'threw ',
+    csgo.CsgoAssistEvent: ' assisted killing "',
+    csgo.RoundStatsEvent: 'JSON_BEGIN{',
+}
+
+
+def event_keyword(cls):
+    """Return the keyword for an event type, or None if it has none
+
+    The keyword is a string, or a tuple of alternative strings.
+
+    """
+    for base in cls.__mro__:
+        keyword = EVENT_KEYWORDS.get(base)
+        if keyword is not None:
+            return keyword
+    return None
+
+
+def _account(steam_id):
+    """Return the account number of a SteamId, ignoring the universe"""
+    if steam_id.is_bot or steam_id.is_console:
+        return None
+    return (steam_id.id_number << 1) | steam_id.y_part
+
+
+class LogQuery(object):
+
+    """Filtered query over log lines
+
+    All given predicates must match. SteamIDs match in any universe and in
+    SteamID2 or SteamID3 form, and a player predicate matches either the
+    player or the target of an event.
+
+    Args:
+        steam_id: Optional SteamId (or SteamID string) of a player.
+        player_name: Optional player name.
+        weapon: Optional weapon name, i.e. 'awp'.
+        event_type: Optional event class (or tuple of classes). Lines are
+            only matched against the registered event types which are
+            subclasses of it.
+        event_types: Event types to parse, defaults to
+            generic.STANDARD_EVENTS.
+
+    """
+
+    def __init__(self, steam_id=None, player_name=None, weapon=None,
+                 event_type=None, event_types=None):
+        if steam_id is not None and not isinstance(steam_id, SteamId):
+            steam_id = SteamId(steam_id)
+        self.steam_id = steam_id
+        self.player_name = player_name
+        self.weapon = weapon
+        self.event_type = event_type
+        if event_types is None:
+            event_types = generic.STANDARD_EVENTS
+        if event_type is not None:
+            event_types = [cls for cls in event_types
+                           if issubclass(cls, event_type)]
+        self.event_types = list(event_types)
+        self._account = None if steam_id is None else _account(steam_id)
+        self._block = any(getattr(cls, 'block_end', None)
+                          for cls in self.event_types)
+        self.filters = self._compile()
+
+    def _compile(self):
+        """Return a tuple of substring groups, one per predicate
+
+        A line passes if it contains at least one substring from every
+        group.
+
+        """
+        groups = []
+        if self.steam_id is not None:
+            if self._account is None:
+                groups.append(['<%s>' % self.steam_id])
+            else:
+                sid = self.steam_id
+                universes = sorted(set((0, 1, sid.universe)))
+                variants = ['<STEAM_%d:%d:%d>' % (universe, sid.y_part,
+                                                  sid.id_number)
+                            for universe in universes]
+                # SteamID3 has no universe 0, STEAM_0 IDs are logged as U:1
+                variants.extend('<[U:%d:%d]' % (universe, self._account)
+                                for universe in universes if universe)
+                groups.append(variants)
+        if self.player_name is not None:
+            groups.append(['"%s<' % self.player_name])
+        if self.weapon is not None:
+            groups.append(['"%s"' % self.weapon])
+        if self.event_type is not None:
+            keywords = set()
+            for cls in self.event_types:
+                keyword = event_keyword(cls)
+                if isinstance(keyword, tuple):
+                    keywords.update(keyword)
+                else:
+                    keywords.add(keyword)
+            if None not in keywords:
+                groups.append(sorted(keywords))
+        return tuple(tuple(needle.encode('utf-8') for needle in group)
+                     for group in groups)
+
+    def match_line(self, line):
+        """Return True if a raw (bytes) line passes the prefilters"""
+        for group in self.filters:
+            for needle in group:
+                if needle in line:
+                    break
+            else:
+                return False
+        return True
+
+    def _players(self, event):
+        players = []
+        for attr in ('player', 'target'):
+            player = getattr(event, attr, None)
+            if player is not None:
+                players.append(player)
+        return players
+
+    def match(self, event):
+        """Return True if a parsed event matches the query"""
+        if self.event_type is not None and not isinstance(event,
+                                                          self.event_type):
+            return False
+        if self.weapon is not None and getattr(event, 'weapon',
+                                               None) != self.weapon:
+            return False
+        if self.steam_id is None and self.player_name is None:
+            return True
+        for player in self._players(event):
+            if self.steam_id is not None:
+                if self._account is None:
+                    if player.steam_id != self.steam_id:
+                        continue
+                elif _account(player.steam_id) != self._account:
+                    continue
+            if (self.player_name is not None
+                    and player.name != self.player_name):
+                continue
+            return True
+        return False
+
+    def parser(self):
+        """Return a SourceLogParser for the query's event types"""
+        parser = SourceLogParser(default_events=False)
+        parser.add_event_types(self.event_types)
+        return parser
+
+    def run(self, lines):
+        """Yield matching events from an iterable of raw (bytes) lines"""
+        parser = self.parser()
+        events = parser.events
+        match_line = self.match_line
+        match = self.match
+        block = self._block
+        for line in lines:
+            # lines inside a multi-line block do not contain the keywords
+            if not match_line(line) and not (block and parser.in_block):
+                continue
+            parser.parse_line(line.decode('utf-8', 'replace'))
+            while events:
+                event = events.popleft()
+                if match(event):
+                    yield event
+
+    def run_file(self, filename):
+        """Yield matching events from a log file"""
+        with open(filename, 'rb') as fd:
+            for event in self.run(fd):
+                yield event
+
+    def run_files(self, filenames):
+        """Yield matching events from several log files in order"""
+        for filename in filenames:
+            for event in self.run_file(filename):
+                yield event
@@ -0,0 +1,161 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Source server log writing module
+
+Streams events back out as HL Log Standard text.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import io
+import sys
+
+
+def _is_text(fileobj):
+    """Return True if a file object takes text (unicode) rather than bytes
+
+    io text files are detected by type, other file objects by their mode
+    string. Python 2 file objects take byte strings in any mode. Objects
+    without a mode (i.e. StringIO-like objects and wrappers) are probed
+    with an empty text write.
+
+    """
+    if isinstance(fileobj, io.TextIOBase):
+        return True
+    if isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)):
+        return False
+    mode = getattr(fileobj, 'mode', None)
+    if isinstance(mode, str):
+        return 'b' not in mode and sys.version_info[0] >= 3
+    try:
+        fileobj.write('')
+    except TypeError:
+        return False
+    return True
+
+
+class _SocketFile(object):
+
+    """Minimal binary file object wrapper around a connected socket"""
+
+    mode = 'wb'
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def write(self, data):
+        self._sock.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogWriter(object):
+
+    """Buffered streaming log writer
+
+    Events are encoded through their text() method and written in chunks of
+    roughly buffer_size characters, so memory use is bounded no matter how
+    many events are written.
+
+    Args:
+        target: A filename, a file object (text or binary mode) or a
+            connected socket.
+        compress: If True, gzip compress the output. target must not be a
+            text mode file object.
+        buffer_size: Number of characters to buffer before writing.
+        encoding: Encoding used for binary targets.
+        linesep: Line terminator written after each event. Defaults to
+            '\n' (not os.linesep) since log lines are always LF terminated.
+
+    """
+
+    def __init__(self, target, compress=False, buffer_size=65536,
+                 encoding='utf-8', linesep='\n'):
+        self._owned = None
+        if not hasattr(target, 'write') and not hasattr(target, 'sendall'):
+            target = self._owned = open(target, 'wb')
+        elif hasattr(target, 'sendall'):
+            target = _SocketFile(target)
+        self._text = _is_text(target)
+        if compress:
+            if self._text:
+                raise ValueError('Cannot compress to a text mode file')
+            import gzip
+            target = self._gzip = gzip.GzipFile(fileobj=target, mode='wb')
+        else:
+            self._gzip = None
+        self._fileobj = target
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.linesep = linesep
+        self._lines = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_line(self, line):
+        """Write a single log line"""
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if self._size >= self.buffer_size:
+            self._write_buffer()
+
+    def write(self, event):
+        """Write a single event"""
+        self.write_line(event.text())
+
+    def write_all(self, events):
+        """Write all events from an iterable"""
+        lines = self._lines
+        append = lines.append
+        size = self._size
+        buffer_size = self.buffer_size
+        for event in events:
+            line = event.text()
+            append(line)
+            size += len(line) + 1
+            if size >= buffer_size:
+                self._size = size
+                self._write_buffer()
+                size = 0
+        self._size = size
+        self.flush()
+
+    def _write_buffer(self):
+        if not self._lines:
+            return
+        self._lines.append('')
+        data = self.linesep.join(self._lines)
+        if not self._text:
+            data = data.encode(self.encoding)
+        self._fileobj.write(data)
+        del self._lines[:]
+        self._size = 0
+
+    def flush(self):
+        """Write any buffered lines to the target"""
+        self._write_buffer()
+        self._fileobj.flush()
+
+    def close(self):
+        """Flush the writer and finish any compressed stream
+
+        Files opened by the writer are closed, file objects and sockets
+        passed in by the caller are left open.
+
+        """
+        self.flush()
+        if self._gzip is not None:
+            self._gzip.close()
+        if self._owned is not None:
+            self._owned.close()
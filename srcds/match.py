@@ -0,0 +1,303 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Match state module
+
+Keeps live match state (map, players, teams, score and per-player stats)
+up to date from a stream of parsed log events.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+from .events import csgo, generic
+from ._compat import integer_types
+from .objects import SteamId
+
+
+class PlayerState(object):
+
+    """Live state for a single player"""
+
+    stat_fields = ('kills', 'deaths', 'assists', 'damage')
+
+    def __init__(self, name, uid, steam_id, team=''):
+        self.name = name
+        self.uid = uid
+        self.steam_id = steam_id
+        self.team = team or ''
+        self.connected = True
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the per-player match stats"""
+        self.kills = 0
+        self.deaths = 0
+        self.assists = 0
+        self.damage = 0
+
+    def to_dict(self):
+        """Return a dict representation of this player"""
+        return {
+            'name': self.name,
+            'uid': self.uid,
+            'steam_id': str(self.steam_id),
+            'team': self.team,
+            'connected': self.connected,
+            'kills': self.kills,
+            'deaths': self.deaths,
+            'assists': self.assists,
+            'damage': self.damage,
+        }
+
+
+class MatchState(object):
+
+    """Incremental match state built from a stream of events
+
+    Events are passed to update() in log order. Each event is dispatched
+    through a per-class handler table, so updates are O(1) per event and
+    the full log never has to be replayed to query the current state.
+
+    Players are keyed by SteamId.canonical_id64(), so the STEAM_0, STEAM_1
+    and SteamID3 forms of an ID are the same player. Bots and the console
+    all share SteamID64 0 and can be renamed, so they are keyed by SteamID
+    string and user ID instead (i.e. ``'BOT:3'``).
+
+    Every change increments ``version``. snapshot() returns a plain dict
+    copy of the current state and diff() returns only what changed since a
+    previous snapshot or version.
+
+    """
+
+    # Handler method names for each supported event class. Subclasses of
+    # these events (i.e. CsgoKillEvent) use the handler for the closest
+    # base class.
+    handlers = {
+        generic.ChangeMapEvent: '_on_change_map',
+        generic.ConnectionEvent: '_on_connect',
+        generic.EnterGameEvent: '_on_connect',
+        generic.DisconnectionEvent: '_on_disconnect',
+        generic.KickEvent: '_on_disconnect',
+        generic.ChangeNameEvent: '_on_change_name',
+        generic.TeamSelectionEvent: '_on_team_selection',
+        csgo.SwitchTeamEvent: '_on_switch_team',
+        generic.RoundEndTeamEvent: '_on_team_score',
+        csgo.RoundStatsEvent: '_on_round_stats',
+        generic.KillEvent: '_on_kill',
+        generic.SuicideEvent: '_on_suicide',
+        csgo.CsgoAssistEvent: '_on_assist',
+        generic.AttackEvent: '_on_attack',
+    }
+
+    def __init__(self):
+        self.mapname = None
+        self.score = {}
+        self.players = {}
+        self.teams = {}
+        self.version = 0
+        self._match_version = 0
+        self._player_versions = {}
+        self._dispatch = {}
+
+    @classmethod
+    def player_key(cls, player):
+        """Return the players dict key for a BasePlayer or PlayerState"""
+        return player.steam_id.canonical_id64() or '%s:%d' % (
+            player.steam_id, int(player.uid))
+
+    def _handler(self, event_type):
+        try:
+            return self._dispatch[event_type]
+        except KeyError:
+            handler = None
+            for klass in event_type.__mro__:
+                name = self.handlers.get(klass)
+                if name:
+                    handler = getattr(self, name)
+                    break
+            self._dispatch[event_type] = handler
+            return handler
+
+    def update(self, event):
+        """Update the match state from a single event
+
+        Returns True if the event changed the state.
+
+        """
+        handler = self._handler(type(event))
+        if handler is None:
+            return False
+        handler(event)
+        return True
+
+    def consume(self, events):
+        """Update the match state from an iterable of events"""
+        update = self.update
+        for event in events:
+            update(event)
+
+    def _touch(self, key=None):
+        self.version += 1
+        if key is None:
+            self._match_version = self.version
+        else:
+            self._player_versions[key] = self.version
+
+    def _get_player(self, player):
+        key = self.player_key(player)
+        state = self.players.get(key)
+        if state is None:
+            state = PlayerState(player.name, player.uid, player.steam_id,
+                                player.team)
+            self.players[key] = state
+            self._set_team(key, state, state.team)
+        return (key, state)
+
+    def _set_team(self, key, state, team):
+        members = self.teams.get(state.team)
+        if members is not None:
+            members.discard(key)
+        state.team = team or ''
+        self.teams.setdefault(state.team, set()).add(key)
+
+    def _on_change_map(self, event):
+        # reloading the same map also starts a new match
+        self.mapname = event.mapname
+        self.score = {}
+        for (key, state) in self.players.items():
+            state.reset_stats()
+            self._touch(key)
+        self._touch()
+
+    def _on_connect(self, event):
+        (key, state) = self._get_player(event.player)
+        state.uid = event.player.uid
+        state.connected = True
+        self._touch(key)
+
+    def _on_disconnect(self, event):
+        (key, state) = self._get_player(event.player)
+        state.connected = False
+        self._touch(key)
+
+    def _on_change_name(self, event):
+        (key, state) = self._get_player(event.player)
+        state.name = event.new_name
+        self._touch(key)
+
+    def _on_team_selection(self, event):
+        (key, state) = self._get_player(event.player)
+        self._set_team(key, state, event.new_team)
+        self._touch(key)
+
+    def _on_switch_team(self, event):
+        (key, state) = self._get_player(event.player)
+        self._set_team(key, state, event.new_team)
+        self._touch(key)
+
+    def _on_team_score(self, event):
+        self.score[event.team] = event.score
+        self._touch()
+
+    def _on_round_stats(self, event):
+        self.score['TERRORIST'] = event.score_t
+        self.score['CT'] = event.score_ct
+        self._touch()
+
+    def _on_kill(self, event):
+        (key, state) = self._get_player(event.player)
+        state.kills += 1
+        self._touch(key)
+        (key, state) = self._get_player(event.target)
+        state.deaths += 1
+        self._touch(key)
+
+    def _on_suicide(self, event):
+        (key, state) = self._get_player(event.player)
+        state.deaths += 1
+        self._touch(key)
+
+    def _on_assist(self, event):
+        (key, state) = self._get_player(event.player)
+        state.assists += 1
+        self._touch(key)
+
+    def _on_attack(self, event):
+        (key, state) = self._get_player(event.player)
+        state.damage += event.damage
+        self._touch(key)
+
+    def player(self, steam_id):
+        """Return the PlayerState for a SteamId, SteamID64 or bot name"""
+        if isinstance(steam_id, SteamId):
+            steam_id = steam_id.canonical_id64()
+        state = self.players.get(steam_id)
+        if state is None and not isinstance(steam_id, integer_types):
+            for player in self.players.values():
+                if player.name == steam_id and not player.steam_id.id64():
+                    return player
+        return state
+
+    def connected_players(self):
+        """Return a list of connected PlayerStates"""
+        return [p for p in self.players.values() if p.connected]
+
+    def team_members(self, team):
+        """Return a list of PlayerStates for the given team"""
+        return [self.players[key] for key in self.teams.get(team, ())]
+
+    def snapshot(self):
+        """Return a dict copy of the current match state"""
+        return {
+            'version': self.version,
+            'mapname': self.mapname,
+            'score': dict(self.score),
+            'players': dict((key, state.to_dict())
+                            for (key, state) in self.players.items()),
+        }
+
+    @classmethod
+    def restore(cls, snapshot):
+        """Return a MatchState rebuilt from a snapshot() dict
+
+        The snapshot may have been round-tripped through JSON, player keys
+        are rebuilt from the player SteamIDs.
+
+        """
+        state = cls()
+        state.mapname = snapshot['mapname']
+        state.score = dict(snapshot['score'])
+        state.version = snapshot['version']
+        state._match_version = state.version
+        for data in snapshot['players'].values():
+            player = PlayerState(data['name'], data['uid'],
+                                 SteamId(data['steam_id']))
+            player.connected = data['connected']
+            for field in PlayerState.stat_fields:
+                setattr(player, field, data[field])
+            key = cls.player_key(player)
+            state.players[key] = player
+            state._set_team(key, player, data['team'])
+            state._player_versions[key] = state.version
+        return state
+
+    def diff(self, since):
+        """Return the state that changed after a snapshot or version
+
+        Args:
+            since: A dict returned by snapshot(), or a version number.
+
+        Returns a dict containing ``version`` and only the changed keys of
+        snapshot(). ``players`` contains only the changed players.
+
+        """
+        if isinstance(since, dict):
+            since = since['version']
+        changes = {'version': self.version, 'players': {}}
+        if self._match_version > since:
+            changes['mapname'] = self.mapname
+            changes['score'] = dict(self.score)
+        for (key, version) in self._player_versions.items():
+            if version > since:
+                changes['players'][key] = self.players[key].to_dict()
+        return changes
@@ -0,0 +1,64 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Log merging module
+
+Merges event streams from several servers into a single chronological
+stream.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import heapq
+from datetime import timedelta
+
+
+def _offset(value):
+    if value is None:
+        return timedelta(0)
+    if isinstance(value, timedelta):
+        return value
+    return timedelta(seconds=value)
+
+
+def merge_events(sources, skew=None):
+    """Merge event streams by timestamp
+
+    Each source must already be in timestamp order (as a single server log
+    is). The merge is lazy, only the next event of each source is held, and
+    each event costs O(log k) for k sources. Events with equal timestamps
+    are yielded in source order, so the merge is stable.
+
+    Args:
+        sources: Dict or sequence of (source, events) pairs, where events is
+            any iterable of events (i.e. SourceLogParser.iter_parse()).
+        skew: Optional dict of source to clock offset (a timedelta or
+            seconds) which is added to that source's timestamps when
+            ordering, i.e. ``{'server2': -1.5}`` for a server whose clock
+            is 1.5 seconds fast. Event timestamps are not modified.
+
+    Yields:
+        (source, event) tuples in adjusted timestamp order.
+
+    """
+    if hasattr(sources, 'items'):
+        sources = sources.items()
+    skew = skew or {}
+    heap = []
+    for (i, (source, events)) in enumerate(sources):
+        it = iter(events)
+        offset = _offset(skew.get(source))
+        for event in it:
+            heap.append((event.timestamp + offset, i, event, source, offset,
+                         it))
+            break
+    heapq.heapify(heap)
+    while heap:
+        (_, i, event, source, offset, it) = heap[0]
+        yield (source, event)
+        for event in it:
+            heapq.heapreplace(heap, (event.timestamp + offset, i, event,
+                                     source, offset, it))
+            break
+        else:
+            heapq.heappop(heap)
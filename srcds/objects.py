@@ -7,9 +7,7 @@ Contains base classes for all standard Source server objects.
 """
 
 from __future__ import division, unicode_literals
-from future.utils import python_2_unicode_compatible
-
-import re
+from ._compat import integer_types, python_2_unicode_compatible
 
 
 STEAM_ACCOUNT_UNIVERSE = {
@@ -35,54 +33,139 @@ STEAM_ACCOUNT_TYPE = {
     'anonuser': 10,
 }
 
+# SteamID3 account type letters
+STEAM_ID3_TYPES = {
+    'I': STEAM_ACCOUNT_TYPE['invalid'],
+    'U': STEAM_ACCOUNT_TYPE['individual'],
+    'M': STEAM_ACCOUNT_TYPE['multiseat'],
+    'G': STEAM_ACCOUNT_TYPE['gameserver'],
+    'A': STEAM_ACCOUNT_TYPE['anongameserver'],
+    'P': STEAM_ACCOUNT_TYPE['pending'],
+    'C': STEAM_ACCOUNT_TYPE['contentserver'],
+    'g': STEAM_ACCOUNT_TYPE['clan'],
+    'T': STEAM_ACCOUNT_TYPE['chat'],
+    'L': STEAM_ACCOUNT_TYPE['chat'],
+    'c': STEAM_ACCOUNT_TYPE['chat'],
+    'a': STEAM_ACCOUNT_TYPE['anonuser'],
+}
+_STEAM_ID3_LETTERS = dict((v, k) for (k, v) in STEAM_ID3_TYPES.items()
+                          if k not in 'Lc')
+
 
 @python_2_unicode_compatible
 class SteamId(object):
 
-    """Steam ID class"""
+    """Steam ID class
+
+    SteamIds compare equal (and hash) by canonical_id64(), so the same
+    account read in different formats (including legacy STEAM_0 IDs, which
+    the public universe is logged as in SteamID3 form) maps to the same
+    dict key.
 
-    def __init__(self, steam_id, id_type=STEAM_ACCOUNT_TYPE['individual']):
+    Attributes:
+        id_format: The format str() returns the ID in, one of 'steam2'
+            (STEAM_X:Y:Z), 'steam3' ([U:1:N]) or 'id64' (decimal
+            SteamID64). Defaults to the format the ID was parsed from.
+
+    """
+
+    def __init__(self, steam_id, id_type=STEAM_ACCOUNT_TYPE['individual'],
+                 id_format=None):
         """Initialize a SteamId object
 
         Args:
-            steam_id: A valid SteamID. Accepts a string in STEAM_X:Y:Z format,
-                or as a 64-bit integer.
+            steam_id: A valid SteamID. Accepts a string in STEAM_X:Y:Z
+                (SteamID2), [U:1:N] (SteamID3) or decimal SteamID64 format,
+                or a 64-bit integer.
+            id_type: Account type for SteamID2 strings, which do not
+                include the type.
+            id_format: Optional format for str(), see ``id_format``.
 
         """
         self.is_bot = False
         self.is_console = False
-        if isinstance(steam_id, int):
-            (self.id_number,
-             self.y_part,
-             self.instance,
-             self.id_type,
-             self.universe) = self.split_id64(steam_id)
-        else:
-            if str(steam_id) == u'BOT':
-                self.is_bot = True
-            elif str(steam_id) == u'Console':
-                self.is_console = True
+        if isinstance(steam_id, integer_types):
+            self._set_id64(steam_id)
+            self.id_format = id_format or 'steam2'
+            return
+        if steam_id == 'BOT':
+            self.is_bot = True
+        elif steam_id == 'Console':
+            self.is_console = True
+        elif steam_id[:6].upper() == 'STEAM_':
+            parts = steam_id[6:].split(':')
+            if (len(parts) != 3 or not all(p.isdigit() for p in parts)
+                    or int(parts[0]) > 5):
+                raise ValueError('Invalid string steam_id: %s' % steam_id)
+            self.universe = int(parts[0])
+            self.instance = 1
+            self.y_part = int(parts[1])
+            self.id_number = int(parts[2])
+            self.id_type = id_type
+        elif steam_id[:1] == '[' and steam_id[-1:] == ']':
+            parts = steam_id[1:-1].split(':')
+            if (len(parts) not in (3, 4) or parts[0] not in STEAM_ID3_TYPES
+                    or not all(p.isdigit() for p in parts[1:])):
+                raise ValueError('Invalid string steam_id: %s' % steam_id)
+            account = int(parts[2])
+            self.universe = int(parts[1])
+            self.id_type = STEAM_ID3_TYPES[parts[0]]
+            self.id_number = account >> 1
+            self.y_part = account & 1
+            if len(parts) == 4:
+                self.instance = int(parts[3])
             else:
-                pattern = ''.join([
-                    r'STEAM_(?P<universe>[0-5]):(?P<y_part>\d+):',
-                    r'(?P<id_number>\d+)',
-                ])
-                match = re.match(pattern, steam_id, re.I | re.U)
-                if not match:
-                    raise ValueError('Invalid string steam_id: %s' % steam_id)
-                self.universe = int(match.groupdict()['universe'])
-                self.instance = 1
-                self.y_part = int(match.groupdict()['y_part'])
-                self.id_number = int(match.groupdict()['id_number'])
-                self.id_type = id_type
+                self.instance = self._default_instance(self.id_type)
+            self.id_format = id_format or 'steam3'
+            return
+        elif steam_id.isdigit():
+            self._set_id64(int(steam_id))
+            self.id_format = id_format or 'id64'
+            return
+        else:
+            raise ValueError('Invalid string steam_id: %s' % steam_id)
+        self.id_format = id_format or 'steam2'
+
+    def _set_id64(self, id64):
+        (self.id_number,
+         self.y_part,
+         self.instance,
+         self.id_type,
+         self.universe) = self.split_id64(id64)
+
+    @staticmethod
+    def _default_instance(id_type):
+        if id_type == STEAM_ACCOUNT_TYPE['individual']:
+            return 1
+        return 0
 
     def __str__(self):
         if self.is_bot:
             return u'BOT'
         elif self.is_console:
             return u'Console'
-        else:
-            return self.id64_to_str(self.id64())
+        elif self.id_format == 'steam3':
+            return self.id3()
+        elif self.id_format == 'id64':
+            return u'%d' % self.id64()
+        return u'STEAM_%d:%d:%d' % (self.universe, self.y_part,
+                                    self.id_number)
+
+    def __eq__(self, other):
+        if not isinstance(other, SteamId):
+            return NotImplemented
+        return (self.canonical_id64() == other.canonical_id64()
+                and self.is_bot == other.is_bot
+                and self.is_console == other.is_console)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self.canonical_id64())
 
     def id64(self):
         """Return the SteamID64 for this ID"""
@@ -95,6 +178,30 @@ class SteamId(object):
         id64 |= self.universe << 56
         return id64
 
+    def canonical_id64(self):
+        """Return the SteamID64 with universe 0 read as the public universe
+
+        STEAM_0:Y:Z IDs are the same accounts as STEAM_1:Y:Z and [U:1:N],
+        older games just render the public universe as 0. Use this rather
+        than id64() to key accounts.
+
+        """
+        id64 = self.id64()
+        if id64 and not self.universe:
+            id64 |= STEAM_ACCOUNT_UNIVERSE['public'] << 56
+        return id64
+
+    def id3(self):
+        """Return the [U:1:N] SteamID3 string for this ID"""
+        if self.is_bot or self.is_console:
+            return str(self)
+        letter = _STEAM_ID3_LETTERS.get(self.id_type, 'I')
+        account = self.id_number * 2 + self.y_part
+        if self.instance != self._default_instance(self.id_type):
+            return u'[%s:%d:%d:%d]' % (letter, self.universe, account,
+                                       self.instance)
+        return u'[%s:%d:%d]' % (letter, self.universe, account)
+
     @classmethod
     def id64_to_str(cls, id64, universe=STEAM_ACCOUNT_UNIVERSE['public']):
         """Convert a SteamID64 to a STEAM_X:Y:Z string"""
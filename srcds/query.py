@@ -0,0 +1,504 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Source server query (A2S) module
+
+Unauthenticated UDP server queries (A2S_INFO, A2S_PLAYER and A2S_RULES),
+see https://developer.valvesoftware.com/wiki/Server_queries.
+
+A single QueryClient multiplexes queries to any number of servers over one
+non-blocking UDP socket, so polling thousands of servers does not need a
+socket or thread per server.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import bz2
+import errno
+import heapq
+import itertools
+import select
+import socket
+import struct
+import time
+import zlib
+from collections import deque
+
+from .objects import SteamId
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+SINGLE_PACKET = b'\xff\xff\xff\xff'
+SPLIT_PACKET = b'\xfe\xff\xff\xff'
+
+A2S_INFO = b'T'
+A2S_PLAYER = b'U'
+A2S_RULES = b'V'
+S2C_CHALLENGE = b'A'
+S2A_INFO = b'I'
+S2A_PLAYER = b'D'
+S2A_RULES = b'E'
+
+_INFO_PAYLOAD = b'Source Engine Query\x00'
+_NO_CHALLENGE = b'\xff\xff\xff\xff'
+
+_SPLIT_HEADER = struct.Struct('<lBBh')
+_COMPRESSED_HEADER = struct.Struct('<lL')
+
+
+class QueryError(Exception):
+    """Invalid or unexpected query response."""
+    pass
+
+
+class QueryTimeoutError(QueryError):
+    """Raised when a server did not respond to any attempt of a query."""
+    pass
+
+
+class _Reader(object):
+
+    """Little endian A2S response field reader"""
+
+    _short = struct.Struct('<h')
+    _ushort = struct.Struct('<H')
+    _long = struct.Struct('<l')
+    _longlong = struct.Struct('<Q')
+    _float = struct.Struct('<f')
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def remaining(self):
+        return len(self.data) - self.pos
+
+    def byte(self):
+        value = bytearray(self.data[self.pos:self.pos + 1])
+        if not value:
+            raise QueryError('Truncated response')
+        self.pos += 1
+        return value[0]
+
+    def char(self):
+        return chr(self.byte())
+
+    def _unpack(self, fmt):
+        try:
+            (value,) = fmt.unpack_from(self.data, self.pos)
+        except struct.error:
+            raise QueryError('Truncated response')
+        self.pos += fmt.size
+        return value
+
+    def short(self):
+        return self._unpack(self._short)
+
+    def ushort(self):
+        return self._unpack(self._ushort)
+
+    def long(self):
+        return self._unpack(self._long)
+
+    def longlong(self):
+        return self._unpack(self._longlong)
+
+    def float(self):
+        return self._unpack(self._float)
+
+    def string(self):
+        end = self.data.find(b'\x00', self.pos)
+        if end < 0:
+            raise QueryError('Truncated response')
+        value = self.data[self.pos:end].decode('utf-8', 'replace')
+        self.pos = end + 1
+        return value
+
+
+class ServerInfo(object):
+
+    """A2S_INFO response
+
+    Attributes:
+        protocol, name, map, folder, game, app_id, players, max_players,
+        bots, server_type ('d' dedicated, 'l' listen, 'p' SourceTV),
+        environment ('l' Linux, 'w' Windows, 'm' Mac), password, vac and
+        version are always set. port, steam_id (a SteamId), keywords,
+        game_id, spectator_port and spectator_name are None unless the
+        server sent them.
+
+    """
+
+    def __init__(self, **kwargs):
+        self.port = None
+        self.steam_id = None
+        self.keywords = None
+        self.game_id = None
+        self.spectator_port = None
+        self.spectator_name = None
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return '<ServerInfo "%s" %s %d/%d>' % (self.name, self.map,
+                                               self.players,
+                                               self.max_players)
+
+    @classmethod
+    def parse(cls, data):
+        """Parse an S2A_INFO response payload (after the 0x49 header)"""
+        r = _Reader(data)
+        info = cls(protocol=r.byte(), name=r.string(), map=r.string(),
+                   folder=r.string(), game=r.string(), app_id=r.ushort(),
+                   players=r.byte(), max_players=r.byte(), bots=r.byte(),
+                   server_type=r.char(), environment=r.char(),
+                   password=bool(r.byte()), vac=bool(r.byte()))
+        if info.app_id == 2400:
+            # The Ship mode, witnesses and duration
+            r.pos += 3
+        info.version = r.string()
+        if r.remaining():
+            edf = r.byte()
+            if edf & 0x80:
+                info.port = r.ushort()
+            if edf & 0x10:
+                info.steam_id = SteamId(r.longlong(), id_format='steam3')
+            if edf & 0x40:
+                info.spectator_port = r.ushort()
+                info.spectator_name = r.string()
+            if edf & 0x20:
+                info.keywords = r.string()
+            if edf & 0x01:
+                info.game_id = r.longlong()
+        return info
+
+
+class QueryPlayer(object):
+
+    """A2S_PLAYER response player
+
+    Args:
+        index: Player chunk index.
+        name: Player name.
+        score: Player score.
+        duration: Seconds the player has been connected.
+
+    """
+
+    def __init__(self, index, name, score, duration):
+        self.index = index
+        self.name = name
+        self.score = score
+        self.duration = duration
+
+    def __repr__(self):
+        return '<QueryPlayer "%s" %d>' % (self.name, self.score)
+
+
+def parse_players(data):
+    """Parse an S2A_PLAYER response payload into a list of QueryPlayers"""
+    r = _Reader(data)
+    count = r.byte()
+    players = []
+    for _ in range(count):
+        if not r.remaining():
+            # servers truncate the list if it does not fit in a packet
+            break
+        players.append(QueryPlayer(r.byte(), r.string(), r.long(),
+                                   r.float()))
+    return players
+
+
+def parse_rules(data):
+    """Parse an S2A_RULES response payload into a dict"""
+    r = _Reader(data)
+    count = r.short()
+    rules = {}
+    for _ in range(count):
+        if not r.remaining():
+            break
+        name = r.string()
+        rules[name] = r.string()
+    return rules
+
+
+# query kind -> (request header, response header, parser)
+_KINDS = {
+    'info': (A2S_INFO, S2A_INFO, ServerInfo.parse),
+    'players': (A2S_PLAYER, S2A_PLAYER, parse_players),
+    'rules': (A2S_RULES, S2A_RULES, parse_rules),
+}
+
+
+class _Query(object):
+
+    def __init__(self, address, kind):
+        self.address = address
+        self.kind = kind
+        self.challenge = None
+        self.attempts = 0
+        self.challenges = 0
+        self.deadline = None
+        self.fragments = None
+        self.result = None
+        self.error = None
+
+    def packet(self):
+        header = _KINDS[self.kind][0]
+        if self.kind == 'info':
+            packet = SINGLE_PACKET + header + _INFO_PAYLOAD
+            if self.challenge is not None:
+                packet += self.challenge
+            return packet
+        return SINGLE_PACKET + header + (self.challenge or _NO_CHALLENGE)
+
+
+class QueryClient(object):
+
+    """Batched, non-blocking A2S query client
+
+    Queries for all servers are sent over a single UDP socket and responses
+    are read as they arrive with select(). Each server has one query in
+    flight at a time (so challenge responses are never ambiguous), and up to
+    max_in_flight servers are queried concurrently.
+
+    Server addresses should be IP addresses. Host names are resolved with a
+    blocking DNS lookup (once per client, the result is cached) before any
+    query in a batch is sent.
+
+    A failure for one server (an unresolvable host name, a send error or a
+    malformed response) only fails that server's query with QueryError,
+    the rest of the batch is unaffected.
+
+    Args:
+        timeout: Seconds to wait for each attempt of a query.
+        retries: Number of times a query is resent after a timeout.
+        max_in_flight: Maximum number of servers queried concurrently.
+        max_challenges: Maximum number of challenge responses accepted per
+            query, a server which keeps answering with new challenges
+            fails with QueryError.
+
+    """
+
+    def __init__(self, timeout=1.0, retries=2, max_in_flight=512,
+                 max_challenges=3):
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self.max_challenges = max_challenges
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._addresses = {}
+
+    def close(self):
+        """Close the client socket"""
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _resolve(self, address):
+        try:
+            return self._addresses[address]
+        except KeyError:
+            (host, port) = address
+            try:
+                socket.inet_aton(host)
+            except (socket.error, TypeError):
+                host = socket.gethostbyname(host)
+            resolved = (host, port)
+            self._addresses[address] = resolved
+            return resolved
+
+    def info(self, address):
+        """Return the ServerInfo for a (host, port) address"""
+        return self._single(address, 'info')
+
+    def players(self, address):
+        """Return the list of QueryPlayers for a (host, port) address"""
+        return self._single(address, 'players')
+
+    def rules(self, address):
+        """Return the dict of rules for a (host, port) address"""
+        return self._single(address, 'rules')
+
+    def _single(self, address, kind):
+        result = self.query([(address, kind)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def query(self, requests):
+        """Run a batch of queries
+
+        Args:
+            requests: Iterable of ((host, port), kind) pairs, where kind is
+                'info', 'players' or 'rules'.
+
+        Returns:
+            A list with a result (ServerInfo, list of QueryPlayers or rules
+            dict) or exception (QueryTimeoutError, QueryError) for each
+            request, in request order.
+
+        """
+        queries = []
+        queued = {}
+        for (address, kind) in requests:
+            if kind not in _KINDS:
+                raise ValueError('Invalid query kind: %s' % kind)
+            try:
+                resolved = self._resolve(address)
+            except socket.error as e:
+                query = _Query(address, kind)
+                query.error = QueryError('Could not resolve %s: %s'
+                                         % (address[0], e))
+                queries.append(query)
+                continue
+            query = _Query(resolved, kind)
+            queries.append(query)
+            queued.setdefault(query.address, deque()).append(query)
+        waiting = deque(queued)
+        active = {}
+        # (deadline, seq, query) heap, entries are stale once the query's
+        # deadline has moved on or it has finished
+        deadlines = []
+        seq = itertools.count()
+
+        def send(query, now):
+            query.attempts += 1
+            query.deadline = now + self.timeout
+            heapq.heappush(deadlines, (query.deadline, next(seq), query))
+            try:
+                self._sock.sendto(query.packet(), query.address)
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                     errno.ENOBUFS):
+                    # i.e. ENETUNREACH, only this query fails
+                    query.error = QueryError('Could not send to %s:%d: %s'
+                                             % (query.address + (e,)))
+                    finish(query)
+                # otherwise treated like a lost packet
+
+        def stale(entry):
+            (deadline, _, query) = entry
+            return (query.deadline != deadline
+                    or active.get(query.address) is not query)
+
+        def finish(query):
+            del active[query.address]
+            if queued[query.address]:
+                waiting.append(query.address)
+
+        while active or waiting:
+            now = _clock()
+            while waiting and len(active) < self.max_in_flight:
+                query = queued[waiting.popleft()].popleft()
+                active[query.address] = query
+                send(query, now)
+            while deadlines and stale(deadlines[0]):
+                heapq.heappop(deadlines)
+            if not deadlines:
+                continue
+            delay = max(0, deadlines[0][0] - now)
+            (readable, _, _) = select.select([self._sock], [], [], delay)
+            if readable:
+                self._receive(active, send, finish)
+            now = _clock()
+            while deadlines and deadlines[0][0] <= now:
+                entry = heapq.heappop(deadlines)
+                if stale(entry):
+                    continue
+                query = entry[2]
+                if query.attempts > self.retries:
+                    query.error = QueryTimeoutError(
+                        'No %s response from %s:%d' % ((query.kind,)
+                                                       + query.address))
+                    finish(query)
+                else:
+                    send(query, now)
+        return [query.error if query.error is not None else query.result
+                for query in queries]
+
+    def _receive(self, active, send, finish):
+        """Read and handle all pending datagrams"""
+        while True:
+            try:
+                (data, address) = self._sock.recvfrom(65535)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if e.args[0] == errno.ECONNREFUSED:
+                    # ICMP port unreachable for an earlier datagram
+                    continue
+                raise
+            query = active.get(address[:2])
+            if query is None:
+                continue
+            try:
+                done = self._handle(query, data, send)
+            except QueryError as e:
+                query.error = e
+                done = True
+            if done:
+                finish(query)
+
+    def _handle(self, query, data, send):
+        """Handle a response datagram, return True if the query finished"""
+        if data[:4] == SPLIT_PACKET:
+            data = self._reassemble(query, data)
+            if data is None:
+                return False
+        if data[:4] != SINGLE_PACKET:
+            raise QueryError('Invalid response header')
+        header = data[4:5]
+        if header == S2C_CHALLENGE:
+            query.challenges += 1
+            if query.challenges > self.max_challenges:
+                raise QueryError('Too many challenge responses')
+            query.challenge = data[5:9]
+            query.fragments = None
+            # challenge round trips do not count as retries, they are capped
+            # by max_challenges instead
+            query.attempts -= 1
+            send(query, _clock())
+            return False
+        (_, response, parse) = _KINDS[query.kind]
+        if header != response:
+            raise QueryError('Unexpected response type %r' % header)
+        query.result = parse(data[5:])
+        return True
+
+    def _reassemble(self, query, data):
+        """Collect a split packet, return the payload once it is complete"""
+        try:
+            (packet_id, total, number, _) = _SPLIT_HEADER.unpack_from(data, 4)
+        except struct.error:
+            raise QueryError('Truncated split packet')
+        if not 0 <= number < total:
+            raise QueryError('Invalid split packet number %d of %d'
+                             % (number, total))
+        if query.fragments is None or query.fragments[0] != packet_id:
+            query.fragments = (packet_id, total, {})
+        elif query.fragments[1] != total:
+            raise QueryError('Inconsistent split packet count')
+        fragments = query.fragments[2]
+        fragments[number] = data[4 + _SPLIT_HEADER.size:]
+        if len(fragments) < total:
+            return None
+        query.fragments = None
+        payload = b''.join(fragments[i] for i in range(total))
+        if packet_id & 0x80000000:
+            try:
+                (size, crc) = _COMPRESSED_HEADER.unpack_from(payload)
+            except struct.error:
+                raise QueryError('Truncated compressed response')
+            try:
+                payload = bz2.decompress(payload[_COMPRESSED_HEADER.size:])
+            except (IOError, ValueError):
+                raise QueryError('Invalid compressed response')
+            if len(payload) != size or zlib.crc32(payload) & 0xffffffff != crc:
+                raise QueryError('Compressed response checksum mismatch')
+        return payload
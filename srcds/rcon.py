@@ -1,9 +1,14 @@
 # Copyright (C) 2013 Peter Rowlands
 """Source server RCON communications module"""
 
+import codecs
+import os
 import struct
 import socket
 import itertools
+import time
+
+from ._compat import python_2_unicode_compatible
 
 
 # Packet types
@@ -12,34 +17,67 @@ SERVERDATA_AUTH_RESPONSE = 2
 SERVERDATA_EXECCOMMAND = 2
 SERVERDATA_RESPONSE_VALUE = 0
 
+# pkt_size, pkt_id, pkt_type
+_HEADER = struct.Struct('<3i')
+# null terminated body followed by an empty null terminated string
+_TERMINATOR = b'\x00\x00'
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# maximum number of buffers per sendmsg() call
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = -1
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
 
+@python_2_unicode_compatible
 class RconPacket(object):
-    """RCON packet"""
+    """RCON packet
 
-    def __init__(self, pkt_id=0, pkt_type=-1, body=''):
+    The body is always stored as bytes, text bodies are encoded with encoding.
+    """
+
+    def __init__(self, pkt_id=0, pkt_type=-1, body=b'', encoding='utf-8'):
         self.pkt_id = pkt_id
         self.pkt_type = pkt_type
+        if not isinstance(body, bytes):
+            body = body.encode(encoding)
         self.body = body
+        self.encoding = encoding
 
     def __str__(self):
         """Return the body string."""
-        return self.body
+        return self.text()
+
+    def text(self, errors='replace'):
+        """Return the body decoded with the packet encoding."""
+        return self.body.decode(self.encoding, errors)
 
     def size(self):
         """Return the pkt_size field for this packet."""
         return len(self.body) + 10
 
+    def header(self):
+        """Return the packed packet header (size, ID and type)."""
+        return _HEADER.pack(self.size(), self.pkt_id, self.pkt_type)
+
+    def buffers(self):
+        """Return the packed packet as (header, body, terminator) buffers for vectored sends."""
+        return (self.header(), self.body, _TERMINATOR)
+
     def pack(self):
         """Return the packed version of the packet."""
-        return struct.pack('<3i{0}s'.format(len(self.body) + 2),
-                           self.size(), self.pkt_id, self.pkt_type,
-                           bytearray(self.body, 'utf-8'))
+        return b''.join(self.buffers())
 
 
 class RconConnection(object):
     """RCON client to server connection"""
 
-    def __init__(self, server, port=27015, password='', single_packet_mode=False):
+    def __init__(self, server, port=27015, password='', single_packet_mode=False, connect_timeout=None,
+                 read_timeout=None, command_timeout=None, encoding='utf-8'):
         """Construct an RconConnection.
 
         Parameters:
@@ -48,66 +86,275 @@ class RconConnection(object):
             password (str) server RCON password
             single_packet_mode (bool) set to True for servers which do not hand 0-length SERVERDATA_RESPONSE_VALUE
                 requests (i.e. Factorio).
+            connect_timeout (float) seconds to wait for the TCP connection to be established
+            read_timeout (float) seconds to wait for each socket read or write
+            command_timeout (float) default deadline in seconds for authentication and each command, including
+                every packet of a multi-packet response
+            encoding (str) encoding used for command and response bodies
+
+        All timeouts default to None (wait forever, or the socket module default timeout for connect_timeout). The
+        socket is closed if authentication fails. If a timeout expires, RconTimeoutError is raised and the
+        connection is closed, since the state of the stream is unknown.
 
+        Raises:
+            RconAuthError if the password was rejected
+            RconTimeoutError if the connection or authentication timed out
         """
         self.server = server
         self.port = port
         self.single_packet_mode = single_packet_mode
-        self._sock = socket.create_connection((server, port))
+        self.read_timeout = read_timeout
+        self.command_timeout = command_timeout
+        self.encoding = encoding
+        # a timeout of None would override the global default socket timeout, so it is only passed if set
+        kwargs = {} if connect_timeout is None else {'timeout': connect_timeout}
+        try:
+            self._sock = socket.create_connection((server, port), **kwargs)
+        except socket.timeout:
+            raise RconTimeoutError('Timed out connecting to %s:%d' % (server, port))
+        # requests are written in one send, there is nothing to gain from Nagle's algorithm
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock_timeout = read_timeout
+        self._sock.settimeout(read_timeout)
         self.pkt_id = itertools.count(1)
-        self._authenticate(password)
-
-    def _authenticate(self, password):
+        try:
+            self._authenticate(password, self._deadline(None))
+        except (RconError, socket.error):
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        """True if the connection has been closed."""
+        return self._sock is None
+
+    def close(self):
+        """Close the connection."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _deadline(self, timeout):
+        """Return the deadline for a command with the given timeout (or command_timeout)."""
+        if timeout is None:
+            timeout = self.command_timeout
+        if timeout is None:
+            return None
+        return _clock() + timeout
+
+    def _authenticate(self, password, deadline=None):
         """Authenticate with the server using the given password."""
-        auth_pkt = RconPacket(next(self.pkt_id), SERVERDATA_AUTH, password)
-        self._send_pkt(auth_pkt)
+        auth_pkt = RconPacket(next(self.pkt_id), SERVERDATA_AUTH, password, self.encoding)
+        self._send_pkt(auth_pkt, deadline)
         # The server should respond with a SERVERDATA_RESPONSE_VALUE followed by SERVERDATA_AUTH_RESPONSE.
         # Note that some server types omit the initial SERVERDATA_RESPONSE_VALUE packet.
-        auth_resp = self.read_response(auth_pkt)
+        auth_resp = self.read_response(auth_pkt, deadline=deadline)
         if auth_resp.pkt_type == SERVERDATA_RESPONSE_VALUE:
-            auth_resp = self.read_response()
+            auth_resp = self.read_response(deadline=deadline)
         if auth_resp.pkt_type != SERVERDATA_AUTH_RESPONSE:
             raise RconError('Received invalid auth response packet')
         if auth_resp.pkt_id == -1:
             raise RconAuthError('Bad password')
 
-    def exec_command(self, command):
+    def _command_pkts(self, command):
+        """Return the packets to send for a command.
+
+        Unless single_packet_mode is set, the command packet is followed by an empty SERVERDATA_RESPONSE_VALUE
+        packet which marks the end of the (possibly multi-packet) response.
+        """
+        cmd_pkt = RconPacket(next(self.pkt_id), SERVERDATA_EXECCOMMAND, command, self.encoding)
+        if self.single_packet_mode:
+            return (cmd_pkt, None)
+        return (cmd_pkt, RconPacket(next(self.pkt_id), SERVERDATA_RESPONSE_VALUE))
+
+    def exec_command(self, command, timeout=None):
         """Execute the given RCON command.
 
         Parameters:
             command (str) the RCON command string (ex. "status")
+            timeout (float) deadline in seconds for the whole response, overrides command_timeout
+
+        Returns the response body bytes (undecoded, unlike exec_command_iter() which yields text)
+
+        Raises:
+            RconTimeoutError if the deadline expired
+        """
+        deadline = self._deadline(timeout)
+        (cmd_pkt, chk_pkt) = self._command_pkts(command)
+        self._send_pkts([pkt for pkt in (cmd_pkt, chk_pkt) if pkt], deadline)
+        return self._read_command_response(cmd_pkt, chk_pkt, deadline)
+
+    def _read_command_response(self, cmd_pkt, chk_pkt, deadline):
+        if chk_pkt is None:
+            return self.read_response(cmd_pkt, deadline=deadline).body
+        return b''.join(self._iter_multi_response(cmd_pkt, deadline, chk_pkt))
 
-        Returns the response body
+    def exec_commands(self, commands, timeout=None, window=16):
+        """Execute several RCON commands, pipelining requests.
+
+        Up to window commands are sent in a single vectored send before their responses are read, so a batch of
+        commands takes one round trip per window rather than one per command.
+
+        Parameters:
+            commands (iterable) RCON command strings
+            timeout (float) deadline in seconds for all of the commands, overrides command_timeout
+            window (int) maximum number of commands in flight
+
+        Returns a list of response body bytes, in command order
+
+        The connection is closed if an error occurs while responses are outstanding.
         """
-        cmd_pkt = RconPacket(next(self.pkt_id), SERVERDATA_EXECCOMMAND,
-                             command)
-        self._send_pkt(cmd_pkt)
-        resp = self.read_response(cmd_pkt, True)
-        return resp.body
+        deadline = self._deadline(timeout)
+        commands = list(commands)
+        responses = []
+        for i in range(0, len(commands), window):
+            pairs = [self._command_pkts(command) for command in commands[i:i + window]]
+            self._send_pkts([pkt for pair in pairs for pkt in pair if pkt], deadline)
+            try:
+                for (cmd_pkt, chk_pkt) in pairs:
+                    responses.append(self._read_command_response(cmd_pkt, chk_pkt, deadline))
+            except (RconError, socket.error):
+                # the rest of the window's responses are still in flight, so the stream cannot be reused
+                self.close()
+                raise
+        return responses
+
+    def exec_command_iter(self, command, encoding=None, timeout=None):
+        """Execute the given RCON command and iterate over the response as it arrives.
+
+        Unlike exec_command(), which returns the raw response bytes, this yields decoded text. Response packets are
+        decoded incrementally (undecodable bytes are replaced), so characters split across packets are decoded
+        correctly and large responses (i.e. cvarlist) never need to be held in memory at once.
+
+        If iteration is stopped early, the rest of the response is read and discarded when the iterator is closed,
+        so that the connection can still be used.
+
+        Parameters:
+            command (str) the RCON command string (ex. "cvarlist")
+            encoding (str) response encoding, defaults to the connection encoding
+            timeout (float) deadline in seconds for the whole response, overrides command_timeout
 
-    def _send_pkt(self, pkt):
+        Yields decoded response text chunks (str, roughly one per packet), which can be joined with ''.join()
+        """
+        deadline = self._deadline(timeout)
+        (cmd_pkt, chk_pkt) = self._command_pkts(command)
+        self._send_pkts([pkt for pkt in (cmd_pkt, chk_pkt) if pkt], deadline)
+        decoder = codecs.getincrementaldecoder(encoding or self.encoding)('replace')
+        if chk_pkt is None:
+            bodies = [self.read_response(cmd_pkt, deadline=deadline).body]
+        else:
+            bodies = self._iter_multi_response(cmd_pkt, deadline, chk_pkt)
+        try:
+            for body in bodies:
+                text = decoder.decode(body)
+                if text:
+                    yield text
+        finally:
+            if not isinstance(bodies, list):
+                bodies.close()
+        text = decoder.decode(b'', True)
+        if text:
+            yield text
+
+    def _set_timeout(self, deadline):
+        """Set the socket timeout for the next socket operation."""
+        timeout = self.read_timeout
+        if deadline is not None:
+            remaining = deadline - _clock()
+            if remaining <= 0:
+                self._timed_out()
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+        if timeout != self._sock_timeout:
+            self._sock.settimeout(timeout)
+            self._sock_timeout = timeout
+
+    def _timed_out(self):
+        """Close the connection and raise RconTimeoutError."""
+        self.close()
+        raise RconTimeoutError('Timed out waiting for %s:%d' % (self.server, self.port))
+
+    def _check_open(self):
+        if self._sock is None:
+            raise RconClosedError('Connection is closed')
+
+    def _send_pkt(self, pkt, deadline=None):
         """Send one RCON packet over the connection.
 
             Raises:
                 RconSizeError if the size of the specified packet is > 4096 bytes
+                RconTimeoutError if the deadline expired
         """
-        if pkt.size() > 4096:
-            raise RconSizeError('pkt_size > 4096 bytes')
-        data = pkt.pack()
-        self._sock.sendall(data)
+        self._send_pkts([pkt], deadline)
 
-    def _recv_pkt(self):
-        """Read one RCON packet"""
-        while True:
-            header = self._sock.recv(struct.calcsize('<3i'))
-            if len(header) != 0:
-                break
+    def _send_pkts(self, pkts, deadline=None):
+        """Send RCON packets over the connection with a single vectored send.
 
-        (pkt_size, pkt_id, pkt_type) = struct.unpack('<3i', header)
-        body = self._sock.recv(pkt_size - 8)
-        return RconPacket(pkt_id, pkt_type, body)
+        Packet headers and bodies are passed to sendmsg() as separate buffers, so no packed copy of the packets is
+        made. Large batches are sent in chunks of at most IOV_MAX buffers. Platforms without sendmsg() (i.e. Windows)
+        fall back to joining the buffers.
+
+            Raises:
+                RconSizeError if the size of any of the packets is > 4096 bytes
+                RconTimeoutError if the deadline expired
+        """
+        buffers = []
+        for pkt in pkts:
+            if pkt.size() > 4096:
+                raise RconSizeError('pkt_size > 4096 bytes')
+            buffers.extend(pkt.buffers())
+        self._check_open()
+        self._set_timeout(deadline)
+        sock = self._sock
+        try:
+            if hasattr(sock, 'sendmsg'):
+                for i in range(0, len(buffers), _IOV_MAX):
+                    chunk = buffers[i:i + _IOV_MAX]
+                    sent = sock.sendmsg(chunk)
+                    if sent < sum(len(buf) for buf in chunk):
+                        sock.sendall(b''.join(chunk)[sent:])
+            else:
+                sock.sendall(b''.join(buffers))
+        except socket.timeout:
+            self._timed_out()
+
+    def _recv_exact(self, size, deadline=None):
+        """Read exactly size bytes from the connection into a bytearray.
 
-    def read_response(self, request=None, multi=False):
+            Raises:
+                RconClosedError if the server closed the connection
+                RconTimeoutError if the deadline expired
+        """
+        self._check_open()
+        data = bytearray(size)
+        view = memoryview(data)
+        pos = 0
+        while pos < size:
+            self._set_timeout(deadline)
+            try:
+                received = self._sock.recv_into(view[pos:], size - pos)
+            except socket.timeout:
+                self._timed_out()
+            if not received:
+                self.close()
+                raise RconClosedError('Connection closed by server')
+            pos += received
+        return data
+
+    def _recv_pkt(self, deadline=None):
+        """Read one RCON packet"""
+        (pkt_size, pkt_id, pkt_type) = _HEADER.unpack(self._recv_exact(_HEADER.size, deadline))
+        data = self._recv_exact(pkt_size - 8, deadline)
+        # the body is followed by two null bytes
+        return RconPacket(pkt_id, pkt_type, bytes(memoryview(data)[:-2]), self.encoding)
+
+    def read_response(self, request=None, multi=False, deadline=None):
         """Return the next response packet.
 
         Parameters:
@@ -115,9 +362,11 @@ class RconConnection(object):
                 specified request ID
             multi (bool) set to True if read_response() should check for a multi packet response. If the current
                 RconConnection has single_packet_mode enabled, this parameter is ignored.
+            deadline (float) optional time.monotonic() (time.time() on Python 2) deadline for the response
 
         Raises:
             RconError if an error occurred while receiving the server response
+            RconTimeoutError if the deadline expired
         """
         if request and not isinstance(request, RconPacket):
             raise TypeError('Expected RconPacket type for request')
@@ -125,37 +374,60 @@ class RconConnection(object):
             if not request:
                 raise ValueError('Must specify a request packet in order to'
                                  ' read a multi-packet response')
-            response = self._read_multi_response(request)
+            response = self._read_multi_response(request, deadline)
         else:
-            response = self._recv_pkt()
+            response = self._recv_pkt(deadline)
         if not self.single_packet_mode and response.pkt_type not in (SERVERDATA_RESPONSE_VALUE, SERVERDATA_AUTH_RESPONSE):
             raise RconError('Recieved unexpected RCON packet type')
         if request and response.pkt_id != request.pkt_id:
             raise RconError('Response ID does not match request ID')
         return response
 
-    def _read_multi_response(self, req_pkt):
+    def _read_multi_response(self, req_pkt, deadline=None):
         """Return concatenated multi-packet response."""
-        chk_pkt = RconPacket(next(self.pkt_id), SERVERDATA_RESPONSE_VALUE)
-        self._send_pkt(chk_pkt)
+        return RconPacket(req_pkt.pkt_id, SERVERDATA_RESPONSE_VALUE,
+                          b''.join(self._iter_multi_response(req_pkt, deadline)))
+
+    def _iter_multi_response(self, req_pkt, deadline=None, chk_pkt=None):
+        """Yield the body of each packet in a multi-packet response.
+
+        If chk_pkt is set, it must already have been sent after req_pkt.
+        """
+        if chk_pkt is None:
+            chk_pkt = RconPacket(next(self.pkt_id), SERVERDATA_RESPONSE_VALUE)
+            self._send_pkt(chk_pkt, deadline)
         # According to the Valve wiki, a server will mirror a
         # SERVERDATA_RESPONSE_VALUE packet and then send an additional response
-        # packet with an empty body. So we should concatenate any packets until
+        # packet with an empty body. So we should yield any packets until
         # we receive a response that matches the ID in chk_pkt
-        body_parts = []
-        while True:
-            response = self._recv_pkt()
-            if response.pkt_type != SERVERDATA_RESPONSE_VALUE:
-                raise RconError('Received unexpected RCON packet type')
-            if response.pkt_id == chk_pkt.pkt_id:
-                break
-            elif response.pkt_id != req_pkt.pkt_id:
-                raise RconError('Response ID does not match request ID')
-            body_parts.append(response.body)
+        try:
+            while True:
+                response = self._recv_pkt(deadline)
+                if response.pkt_type != SERVERDATA_RESPONSE_VALUE:
+                    raise RconError('Received unexpected RCON packet type')
+                if response.pkt_id == chk_pkt.pkt_id:
+                    break
+                elif response.pkt_id != req_pkt.pkt_id:
+                    raise RconError('Response ID does not match request ID')
+                yield response.body
+        except GeneratorExit:
+            # the caller stopped iterating, skip the rest of the response
+            self._drain_multi_response(chk_pkt, deadline)
+            raise
         # Read and ignore the extra empty body response
-        self._recv_pkt()
-        return RconPacket(req_pkt.pkt_id, SERVERDATA_RESPONSE_VALUE,
-                          ''.join(str(body_parts)))
+        self._recv_pkt(deadline)
+
+    def _drain_multi_response(self, chk_pkt, deadline=None):
+        """Discard the rest of an abandoned multi-packet response.
+
+        The connection is closed if the rest of the response cannot be read.
+        """
+        try:
+            while self._recv_pkt(deadline).pkt_id != chk_pkt.pkt_id:
+                pass
+            self._recv_pkt(deadline)
+        except (RconError, socket.error):
+            self.close()
 
 
 class RconError(Exception):
@@ -171,3 +443,13 @@ class RconAuthError(RconError):
 class RconSizeError(RconError):
     """Raised when an RCON packet is an illegal size."""
     pass
+
+
+class RconTimeoutError(RconError):
+    """Raised when a connect, read or command timeout expires."""
+    pass
+
+
+class RconClosedError(RconError):
+    """Raised when the connection was closed (i.e. by the server)."""
+    pass
@@ -0,0 +1,165 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Log redaction module
+
+Scrubs RCON passwords and player IP addresses from parsed events, and
+optionally replaces SteamIDs with stable pseudonyms, before logs are passed
+on to third parties.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import hashlib
+import hmac
+import os
+import re
+import struct
+
+from .events import csgo, generic
+from .logwriter import LogWriter
+from .objects import SteamId
+
+
+_IP_RE = re.compile(r'(?<![\d.])\d{1,3}(?:\.\d{1,3}){3}(?![\d.])')
+
+
+class Redactor(object):
+
+    """Streaming event redaction stage
+
+    Events are redacted in place, which avoids copying every event when
+    redacting a stream. Redact copies of events which are still needed
+    unredacted.
+
+    SteamID pseudonyms are derived from an HMAC of the SteamID64, so the
+    same key always maps a player to the same pseudonym. If no key is given
+    a random key is used and pseudonyms are only stable for the lifetime of
+    the Redactor. Pseudonyms are cached in memory, so each player is only
+    hashed once.
+
+    A SteamID account number only has 32 bits, so pseudonyms of different
+    players can collide. Collisions are detected and the colliding player
+    is given the next 32 bits of the HMAC instead, so two players never
+    share a pseudonym within a Redactor.
+
+    Args:
+        passwords: If True, replace RCON passwords (and the values of
+            sensitive_commands in RCON commands).
+        addresses: If True, replace player and RCON client IP addresses,
+            and IP addresses in RCON commands (i.e. logaddress_add).
+        steam_ids: If True, replace SteamIDs with pseudonyms.
+        key: Optional HMAC key (bytes) for SteamID pseudonyms.
+
+    """
+
+    redacted_password = 'REDACTED'
+    redacted_host = '0.0.0.0'
+    sensitive_commands = ('rcon_password', 'sv_password', 'tv_password')
+
+    def __init__(self, passwords=True, addresses=True, steam_ids=False,
+                 key=None):
+        self.passwords = passwords
+        self.addresses = addresses
+        self.steam_ids = steam_ids
+        if key is None:
+            key = os.urandom(32)
+        self._key = key
+        self._pseudonyms = {}
+        # pseudonym account number -> SteamID64 it was assigned to
+        self._accounts = {}
+
+    def pseudonym(self, steam_id):
+        """Return the pseudonym SteamId for a SteamId
+
+        Bot and console IDs are returned unchanged. The pseudonym keeps the
+        universe, type, instance and format of the original ID.
+
+        """
+        if steam_id.is_bot or steam_id.is_console:
+            return steam_id
+        id64 = steam_id.id64()
+        key = (id64, steam_id.id_format)
+        try:
+            return self._pseudonyms[key]
+        except KeyError:
+            # STEAM_0 and STEAM_1/[U:1:N] forms get the same account
+            account = self._account(steam_id.canonical_id64())
+            pseudonym = SteamId((id64 & ~0xffffffff) | account,
+                                id_format=steam_id.id_format)
+            self._pseudonyms[key] = pseudonym
+            return pseudonym
+
+    def _account(self, id64):
+        """Return the pseudonym account number for a SteamID64"""
+        msg = str(id64).encode('ascii')
+        while True:
+            digest = hmac.new(self._key, msg, hashlib.sha256).digest()
+            for account in struct.unpack('<8I', digest):
+                owner = self._accounts.setdefault(account, id64)
+                if owner == id64:
+                    return account
+            msg = digest
+
+    def _redact_player(self, player):
+        player.steam_id = self.pseudonym(player.steam_id)
+
+    def _redact_command(self, command):
+        parts = command.split(None, 1)
+        if parts and parts[0] in self.sensitive_commands:
+            return '%s %s' % (parts[0], self.redacted_password)
+        return command
+
+    def redact(self, event):
+        """Redact a single event in place and return it"""
+        if self.steam_ids:
+            if isinstance(event, generic.PlayerTargetEvent):
+                self._redact_player(event.player)
+                self._redact_player(event.target)
+            elif isinstance(event, generic.PlayerEvent):
+                self._redact_player(event.player)
+            elif isinstance(event, csgo.RoundStatsEvent):
+                self._redact_round_stats(event)
+        if isinstance(event, generic.ConnectionEvent):
+            if self.addresses and isinstance(event.address, tuple):
+                event.address = (self.redacted_host, 0)
+        elif isinstance(event, generic.RconEvent):
+            if self.passwords:
+                event.password = self.redacted_password
+                event.command = self._redact_command(event.command)
+            if self.addresses:
+                event.address = (self.redacted_host, 0)
+                event.command = _IP_RE.sub(self.redacted_host, event.command)
+        return event
+
+    def _redact_round_stats(self, event):
+        if 'accountid' not in event.fields:
+            return
+        col = event.fields.index('accountid')
+        players = []
+        for row in event.players:
+            if not row[col]:
+                # bots have account ID 0
+                players.append(row)
+                continue
+            steam_id = SteamId(event.ACCOUNT_ID64_BASE + row[col])
+            account = self.pseudonym(steam_id).id64() & 0xffffffff
+            players.append(row[:col] + (account,) + row[col + 1:])
+        event.players = tuple(players)
+        event._rows = None
+
+    def redact_events(self, events):
+        """Yield redacted events from an iterable of events"""
+        redact = self.redact
+        for event in events:
+            yield redact(event)
+
+    def write(self, events, target, **kwargs):
+        """Redact events and stream them to target as log text
+
+        Any keyword arguments (i.e. compress) are passed to the LogWriter
+        constructor.
+
+        """
+        with LogWriter(target, **kwargs) as writer:
+            writer.write_all(self.redact_events(events))
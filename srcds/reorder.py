@@ -0,0 +1,151 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Log line reorder module
+
+UDP log streams (logaddress_add) may deliver lines out of order or more than
+once. A ReorderBuffer sits between line intake and SourceLogParser, holding
+lines for a short window so they can be released in timestamp order with
+duplicates dropped.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import heapq
+import itertools
+from collections import deque
+from datetime import datetime, timedelta
+
+
+def line_timestamp(line):
+    """Return the datetime of a ``L MM/DD/YYYY - hh:mm:ss:`` line prefix
+
+    Returns None if the line does not start with a timestamp.
+
+    """
+    if line[:2] != 'L ' or line[12:15] != ' - ' or line[23:24] != ':':
+        return None
+    try:
+        return datetime(int(line[8:12]), int(line[2:4]), int(line[5:7]),
+                        int(line[15:17]), int(line[18:20]), int(line[21:23]))
+    except ValueError:
+        return None
+
+
+class ReorderBuffer(object):
+
+    """Bounded reorder and deduplication buffer for log lines
+
+    Lines are held until a line at least window seconds newer has been
+    pushed, then released in timestamp order (lines with equal timestamps
+    keep their arrival order, since HL timestamps only have one second
+    resolution). Lines without a timestamp take the newest timestamp pushed
+    so far (not necessarily that of the line which arrived just before
+    them), or are returned immediately if no timestamped line has been
+    pushed yet.
+
+    Memory is bounded under packet storms: at most max_size lines are held
+    (the oldest are released early beyond that) and hashes of the last
+    dedup_size distinct lines are remembered for duplicate detection. A
+    line which arrives after lines newer than it have been released is
+    released immediately and counted in ``late``.
+
+    Since release is driven by newer lines, flush() should be called when
+    the stream ends or goes idle.
+
+    Args:
+        window: Seconds of log time lines are held for.
+        max_size: Maximum number of held lines.
+        dedup_size: Number of recent distinct lines checked for duplicates,
+            0 disables deduplication.
+
+    """
+
+    def __init__(self, window=2, max_size=10000, dedup_size=10000):
+        self.window = timedelta(seconds=window)
+        self.max_size = max_size
+        self.dedup_size = dedup_size
+        self.duplicates = 0
+        self.late = 0
+        # heap of (timestamp, seq, line)
+        self._heap = []
+        self._seq = itertools.count()
+        self._hashes = set()
+        self._hash_order = deque()
+        self._newest = None
+        self._released = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _is_duplicate(self, line):
+        if not self.dedup_size:
+            return False
+        key = hash(line)
+        if key in self._hashes:
+            return True
+        self._hashes.add(key)
+        self._hash_order.append(key)
+        if len(self._hash_order) > self.dedup_size:
+            self._hashes.discard(self._hash_order.popleft())
+        return False
+
+    def _pop(self):
+        (timestamp, _, line) = heapq.heappop(self._heap)
+        self._released = timestamp
+        return line
+
+    def push(self, line):
+        """Add a line and return the list of lines released by it"""
+        line = line.strip()
+        if not line:
+            return []
+        if self._is_duplicate(line):
+            self.duplicates += 1
+            return []
+        timestamp = line_timestamp(line)
+        if timestamp is None:
+            timestamp = self._newest
+            if timestamp is None:
+                return [line]
+        if self._released is not None and timestamp < self._released:
+            self.late += 1
+            return [line]
+        heapq.heappush(self._heap, (timestamp, next(self._seq), line))
+        if self._newest is None or timestamp > self._newest:
+            self._newest = timestamp
+        released = []
+        cutoff = self._newest - self.window
+        heap = self._heap
+        while heap and (heap[0][0] <= cutoff or len(heap) > self.max_size):
+            released.append(self._pop())
+        return released
+
+    def push_all(self, lines):
+        """Add several lines and return the list of lines released"""
+        released = []
+        for line in lines:
+            released.extend(self.push(line))
+        return released
+
+    def flush(self):
+        """Release and return all held lines in order"""
+        released = []
+        while self._heap:
+            released.append(self._pop())
+        return released
+
+
+def reorder_lines(lines, **kwargs):
+    """Yield lines from an iterable through a ReorderBuffer
+
+    Keyword arguments are passed to the ReorderBuffer constructor. Held
+    lines are flushed when the iterable is exhausted.
+
+    """
+    buf = ReorderBuffer(**kwargs)
+    for line in lines:
+        for released in buf.push(line):
+            yield released
+    for released in buf.flush():
+        yield released
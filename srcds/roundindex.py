@@ -0,0 +1,245 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Round index module
+
+Byte offset index of the rounds in a log file, so a single round (or the
+round at a given time) can be parsed without parsing the log from the
+start. The index is built with one pass of substring searches over the raw
+file, without constructing events, and is saved as a JSON sidecar file next
+to the log.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import json
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime
+
+from .checkpoint import LogCheckpoint, atomic_write
+
+
+SIDECAR_SUFFIX = '.rounds.json'
+CHUNK_SIZE = 1 << 20
+
+_ROUND_NEEDLE = b'World triggered "Round_'
+_MAP_NEEDLE = b' map "'
+_LINE_RE = re.compile(
+    br'L (?P<timestamp>\d\d/\d\d/\d{4} - \d\d:\d\d:\d\d): '
+    br'(?:World triggered "(?P<action>Round_Start|Round_End)"'
+    br'|(?P<change>Loading|Started) map "(?P<mapname>[^"]*)")')
+_TIME_FORMAT = '%m/%d/%Y - %H:%M:%S'
+
+
+def _find_all(data, needle):
+    pos = data.find(needle)
+    while pos >= 0:
+        yield pos
+        pos = data.find(needle, pos + len(needle))
+
+
+class RoundIndex(object):
+
+    """Byte offset index of rounds in a log file
+
+    Rounds are numbered from 1 by counting ``Round_Start`` world triggers
+    from the start of the file, the same way EventIndex numbers them, and
+    round N spans from its ``Round_Start`` line to the next round's
+    ``Round_Start`` line (or the end of the file). Lines before the first
+    round start belong to round 0.
+
+    Attributes:
+        rounds: List of [start offset, end offset, timestamp, map] lists
+            for each round, where end offset is the offset just after the
+            round's ``Round_End`` line (None if it has not ended) and
+            timestamp is the round start time as a log timestamp string.
+        maps: List of [offset, timestamp, map, state] lists for each map
+            change (or reload of the same map), where state is 'Loading'
+            until the matching ``Started map`` line has been read.
+        size: Number of bytes of the file which have been indexed (up to
+            the end of the last complete line).
+        identity: LogCheckpoint identifying the indexed file by device,
+            inode and a checksum of its first bytes.
+
+    """
+
+    def __init__(self, filename, rounds=None, maps=None, size=0,
+                 identity=None):
+        self.filename = filename
+        self.rounds = rounds or []
+        self.maps = maps or []
+        self.size = size
+        if identity is None:
+            identity = LogCheckpoint(filename)
+        self.identity = identity
+        self._times = None
+
+    def __len__(self):
+        return len(self.rounds)
+
+    @classmethod
+    def build(cls, filename):
+        """Return a new index for a log file"""
+        index = cls(filename)
+        index.update()
+        return index
+
+    def update(self):
+        """Index lines appended to the file since the last update
+
+        Returns the number of new rounds. If the file is not the one which
+        was indexed (it was rotated, replaced or truncated, see
+        LogCheckpoint.matches()) it is indexed again from the start.
+
+        """
+        count = len(self.rounds)
+        with open(self.filename, 'rb') as fd:
+            if (self.identity.inode is not None
+                    and not self.identity.matches(fd)):
+                self.rounds = []
+                self.maps = []
+                self.size = 0
+                count = 0
+                # force the file identity to be recomputed
+                self.identity.head_size = 0
+            fd.seek(self.size)
+            tail = b''
+            while True:
+                chunk = fd.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = tail + chunk
+                end = data.rfind(b'\n') + 1
+                self._scan(data[:end], self.size)
+                self.size += end
+                tail = data[end:]
+            self.identity.update(fd, self.size)
+        self._times = None
+        return len(self.rounds) - count
+
+    def _scan(self, data, base):
+        hits = sorted(list(_find_all(data, _ROUND_NEEDLE))
+                      + list(_find_all(data, _MAP_NEEDLE)))
+        last_line = -1
+        for pos in hits:
+            line_start = data.rfind(b'\n', 0, pos) + 1
+            if line_start == last_line:
+                continue
+            last_line = line_start
+            line_end = data.find(b'\n', pos) + 1
+            match = _LINE_RE.match(data, line_start, line_end)
+            if not match:
+                continue
+            timestamp = match.group('timestamp').decode('ascii')
+            action = match.group('action')
+            if action == b'Round_Start':
+                mapname = self.maps[-1][2] if self.maps else None
+                self.rounds.append([base + line_start, None, timestamp,
+                                    mapname])
+            elif action == b'Round_End':
+                if self.rounds and self.rounds[-1][1] is None:
+                    self.rounds[-1][1] = base + line_end
+            else:
+                mapname = match.group('mapname').decode('utf-8', 'replace')
+                last = self.maps[-1] if self.maps else None
+                if (match.group('change') == b'Started' and last is not None
+                        and last[2] == mapname and last[3] == 'Loading'):
+                    # Started map following the Loading map line
+                    last[3] = 'Started'
+                else:
+                    self.maps.append([base + line_start, timestamp, mapname,
+                                      match.group('change').decode('ascii')])
+
+    def find_round(self, first, last=None):
+        """Return the (start, end) byte range for rounds first to last
+
+        The range can be passed to SourceLogParser.read().
+
+        """
+        if last is None:
+            last = first
+        rounds = self.rounds
+        start = 0 if first <= 0 else (
+            rounds[first - 1][0] if first <= len(rounds) else self.size)
+        end = rounds[last][0] if last < len(rounds) else self.size
+        return (start, end)
+
+    def round_at(self, timestamp):
+        """Return the number of the round in progress at a datetime
+
+        Returns 0 for times before the first round start.
+
+        """
+        if self._times is None:
+            self._times = [datetime.strptime(r[2], _TIME_FORMAT)
+                           for r in self.rounds]
+        return bisect_right(self._times, timestamp)
+
+    def find_time(self, timestamp):
+        """Return the (start, end) byte range of the round at a datetime"""
+        return self.find_round(self.round_at(timestamp))
+
+    def read_round(self, parser, first, last=None):
+        """Parse rounds first to last with a SourceLogParser
+
+        Only the byte range of the rounds is read. Note that an EventIndex
+        built by the parser numbers rounds from the start of the range.
+
+        """
+        (start, end) = self.find_round(first, last)
+        parser.read(self.filename, start, end)
+
+    def to_dict(self):
+        """Return a JSON serializable dict for this index"""
+        return {
+            'filename': self.filename,
+            'rounds': self.rounds,
+            'maps': self.maps,
+            'size': self.size,
+            'identity': self.identity.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return an index constructed from a to_dict() dict"""
+        data = dict(data)
+        if data.get('identity') is not None:
+            data['identity'] = LogCheckpoint.from_dict(data['identity'])
+        return cls(**data)
+
+    @staticmethod
+    def sidecar_path(filename):
+        """Return the default sidecar index path for a log file"""
+        return filename + SIDECAR_SUFFIX
+
+    def save(self, path=None):
+        """Atomically write this index to path (defaults to the sidecar)"""
+        if path is None:
+            path = self.sidecar_path(self.filename)
+        atomic_write(path, json.dumps(self.to_dict(), separators=(',', ':')))
+
+    @classmethod
+    def load(cls, filename, path=None):
+        """Return the index for a log file, building or updating it if needed
+
+        The saved sidecar index is loaded if it exists, any lines appended
+        to the log since it was saved are indexed, and the sidecar is
+        rewritten if anything changed.
+
+        """
+        if path is None:
+            path = cls.sidecar_path(filename)
+        try:
+            with open(path) as fobj:
+                index = cls.from_dict(json.load(fobj))
+            index.filename = filename
+        except (IOError, OSError, ValueError, TypeError):
+            index = cls(filename)
+        saved = json.dumps(index.to_dict(), sort_keys=True)
+        index.update()
+        if (json.dumps(index.to_dict(), sort_keys=True) != saved
+                or not os.path.exists(path)):
+            index.save(path)
+        return index
@@ -0,0 +1,312 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+RCON command scheduler module
+
+Schedules RCON commands across many servers with per-server rate limits,
+command priorities, coalescing of duplicate idempotent commands and round
+robin fairness between servers.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import heapq
+import itertools
+import threading
+import time
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# Command priorities, lower values run first
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BULK = 20
+
+# Commands which may be coalesced, their output does not depend on how many
+# times they are run
+IDEMPOTENT_COMMANDS = frozenset(['status', 'stats', 'users', 'maps *',
+                                 'cvarlist', 'listid', 'listip'])
+
+
+class TokenBucket(object):
+
+    """Token bucket rate limiter
+
+    Args:
+        rate: Tokens added per second, must be greater than 0.
+        burst: Maximum number of tokens (defaults to rate, minimum 1). The
+            bucket starts full.
+
+    """
+
+    def __init__(self, rate, burst=None):
+        if not rate > 0:
+            raise ValueError('rate must be greater than 0: %r' % (rate,))
+        self.rate = rate
+        if burst is None:
+            burst = max(rate, 1)
+        self.burst = burst
+        self.tokens = burst
+        self._time = _clock()
+
+    def _refill(self, now):
+        if now > self._time:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self._time) * self.rate)
+            self._time = now
+
+    def try_acquire(self, tokens=1, now=None):
+        """Take tokens if they are available and return True, else False"""
+        self._refill(_clock() if now is None else now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens=1, now=None):
+        """Return the number of seconds until tokens are available"""
+        self._refill(_clock() if now is None else now)
+        if self.tokens >= tokens:
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+
+class CommandResult(object):
+
+    """Pending result of a scheduled command
+
+    Coalesced commands share a single CommandResult.
+
+    """
+
+    def __init__(self, server, command):
+        self.server = server
+        self.command = command
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def done(self):
+        """Return True if the command has completed"""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for and return the command response bytes
+
+        Raises the exception raised by the command, if any, or
+        RuntimeError if the command did not finish within timeout seconds.
+
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError('Timed out waiting for %s' % self.command)
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def set_result(self, value):
+        self._value = value
+        self._event.set()
+
+    def set_exception(self, error):
+        self._error = error
+        self._event.set()
+
+
+class _ServerQueue(object):
+
+    def __init__(self, name, conn, bucket):
+        self.name = name
+        self.conn = conn
+        self.bucket = bucket
+        # heap of [priority, seq, command, result, valid]
+        self.heap = []
+        # pending idempotent commands by command string
+        self.pending = {}
+        self.busy = False
+
+    def pop(self):
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[4]:
+                self.pending.pop(entry[2], None)
+                return entry
+        return None
+
+    def has_work(self):
+        while self.heap and not self.heap[0][4]:
+            heapq.heappop(self.heap)
+        return bool(self.heap)
+
+
+class RconScheduler(object):
+
+    """Priority and rate limited RCON command scheduler
+
+    Each server has its own priority queue and token bucket. Commands are
+    taken from servers in round robin order, so a server with a long queue
+    of bulk commands cannot starve the others, and within a server the
+    highest priority (lowest value) command runs first. A server only has
+    one command in flight at a time, since an RconConnection can only run
+    one command at a time.
+
+    Submitting an idempotent command (i.e. status) which is already queued
+    for the same server returns the queued command's result instead of
+    queueing a duplicate, raising its priority if needed.
+
+    Commands can be run from the caller's thread with run_once(), or by
+    worker threads started with start().
+
+    Args:
+        rate: Default maximum commands per second per server.
+        burst: Default token bucket size per server.
+        idempotent_commands: Commands which may be coalesced.
+
+    """
+
+    def __init__(self, rate=5.0, burst=None,
+                 idempotent_commands=IDEMPOTENT_COMMANDS):
+        self.rate = rate
+        self.burst = burst
+        self.idempotent_commands = frozenset(idempotent_commands)
+        self._servers = []
+        self._by_name = {}
+        self._next = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    def add_server(self, name, conn, rate=None, burst=None):
+        """Add a server connection
+
+        Args:
+            name: Server name used to submit commands.
+            conn: An RconConnection (or any object with exec_command).
+            rate: Optional rate limit for this server.
+            burst: Optional token bucket size for this server.
+
+        """
+        bucket = TokenBucket(self.rate if rate is None else rate,
+                             self.burst if burst is None else burst)
+        with self._cond:
+            if name in self._by_name:
+                raise ValueError('Duplicate server: %s' % name)
+            server = _ServerQueue(name, conn, bucket)
+            self._servers.append(server)
+            self._by_name[name] = server
+
+    def submit(self, server, command, priority=PRIORITY_NORMAL):
+        """Queue a command for a server and return its CommandResult"""
+        with self._cond:
+            queue = self._by_name[server]
+            if command in self.idempotent_commands:
+                entry = queue.pending.get(command)
+                if entry is not None:
+                    if priority < entry[0]:
+                        # requeue at the higher priority
+                        entry[4] = False
+                        entry = [priority, next(self._seq), command,
+                                 entry[3], True]
+                        heapq.heappush(queue.heap, entry)
+                        queue.pending[command] = entry
+                    return entry[3]
+            result = CommandResult(server, command)
+            entry = [priority, next(self._seq), command, result, True]
+            heapq.heappush(queue.heap, entry)
+            if command in self.idempotent_commands:
+                queue.pending[command] = entry
+            self._cond.notify()
+            return result
+
+    def _next_job(self, now):
+        """Return the next (server, entry) which may run now, or None"""
+        servers = self._servers
+        count = len(servers)
+        for i in range(count):
+            server = servers[(self._next + i) % count]
+            if (not server.busy and server.has_work()
+                    and server.bucket.try_acquire(now=now)):
+                self._next = (self._next + i + 1) % count
+                server.busy = True
+                return (server, server.pop())
+        return None
+
+    def _next_delay(self, now):
+        """Return seconds until a queued command may run, or None if idle"""
+        delays = [server.bucket.delay(now=now) for server in self._servers
+                  if not server.busy and server.has_work()]
+        if not delays:
+            return None
+        return min(delays)
+
+    def _execute(self, server, entry):
+        result = entry[3]
+        try:
+            result.set_result(server.conn.exec_command(entry[2]))
+        except Exception as e:
+            result.set_exception(e)
+        finally:
+            with self._cond:
+                server.busy = False
+                self._cond.notify_all()
+
+    def run_once(self):
+        """Run every command which may run now, in the caller's thread
+
+        Returns the number of commands run.
+
+        """
+        count = 0
+        while True:
+            with self._cond:
+                job = self._next_job(_clock())
+            if job is None:
+                return count
+            self._execute(*job)
+            count += 1
+
+    def next_delay(self):
+        """Return seconds until a queued command may run, or None if idle"""
+        with self._cond:
+            return self._next_delay(_clock())
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    now = _clock()
+                    job = self._next_job(now)
+                    if job is not None:
+                        break
+                    self._cond.wait(self._next_delay(now))
+            self._execute(*job)
+
+    def start(self, workers=4):
+        """Start worker threads which run commands as they become ready
+
+        Up to workers servers run commands concurrently.
+
+        """
+        with self._cond:
+            self._stopped = False
+        for _ in range(workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the worker threads
+
+        Commands which are still queued are left in the queue.
+
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,247 @@
+# Copyright (C) 2013 Peter Rowlands
+"""
+Server status module
+
+Parses the response to the RCON ``status`` command into structured objects.
+
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import re
+import threading
+import time
+import weakref
+
+from .objects import SteamId
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+_PLAYER_RE = re.compile(
+    r'#\s*(?P<userid>\d+)\s+(?:(?P<slot>\d+)\s+)?"(?P<name>.*)"\s+'
+    r'(?P<uniqueid>\S+)'
+    r'(?:\s+(?P<connected>\d+(?::\d+){1,2}))?'
+    r'(?:\s+(?P<ping>\d+)\s+(?P<loss>\d+))?'
+    r'\s+(?P<state>[a-z]+)'
+    r'(?:\s+(?P<rate>\d+))?'
+    r'(?:\s+(?P<address>\S+))?\s*$', re.U)
+
+_PLAYERS_RE = re.compile(
+    r'(?P<count>\d+)(?: humans?, (?P<bots>\d+) bots?)?'
+    r' \((?P<max>\d+)(?:/\d+)? max\)', re.U)
+
+
+class StatusPlayer(object):
+
+    """A player row from a status response
+
+    Args:
+        userid: Player user ID.
+        name: Player name.
+        steam_id: SteamId, or None for players without a valid SteamID
+            (i.e. STEAM_ID_PENDING).
+        connected: Connection time in seconds (None for bots).
+        ping: Ping in milliseconds (None for bots).
+        loss: Packet loss percentage (None for bots).
+        state: Connection state (i.e. 'active', 'spawning').
+        rate: Player rate, if listed.
+        address: (host, port) tuple, 'loopback', or None if not listed.
+
+    """
+
+    def __init__(self, userid, name, steam_id, connected=None, ping=None,
+                 loss=None, state='', rate=None, address=None):
+        self.userid = userid
+        self.name = name
+        self.steam_id = steam_id
+        self.connected = connected
+        self.ping = ping
+        self.loss = loss
+        self.state = state
+        self.rate = rate
+        self.address = address
+
+    def __repr__(self):
+        return '<StatusPlayer %d "%s" %s>' % (self.userid, self.name,
+                                             self.steam_id)
+
+    @property
+    def is_bot(self):
+        """True if this player is a bot"""
+        return self.steam_id is not None and self.steam_id.is_bot
+
+    @classmethod
+    def from_re_match(cls, match):
+        """Return a player constructed from a player row match"""
+        groups = match.groupdict()
+        try:
+            steam_id = SteamId(groups['uniqueid'])
+        except ValueError:
+            steam_id = None
+        connected = groups['connected']
+        if connected is not None:
+            seconds = 0
+            for part in connected.split(':'):
+                seconds = seconds * 60 + int(part)
+            connected = seconds
+        address = groups['address']
+        if address is not None and ':' in address:
+            (host, port) = address.rsplit(':', 1)
+            address = (host, int(port))
+        return cls(int(groups['userid']), groups['name'], steam_id,
+                   connected=connected,
+                   ping=_int_or_none(groups['ping']),
+                   loss=_int_or_none(groups['loss']),
+                   state=groups['state'],
+                   rate=_int_or_none(groups['rate']),
+                   address=address)
+
+
+def _int_or_none(value):
+    if value is None:
+        return None
+    return int(value)
+
+
+class ServerStatus(object):
+
+    """Parsed status response
+
+    Attributes:
+        hostname: Server hostname.
+        map: Current map name.
+        humans: Number of human players.
+        bots: Number of bots (0 if the server does not list bots).
+        max_players: Maximum number of players.
+        players: List of StatusPlayers.
+        info: Dict of all ``key : value`` header lines.
+
+    """
+
+    def __init__(self, hostname='', map='', humans=0, bots=0, max_players=0,
+                 players=(), info=None):
+        self.hostname = hostname
+        self.map = map
+        self.humans = humans
+        self.bots = bots
+        self.max_players = max_players
+        self.players = list(players)
+        if info is None:
+            info = {}
+        self.info = info
+
+    @property
+    def player_count(self):
+        """Total number of players, including bots"""
+        return self.humans + self.bots
+
+    def player(self, steam_id):
+        """Return the StatusPlayer for a SteamId, or None"""
+        for player in self.players:
+            if player.steam_id == steam_id:
+                return player
+        return None
+
+
+def parse_status(text):
+    """Parse a status response
+
+    Args:
+        text: The status response body (str or bytes).
+
+    Returns:
+        A ServerStatus.
+
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    status = ServerStatus()
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#'):
+            match = _PLAYER_RE.match(line)
+            if match:
+                status.players.append(StatusPlayer.from_re_match(match))
+            continue
+        (key, sep, value) = line.partition(':')
+        if not sep:
+            continue
+        key = key.strip()
+        value = value.strip()
+        status.info[key] = value
+        if key == 'hostname':
+            status.hostname = value
+        elif key == 'map':
+            status.map = value.split(None, 1)[0] if value else value
+        elif key == 'players':
+            match = _PLAYERS_RE.match(value)
+            if match:
+                status.humans = int(match.group('count'))
+                status.bots = int(match.group('bots') or 0)
+                status.max_players = int(match.group('max'))
+    return status
+
+
+def query_status(conn):
+    """Run status on an RconConnection and return the parsed ServerStatus"""
+    return parse_status(conn.exec_command('status'))
+
+
+class _CacheEntry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.time = None
+        self.status = None
+
+
+class StatusCache(object):
+
+    """Per-connection TTL cache of status responses
+
+    Callers which ask for the status of the same connection within ttl
+    seconds share one RCON round trip. Concurrent callers wait for the
+    request in progress rather than sending their own.
+
+    Entries are weakly keyed by connection, so closed and discarded
+    connections do not keep their entries alive.
+
+    Args:
+        ttl: Maximum age in seconds of a cached status.
+
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = weakref.WeakKeyDictionary()
+
+    def get(self, conn, max_age=None):
+        """Return the ServerStatus for a connection
+
+        Args:
+            conn: An RconConnection.
+            max_age: Optional maximum age in seconds for this call, which
+                overrides ttl.
+
+        """
+        if max_age is None:
+            max_age = self.ttl
+        with self._lock:
+            entry = self._entries.get(conn)
+            if entry is None:
+                entry = self._entries[conn] = _CacheEntry()
+        with entry.lock:
+            if entry.status is None or _clock() - entry.time >= max_age:
+                entry.status = query_status(conn)
+                entry.time = _clock()
+            return entry.status
+
+    def invalidate(self, conn=None):
+        """Drop the cached status for a connection, or for all connections"""
+        with self._lock:
+            if conn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(conn, None)
@@ -0,0 +1,143 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.events.binary"""
+
+from __future__ import unicode_literals
+
+import copy
+import io
+import os
+import shutil
+import tempfile
+
+from srcds.events import binary, csgo
+from srcds.logparser import SourceLogParser
+
+from .test_csgo import ROUND_STATS_LINES
+
+
+LOG_LINES = [
+    'L 01/11/2013 - 16:57:49: Server cvar "foo" = "bar"',
+    'L 01/11/2013 - 16:57:58: "Dave<3><BOT><>" connected, address "none"',
+    ''.join([
+        'L 01/12/2013 - 00:57:01: "foobar<21><STEAM_0:0:12345><>" ',
+        'connected, address "12.34.56.78:27005"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:01: "foobar<21><STEAM_1:1:12345><CT>" ',
+        'purchased "defuser"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 01:01:01: "foo<32><STEAM_1:0:12345><TERRORIST>" ',
+        '[-761 -836 196] killed "bar<38><STEAM_1:1:54321><CT>" ',
+        '[-793 -848 130] with "glock" (headshot)',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 01:01:14: "foo<30><STEAM_1:0:12345><CT>" [254 -370 7]',
+        ' attacked "bar<33><STEAM_1:1:54321><TERRORIST>" [-428 -843 114] ',
+        'with "m4a1" (damage "21") (damage_armor "4") (health "45") ',
+        '(armor "87") (hitgroup "right arm")',
+    ]),
+    'L 01/12/2013 - 00:57:01: World triggered "Round_End"',
+    ''.join([
+        'L 01/12/2013 - 00:57:02: "foo<32><[U:1:24690]><CT>" ',
+        'purchased "defuser"',
+    ]),
+] + ROUND_STATS_LINES
+
+
+def test_binary_round_trip():
+    """Test binary serialization round trip"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in LOG_LINES:
+        parser.parse_line(line)
+    assert len(parser.events) == 9
+    fobj = io.BytesIO()
+    binary.dump(parser.events, fobj)
+    events = list(binary.iter_events(fobj.getvalue()))
+    assert [str(e) for e in events] == [str(e) for e in parser.events]
+    assert events[4].headshot
+    assert events[1].player.steam_id.is_bot
+    # version 1 files (without SteamID3/SteamID64 kinds) are still readable
+    fobj = io.BytesIO()
+    binary.dump(list(parser.events)[:3], fobj)
+    data = fobj.getvalue()[len(binary.MAGIC):]
+    events = list(binary.iter_events(binary.MAGIC[:-1] + b'\x01' + data))
+    assert [str(e) for e in events] == [str(e) for e in
+                                        list(parser.events)[:3]]
+    try:
+        list(binary.iter_events(binary.MAGIC[:-1] + b'\x03' + data))
+        assert False
+    except ValueError:
+        pass
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'events.bin')
+        with open(path, 'wb') as fobj:
+            writer = binary.BinaryEventWriter(fobj, buffer_size=16)
+            for event in parser.events:
+                writer.write(event)
+            writer.flush()
+        events = binary.load(path)
+        assert [str(e) for e in events] == [str(e) for e in parser.events]
+        open(path, 'wb').close()
+        try:
+            binary.load(path)
+            assert False
+        except ValueError:
+            pass
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_binary_unknown_type():
+    """Test loading an unregistered event type"""
+    data = binary.MAGIC + b'\x00\x09os:system\x01\x00\x00\x02'
+    try:
+        list(binary.iter_events(data))
+        assert False
+    except ValueError:
+        pass
+
+
+def test_binary_write_error():
+    """Test a failed write leaving the binary stream intact"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in LOG_LINES:
+        parser.parse_line(line)
+    events = list(parser.events)
+    bad = copy.copy(events[1])
+    bad.value = object()
+    fobj = io.BytesIO()
+    writer = binary.BinaryEventWriter(fobj)
+    writer.write(events[0])
+    try:
+        writer.write(bad)
+        assert False
+    except TypeError:
+        pass
+    for event in events[1:]:
+        writer.write(event)
+    writer.flush()
+    decoded = list(binary.iter_events(fobj.getvalue()))
+    assert [str(e) for e in decoded] == [str(e) for e in events]
+
+
+def test_binary_truncated():
+    """Test decoding truncated binary data"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in LOG_LINES:
+        parser.parse_line(line)
+    fobj = io.BytesIO()
+    binary.dump(parser.events, fobj)
+    data = fobj.getvalue()
+    for size in (len(binary.MAGIC) - 1, len(binary.MAGIC) + 3,
+                 len(data) // 2, len(data) - 1):
+        try:
+            list(binary.iter_events(data[:size]))
+            assert False
+        except ValueError:
+            pass
@@ -3,6 +3,7 @@
 
 
 from srcds.events import csgo
+from srcds.logparser import SourceLogParser, UnknownEventError
 
 from .test_generic import check_event
 
@@ -60,3 +61,100 @@ def test_csgo_attack_event():
         '(armor "87") (hitgroup "right arm")',
     ])
     check_event(csgo.CsgoAttackEvent, log_line)
+
+
+ROUND_STATS_LINES = [
+    'L 10/20/2019 - 19:38:09: JSON_BEGIN{',
+    'L 10/20/2019 - 19:38:09: "name": "round_stats",',
+    'L 10/20/2019 - 19:38:09: "round_number" : "2",',
+    'L 10/20/2019 - 19:38:09: "score_t" : "1",',
+    'L 10/20/2019 - 19:38:09: "score_ct" : "1",',
+    'L 10/20/2019 - 19:38:09: "map" : "de_inferno",',
+    'L 10/20/2019 - 19:38:09: "server" : "foo",',
+    ''.join([
+        'L 10/20/2019 - 19:38:09: "fields" : "             accountid,   ',
+        'team,  money,  kills, deaths,assists,  dmg,   kdr",',
+    ]),
+    'L 10/20/2019 - 19:38:09: "players" : {',
+    ''.join([
+        'L 10/20/2019 - 19:38:09: "player_0" : "       12345,      3,   ',
+        '3050,      1,      0,      0,  100,  1.00",',
+    ]),
+    ''.join([
+        'L 10/20/2019 - 19:38:09: "player_1" : "       54321,      2,   ',
+        '1900,      0,      1,      0,   20,  0.00"',
+    ]),
+    'L 10/20/2019 - 19:38:09: }}JSON_END',
+]
+
+
+def test_round_stats_event():
+    """Test RoundStatsEvent"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in ROUND_STATS_LINES:
+        parser.parse_line(line)
+    assert len(parser.events) == 1
+    event = parser.events[0]
+    assert isinstance(event, csgo.RoundStatsEvent)
+    assert event.round_number == 2
+    assert event.mapname == 'de_inferno'
+    assert event.fields[:3] == ('accountid', 'team', 'money')
+    assert event.column('kills') == [1, 0]
+    assert event.get(12345, 'dmg') == 100
+    assert event.get(76561197960265728 + 54321, 'deaths') == 1
+    assert event.player_stats(54321)['kdr'] == 0.0
+    assert event.get(99999, 'dmg') is None
+    assert event.steam_ids()[0].id64() == 76561197960265728 + 12345
+    # round trip through text() gives the same event
+    reparsed = SourceLogParser()
+    reparsed.add_event_types(csgo.CSGO_EVENTS)
+    for line in event.text().split('\n'):
+        reparsed.parse_line(line)
+    assert reparsed.events[0].players == event.players
+
+
+def test_truncated_round_stats_block():
+    """Test that a truncated JSON block does not swallow later events"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in ROUND_STATS_LINES[:4]:
+        parser.parse_line(line)
+    parser.parse_line('L 10/20/2019 - 19:38:10: World triggered "Round_Start"')
+    assert len(parser.events) == 1
+    assert parser.events[0].action == 'Round_Start'
+    # without skip_unknowns the dropped block is an error, but the line
+    # after it is still parsed
+    parser = SourceLogParser(skip_unknowns=False)
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in ROUND_STATS_LINES[:4]:
+        parser.parse_line(line)
+    try:
+        parser.parse_line(
+            'L 10/20/2019 - 19:38:10: World triggered "Round_Start"')
+        assert False
+    except UnknownEventError:
+        pass
+    assert len(parser.events) == 1
+    assert not parser.in_block
+
+
+def test_round_stats_bots():
+    """Test RoundStatsEvent rows for bots, which all have account ID 0"""
+    lines = list(ROUND_STATS_LINES)
+    lines[9] = lines[9].replace('12345', '0')
+    lines[10] = lines[10].replace('54321', '0')
+    lines.insert(10, lines[9].replace('"player_0" : "       0',
+                                      '"player_1" : "       777'))
+    lines[11] = lines[11].replace('player_1', 'player_2')
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in lines:
+        parser.parse_line(line)
+    event = parser.events[0]
+    assert len(event.players) == 3
+    assert event.player_row(0) is None
+    assert event.get(777, 'dmg') == 100
+    assert sorted(event.bot_rows()) == [0, 2]
+    assert event.bot_rows()[2][event.fields.index('deaths')] == 1
+    assert [s.is_bot for s in event.steam_ids()] == [True, False, True]
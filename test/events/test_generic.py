@@ -9,7 +9,7 @@ from srcds.events import generic
 
 
 def check_event(cls, log_line):
-    match = re.match(cls.regex, log_line)
+    match = cls.pattern.match(log_line)
     assert match
     event = cls.from_re_match(match)
     assert event
@@ -58,8 +58,20 @@ def test_change_map_event():
 
 def test_rcon_event():
     """Test RconEvent"""
-    # TODO find an example for this
-    pass
+    log_line = ''.join([
+        'L 01/12/2013 - 00:57:01: Rcon: "rcon 1234567890 "secret" status" ',
+        'from "12.34.56.78:27005"',
+    ])
+    event = check_event(generic.RconEvent, log_line)
+    assert event.passed and event.password == 'secret'
+    assert event.command == 'status'
+    assert event.address == ('12.34.56.78', 27005)
+    log_line = ''.join([
+        'L 01/12/2013 - 00:57:01: Bad Rcon: "rcon 1234567890 "foo" ',
+        'sv_cheats 1" from "12.34.56.78:27005"',
+    ])
+    event = check_event(generic.RconEvent, log_line)
+    assert not event.passed and event.command == 'sv_cheats 1'
 
 
 def test_connection_event():
@@ -154,6 +166,12 @@ def test_kill_event():
         'killed "bar<38><STEAM_0:0:54321><TERRORIST>" with "glock"',
     ])
     check_event(generic.KillEvent, log_line)
+    log_line = ''.join([
+        'L 01/12/2013 - 01:01:01: "foo<32><[U:1:24690]><TERRORIST>" ',
+        'killed "bar<38><BOT><CT>" with "glock"',
+    ])
+    event = check_event(generic.KillEvent, log_line)
+    assert event.player.steam_id.id64() == 76561197960290418
 
 
 def test_attack_event():
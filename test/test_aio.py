@@ -0,0 +1,150 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.aio"""
+
+import sys
+from unittest import SkipTest
+
+if sys.version_info < (3, 5):
+    raise SkipTest('asyncio support requires Python 3.5')
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from srcds.aio import AsyncEventBus, LogPipeline, LogProtocol
+from srcds.events import csgo, generic
+from srcds.logparser import SourceLogParser
+
+from .events.test_csgo import ROUND_STATS_LINES
+from .test_dispatch import KILL, ROUND_START
+
+
+def _collect(loop, pipeline):
+    events = []
+    while True:
+        try:
+            events.append(loop.run_until_complete(pipeline.__anext__()))
+        except StopAsyncIteration:
+            return events
+
+
+def _run_pipeline(executor=None):
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'test.log')
+    lines = [KILL % minute for minute in range(5)] + ROUND_STATS_LINES
+    with open(path, 'w') as fobj:
+        fobj.write('\n'.join(lines + [KILL % 59]) + '\n')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        parser = SourceLogParser()
+        parser.add_event_types(csgo.CSGO_EVENTS)
+        pipeline = LogPipeline(parser, executor=executor, batch_size=3,
+                               max_pending=2)
+        feed = asyncio.ensure_future(pipeline.feed_file(path))
+        feed.add_done_callback(
+            lambda f: asyncio.ensure_future(pipeline.close()))
+        events = _collect(loop, pipeline)
+        loop.run_until_complete(feed)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        shutil.rmtree(tmpdir)
+    assert len(events) == 7
+    assert all(isinstance(e, csgo.CsgoKillEvent) for e in events[:5])
+    assert isinstance(events[5], csgo.RoundStatsEvent)
+    assert events[6].timestamp.minute == 59
+    assert len(parser.events) == 0
+
+
+def test_log_pipeline():
+    """Test LogPipeline"""
+    _run_pipeline()
+
+
+def test_log_pipeline_process_pool():
+    """Test LogPipeline with a process pool"""
+    with ProcessPoolExecutor(1) as executor:
+        _run_pipeline(executor)
+
+
+def test_log_pipeline_stalled_consumer():
+    """Test LogPipeline shutdown while the consumer is not reading"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        pipeline = LogPipeline(max_pending=3, batch_size=1)
+        for minute in range(3):
+            loop.run_until_complete(pipeline.feed(ROUND_START % minute))
+        loop.run_until_complete(pipeline.close())
+        # the output queue is full when the pipeline finishes
+        loop.run_until_complete(asyncio.wait_for(pipeline._task, 5))
+        assert pipeline._task.done()
+        events = _collect(loop, pipeline)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(events) == 3
+
+
+def test_log_pipeline_event_bus():
+    """Test a LogPipeline whose parser has an AsyncEventBus"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        bus = AsyncEventBus()
+        kills = []
+        subscription = bus.subscribe(generic.KillEvent, kills.append)
+        # record the threads which touch the (not thread safe) queue
+        threads = set()
+        put_nowait = subscription.queue.put_nowait
+
+        def record(event):
+            threads.add(threading.current_thread())
+            put_nowait(event)
+
+        subscription.queue.put_nowait = record
+        parser = SourceLogParser(bus=bus)
+        parser.add_event_types(csgo.CSGO_EVENTS)
+        pipeline = LogPipeline(parser, batch_size=2)
+        for minute in range(10):
+            pipeline.feed_nowait(KILL % minute)
+        loop.run_until_complete(pipeline.close())
+        events = _collect(loop, pipeline)
+        loop.run_until_complete(bus.close())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(events) == 10
+    assert [e.timestamp.minute for e in kills] == list(range(10))
+    # events are queued on the loop thread, not the executor thread
+    assert threads == set([threading.current_thread()])
+
+
+def test_log_protocol():
+    """Test LogProtocol"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        pipeline = LogPipeline(max_pending=1, batch_size=2)
+        protocol = LogProtocol(pipeline, secret='secret')
+        line = (ROUND_START % 0).encode('utf-8')
+        header = b'\xff\xff\xff\xff'
+        for packet in [b'Ssecret' + line + b'\n\x00',
+                       b'R' + line + b'\n\x00',
+                       b'Swrong' + line + b'\n\x00',
+                       b'Ssecret' + line,
+                       b'Ssecret' + line]:
+            protocol.datagram_received(header + packet, None)
+        assert protocol.rejected == 2
+        assert pipeline.dropped == 1
+        loop.run_until_complete(pipeline.close())
+        events = _collect(loop, pipeline)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(events) == 2
+    assert all(isinstance(e, generic.WorldActionEvent) for e in events)
@@ -0,0 +1,99 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.checkpoint"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from srcds.checkpoint import HEAD_SIZE, CheckpointedReader, LogCheckpoint
+from srcds.events import csgo
+from srcds.logparser import SourceLogParser
+from srcds.match import MatchState
+
+from .test_match import LOG_LINES
+
+
+def _parser():
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    return parser
+
+
+def test_checkpoint_resume():
+    """Test saving and resuming from a checkpoint"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        log_path = os.path.join(tmpdir, 'test.log')
+        cp_path = os.path.join(tmpdir, 'test.checkpoint')
+        with open(log_path, 'wb') as fobj:
+            for line in LOG_LINES[:5]:
+                fobj.write(line.encode('utf-8') + b'\n')
+            # partial line should not be consumed
+            fobj.write(LOG_LINES[5][:20].encode('utf-8'))
+        reader = CheckpointedReader(_parser(), log_path,
+                                    aggregates={'match': MatchState()})
+        assert reader.poll() == 5
+        reader.save(cp_path)
+        reader.close()
+        assert LogCheckpoint.load(cp_path).offset < os.path.getsize(log_path)
+
+        with open(log_path, 'ab') as fobj:
+            fobj.write(LOG_LINES[5][20:].encode('utf-8') + b'\n')
+            for line in LOG_LINES[6:]:
+                fobj.write(line.encode('utf-8') + b'\n')
+        parser = _parser()
+        reader = CheckpointedReader.resume(parser, log_path, cp_path,
+                                           aggregates={'match': MatchState()})
+        assert reader.poll() == 3
+        assert len(parser.events) == 3
+        state = reader.aggregates['match']
+        assert len(state.players) == 2
+        assert state.score == {'TERRORIST': 1}
+        reader.close()
+
+        # rotated file is read from the start
+        os.unlink(log_path)
+        with open(log_path, 'wb') as fobj:
+            fobj.write(LOG_LINES[0].encode('utf-8') + b'\n')
+        parser = _parser()
+        reader = CheckpointedReader.resume(parser, log_path, cp_path)
+        assert reader.poll() == 1
+        reader.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_checkpoint_reused_inode():
+    """Test resuming after rotation which reuses the inode"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        log_path = os.path.join(tmpdir, 'test.log')
+        cp_path = os.path.join(tmpdir, 'test.checkpoint')
+
+        def write(lines):
+            # truncating and rewriting the file keeps its inode
+            with open(log_path, 'wb') as fobj:
+                for line in lines:
+                    fobj.write(line.encode('utf-8') + b'\n')
+
+        # the file head must be longer than HEAD_SIZE
+        write(LOG_LINES[:4])
+        assert os.path.getsize(log_path) > HEAD_SIZE
+        reader = CheckpointedReader(_parser(), log_path)
+        assert reader.poll() == 4
+        reader.save(cp_path)
+        reader.close()
+
+        write([LOG_LINES[0].replace('de_dust2', 'de_nuke')] + LOG_LINES[1:])
+        for expected in (len(LOG_LINES), 0, 0):
+            reader = CheckpointedReader.resume(
+                _parser(), log_path, cp_path,
+                aggregates={'match': MatchState()})
+            assert reader.poll() == expected
+            reader.save(cp_path)
+            reader.close()
+        assert reader.aggregates['match'].score == {'TERRORIST': 1}
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,73 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.cvars"""
+
+from __future__ import unicode_literals
+
+from srcds.cvars import (apply_cvars, batch_commands, diff_cvars,
+                         fetch_all_cvars, fetch_cvars)
+
+
+CVARLIST = '\n'.join([
+    'cvar list',
+    '--------------',
+    'sv_cheats                                : 0        : , "nf", "rep"'
+    '    : Allow cheats on server',
+    'status                                   : cmd      : '
+    '                 : Display map and connection status.',
+    'hostname                                 : Test Server : , "sv"'
+    '   : Hostname for server.',
+    '--------------',
+    '   3 total convars/concommands',
+])
+
+
+class FakeConnection(object):
+
+    def __init__(self, cvars):
+        self.cvars = cvars
+        self.commands = []
+
+    def exec_command(self, command):
+        self.commands.append(command)
+        if command == 'cvarlist':
+            return CVARLIST.encode('utf-8')
+        output = []
+        for part in command.split(';'):
+            (name, _, value) = part.partition(' ')
+            if name not in self.cvars:
+                output.append('Unknown command "%s"' % name)
+            elif value:
+                self.cvars[name] = value.strip('"')
+            else:
+                output.append('"%s" = "%s" ( def. "" )' % (
+                    name, self.cvars[name]))
+                output.append(' - help text')
+        return '\n'.join(output).encode('utf-8')
+
+
+def test_batch_commands():
+    """Test batch_commands"""
+    assert list(batch_commands(['a', 'bb', 'c', 'dddd'], max_size=5)) == [
+        'a;bb', 'c', 'dddd']
+
+
+def test_cvars():
+    """Test cvar snapshots, diffs and apply"""
+    server = dict(('cvar_%d' % i, '%d' % i) for i in range(300))
+    conn = FakeConnection(server)
+    snapshot = fetch_cvars(conn, sorted(server) + ['unknown'])
+    assert snapshot == server
+    assert len(conn.commands) == 1
+    assert fetch_all_cvars(conn) == {'sv_cheats': '0',
+                                     'hostname': 'Test Server'}
+
+    desired = dict(snapshot, cvar_1='10', cvar_2='text value')
+    assert diff_cvars(snapshot, desired) == {'cvar_1': ('1', '10'),
+                                             'cvar_2': ('2', 'text value')}
+    del conn.commands[:]
+    changed = apply_cvars(conn, desired, current=snapshot)
+    assert sorted(changed) == ['cvar_1', 'cvar_2']
+    assert conn.commands == ['cvar_1 "10";cvar_2 "text value"']
+    assert server['cvar_2'] == 'text value'
+    assert apply_cvars(conn, desired) == {}
+    assert diff_cvars({'a': '1'}, {}) == {'a': ('1', None)}
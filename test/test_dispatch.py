@@ -0,0 +1,110 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.dispatch"""
+
+from __future__ import unicode_literals
+
+import sys
+from unittest import SkipTest
+
+from srcds.dispatch import EventBus
+from srcds.events import csgo, generic
+from srcds.logparser import SourceLogParser
+
+
+KILL = ''.join([
+    'L 01/12/2013 - 01:%02d:00: "foo<32><STEAM_1:0:12345><TERRORIST>" ',
+    '[-761 -836 196] killed "bar<38><STEAM_1:1:54321><CT>" ',
+    '[-793 -848 130] with "ak47"',
+])
+ROUND_START = 'L 01/12/2013 - 01:%02d:00: World triggered "Round_Start"'
+
+
+def test_event_bus():
+    """Test EventBus dispatch"""
+    bus = EventBus()
+    kills = []
+    targets = []
+    batches = []
+    bus.subscribe(generic.KillEvent, kills.append)
+    bus.subscribe(generic.PlayerTargetEvent, targets.append)
+    bus.subscribe(generic.BaseEvent, batches.append, batch_size=3)
+    parser = SourceLogParser(bus=bus)
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for minute in range(4):
+        parser.parse_line(ROUND_START % minute)
+        parser.parse_line(KILL % minute)
+    assert len(kills) == 4
+    assert all(isinstance(e, csgo.CsgoKillEvent) for e in kills)
+    assert targets == kills
+    assert [len(batch) for batch in batches] == [3, 3]
+    bus.flush()
+    assert [len(batch) for batch in batches] == [3, 3, 2]
+    subscription = bus.subscriptions_for(csgo.CsgoKillEvent)[0]
+    bus.unsubscribe(subscription)
+    bus.dispatch_all(list(parser.events)[:2])
+    assert len(kills) == 4
+    assert len(targets) == 5
+    assert [len(batch) for batch in batches] == [3, 3, 2, 2]
+
+
+def test_async_event_bus():
+    """Test AsyncEventBus dispatch"""
+    if sys.version_info < (3, 5):
+        raise SkipTest('asyncio support requires Python 3.5')
+    import asyncio
+    from srcds.aio import AsyncEventBus
+
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for minute in range(10):
+        parser.parse_line(ROUND_START % minute)
+        parser.parse_line(KILL % minute)
+    kills = []
+    batches = []
+
+    def handle_batch(batch):
+        # returns an awaitable like a coroutine function handler would
+        batches.append(batch)
+        return asyncio.sleep(0)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        bus = AsyncEventBus()
+        bus.subscribe(generic.KillEvent, kills.append, max_pending=2)
+        bus.subscribe(generic.BaseEvent, handle_batch, batch_size=4)
+        loop.run_until_complete(bus.publish_all(parser.events))
+        loop.run_until_complete(bus.close())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert len(kills) == 10
+    assert sum(len(batch) for batch in batches) == 20
+    assert all(len(batch) <= 4 for batch in batches)
+
+
+def test_async_event_bus_parser():
+    """Test an AsyncEventBus attached to a SourceLogParser"""
+    if sys.version_info < (3, 5):
+        raise SkipTest('asyncio support requires Python 3.5')
+    import asyncio
+    from srcds.aio import AsyncEventBus
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        bus = AsyncEventBus()
+        rounds = []
+        subscription = bus.subscribe(generic.WorldActionEvent, rounds.append,
+                                     max_pending=3)
+        # no event loop is running and the queue overflows
+        parser = SourceLogParser(bus=bus)
+        for minute in range(5):
+            parser.parse_line(ROUND_START % minute)
+        assert len(parser.events) == 5
+        assert subscription.dropped == 2
+        loop.run_until_complete(bus.close())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert [e.timestamp.minute for e in rounds] == [0, 1, 2]
@@ -0,0 +1,42 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.index"""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from srcds.events import csgo, generic
+from srcds.logparser import SourceLogParser
+from srcds.objects import SteamId
+
+
+KILL = ''.join([
+    'L 01/12/2013 - 01:%02d:00: "foo<32><STEAM_1:0:12345><TERRORIST>" ',
+    '[-761 -836 196] killed "bar<38><STEAM_1:1:54321><CT>" ',
+    '[-793 -848 130] with "ak47"',
+])
+ROUND_START = 'L 01/12/2013 - 01:%02d:00: World triggered "Round_Start"'
+
+
+def test_event_index():
+    """Test EventIndex queries"""
+    parser = SourceLogParser(index=True)
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for minute in range(10):
+        parser.parse_line(ROUND_START % minute)
+        parser.parse_line(KILL % minute)
+    index = parser.index
+    foo = SteamId('STEAM_1:0:12345')
+    bar = SteamId('STEAM_1:1:54321')
+    assert len(index.by_player(foo)) == 10
+    assert len(index.by_player(foo, role='target')) == 0
+    assert len(index.by_type(generic.KillEvent)) == 10
+    assert index.by_type(generic.KillEvent, subclasses=False) == []
+    events = index.query(steam_id=bar, role='target', rounds=(5, 9))
+    assert [e.timestamp.minute for e in events] == [4, 5, 6, 7, 8]
+    events = index.query(steam_id=foo, event_type=generic.KillEvent,
+                         start=datetime(2013, 1, 12, 1, 2),
+                         end=datetime(2013, 1, 12, 1, 3))
+    assert len(events) == 2
+    assert len(index.query(event_type=generic.WorldActionEvent,
+                           rounds=(1, 1))) == 1
@@ -0,0 +1,31 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.loadtest"""
+
+from __future__ import unicode_literals
+
+from srcds.loadtest import LoadTest, main
+
+from .test_rcon import FakeRconServer
+
+
+def test_load_test():
+    """Test LoadTest against the fake RCON server"""
+    server = FakeRconServer(responses={'status': 'hostname: test'})
+    try:
+        test = LoadTest('127.0.0.1', server.port, 'password', connections=4,
+                        duration=0.5, ramp_up=0.2, rate=50,
+                        commands=[('status', 3), ('x' * 5000, 1)])
+        report = test.run()
+        assert len(report.connect_latencies) == 4
+        assert report.commands['status'] > 10
+        assert report.errors['RconSizeError'] > 0
+        assert 0 < report.percentile(50) <= report.percentile(99)
+        assert report.throughput > 0
+        assert 'p99' in report.summary()
+
+        report = main(['127.0.0.1', '-p', '%d' % server.port, '-P', 'wrong',
+                       '-c', '2', '-d', '0.1'])
+        assert report.errors['RconAuthError'] == 2
+        assert not report.latencies
+    finally:
+        server.close()
@@ -0,0 +1,71 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.logparser"""
+
+from __future__ import unicode_literals
+
+from srcds.events import csgo
+from srcds.logparser import SourceLogParser
+
+from .events.test_csgo import ROUND_STATS_LINES
+from .test_dispatch import KILL, ROUND_START
+
+
+def test_parse_lines():
+    """Test SourceLogParser.parse_lines and parse_buffer"""
+    lines = [ROUND_START % 0, 'garbage', KILL % 1]
+    lines += ROUND_STATS_LINES[:-1] + [KILL % 2] + ROUND_STATS_LINES
+    lines += ['', KILL % 3]
+    expected = SourceLogParser(index=True)
+    expected.add_event_types(csgo.CSGO_EVENTS)
+    for line in lines:
+        expected.parse_line(line)
+    parser = SourceLogParser(index=True)
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    (events, unparsed) = parser.parse_buffer('\n'.join(lines[:6]))
+    assert unparsed == [1]
+    assert len(events) == 2
+    (events, unparsed) = parser.parse_lines(lines[6:])
+    assert unparsed == [lines.index('') - 6]
+    assert [e.text() for e in parser.events] == [
+        e.text() for e in expected.events]
+    assert len(parser.index) == len(expected.events)
+    assert isinstance(parser.events[-2], csgo.RoundStatsEvent)
+
+
+def test_parse_lines_error():
+    """Test that parse_lines keeps events parsed before an exception"""
+    def lines():
+        yield ROUND_START % 0
+        yield KILL % 1
+        raise IOError('read error')
+
+    parser = SourceLogParser(index=True)
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    try:
+        parser.parse_lines(lines())
+        assert False
+    except IOError:
+        pass
+    assert len(parser.events) == 2
+    assert len(parser.index) == 2
+
+
+def test_iter_parse():
+    """Test that iter_parse only yields newly parsed events"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    parser.parse_line(ROUND_START % 0)
+    events = list(parser.iter_parse([KILL % 1, 'garbage', KILL % 2]))
+    assert [e.timestamp.minute for e in events] == [1, 2]
+    assert len(parser.events) == 1
+    assert parser.events[0].timestamp.minute == 0
+
+
+def test_shared_patterns():
+    """Test that parsers share compiled event patterns"""
+    first = SourceLogParser()
+    second = SourceLogParser()
+    assert all(a[0] is b[0] for (a, b) in zip(first.events_types,
+                                               second.events_types))
+    assert csgo.CsgoKillEvent.pattern is not csgo.KillEvent.pattern
+    assert csgo.CsgoKillEvent.pattern.pattern == csgo.CsgoKillEvent.regex
@@ -0,0 +1,80 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.logquery"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from srcds.events import csgo, generic
+from srcds.logquery import LogQuery, event_keyword
+from srcds.objects import SteamId
+
+
+LINES = [
+    'L 01/12/2013 - 01:00:00: World triggered "Round_Start"',
+    'L 01/12/2013 - 01:00:01: "foo<2><STEAM_1:0:12345><CT>" say "hi"',
+    'L 01/12/2013 - 01:00:02: "foo<2><STEAM_1:0:12345><CT>" '
+    '[1 2 3] killed "bar<3><STEAM_1:1:54321><TERRORIST>" [4 5 6] '
+    'with "awp"',
+    'L 01/12/2013 - 01:00:03: "bar<3><[U:1:108643]><TERRORIST>" '
+    '[1 2 3] killed "foo<2><[U:1:24690]><CT>" [4 5 6] with "ak47"',
+    'L 01/12/2013 - 01:00:04: "baz<4><STEAM_1:0:999><CT>" '
+    '[1 2 3] killed "bar<3><STEAM_1:1:54321><TERRORIST>" [4 5 6] '
+    'with "awp" (headshot)',
+    'L 01/12/2013 - 01:00:05: "bar<3><STEAM_1:1:54321><TERRORIST>" say '
+    '"awp"',
+    'L 01/12/2013 - 01:00:06: World triggered "Round_End"',
+    'L 01/12/2013 - 01:00:07: "bar<3><STEAM_1:1:54321><TERRORIST>" '
+    'say_team "rush b"',
+    'L 01/12/2013 - 01:00:08: "sayer<5><[U:2:1000]><CT>" '
+    'triggered "Planted_The_Bomb"',
+]
+
+
+def test_event_keyword():
+    """Test event_keyword"""
+    assert event_keyword(csgo.CsgoKillEvent) == ' killed "'
+    assert event_keyword(generic.PlayerEvent) is None
+    assert event_keyword(generic.ChatEvent) == ('" say "', '" say_team "')
+
+
+def test_log_query():
+    """Test LogQuery prefilters and matching"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        log_path = os.path.join(tmpdir, 'test.log')
+        with open(log_path, 'w') as fobj:
+            fobj.write('\n'.join(LINES) + '\n')
+        event_types = generic.STANDARD_EVENTS + csgo.CSGO_EVENTS
+
+        def run(**kwargs):
+            query = LogQuery(event_types=event_types, **kwargs)
+            return [e.timestamp.second for e in query.run_file(log_path)]
+
+        assert run() == list(range(9))
+        # SteamID2 and SteamID3 forms, player or target
+        assert run(steam_id='STEAM_1:0:12345') == [1, 2, 3]
+        assert run(steam_id=SteamId('[U:1:108643]'),
+                   event_type=generic.KillEvent) == [2, 3, 4]
+        assert run(player_name='baz') == [4]
+        # the chat line contains "awp" but has no weapon
+        assert run(weapon='awp') == [2, 4]
+        assert run(weapon='awp', player_name='foo') == [2]
+        assert run(event_type=generic.ChatEvent) == [1, 5, 7]
+        # the player name contains "say", but the prefilter rejects it
+        query = LogQuery(event_type=generic.ChatEvent)
+        assert not query.match_line(LINES[8].encode('utf-8'))
+        # SteamID3 needles use the ID's universe
+        assert run(steam_id='[U:2:1000]') == [8]
+        assert run(event_type=generic.WorldActionEvent) == [0, 6]
+
+        query = LogQuery(steam_id='STEAM_1:0:999')
+        assert not query.match_line(LINES[2].encode('utf-8'))
+        assert query.match_line(LINES[4].encode('utf-8'))
+        query = LogQuery(event_type=csgo.RoundStatsEvent,
+                         event_types=event_types)
+        assert query.event_types == [csgo.RoundStatsEvent]
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,100 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.logwriter"""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import os
+import shutil
+import socket
+import tempfile
+
+from srcds.logparser import SourceLogParser
+from srcds.logwriter import LogWriter
+
+
+LOG_LINES = [
+    'L 01/11/2013 - 16:57:49: Server cvars start',
+    'L 01/12/2013 - 00:57:01: "foobar<21><STEAM_0:0:12345><>" say "baz"',
+    'L 01/12/2013 - 00:57:01: World triggered "Round_End"',
+]
+
+
+def _parser():
+    parser = SourceLogParser()
+    for line in LOG_LINES:
+        parser.parse_line(line)
+    return parser
+
+
+def test_parser_write():
+    """Test SourceLogParser.write"""
+    fobj = io.StringIO()
+    _parser().write(fobj)
+    assert fobj.getvalue() == '\n'.join(LOG_LINES) + '\n'
+
+
+class _Wrapper(object):
+
+    """File-like wrapper which is not an io class and has no mode"""
+
+    def __init__(self, fobj):
+        self.fobj = fobj
+
+    def write(self, data):
+        return self.fobj.write(data)
+
+    def flush(self):
+        pass
+
+
+def test_log_writer_text_detection():
+    """Test text/binary detection for non-io file objects"""
+    expected = '\n'.join(LOG_LINES) + '\n'
+    for fobj in (io.StringIO(), io.BytesIO()):
+        with LogWriter(_Wrapper(fobj)) as writer:
+            writer.write_all(_parser().events)
+        value = fobj.getvalue()
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        assert value == expected
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'test.log')
+        for mode in ('w', 'wb'):
+            with io.open(path, mode) as fobj:
+                _parser().write(_Wrapper(fobj))
+            with io.open(path, 'rb') as fobj:
+                assert fobj.read().decode('utf-8') == expected
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_log_writer_gzip():
+    """Test gzip compressed output with a small buffer"""
+    fobj = io.BytesIO()
+    writer = LogWriter(fobj, compress=True, buffer_size=10)
+    writer.write_all(_parser().events)
+    writer.close()
+    data = gzip.GzipFile(fileobj=io.BytesIO(fobj.getvalue())).read()
+    assert data.decode('utf-8').splitlines() == LOG_LINES
+
+
+def test_log_writer_socket():
+    """Test writing to a socket"""
+    (a, b) = socket.socketpair()
+    try:
+        with LogWriter(a) as writer:
+            for event in _parser().events:
+                writer.write(event)
+        a.close()
+        data = b''
+        while True:
+            chunk = b.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        assert data.decode('utf-8').splitlines() == LOG_LINES
+    finally:
+        b.close()
@@ -0,0 +1,102 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.match"""
+
+from __future__ import unicode_literals
+
+from srcds.events import csgo
+from srcds.logparser import SourceLogParser
+from srcds.match import MatchState
+from srcds.objects import SteamId
+
+
+LOG_LINES = [
+    'L 01/12/2013 - 00:57:00: Loading map "de_dust2"',
+    ''.join([
+        'L 01/12/2013 - 00:57:01: "foo<32><STEAM_1:0:12345><>" ',
+        'connected, address "12.34.56.78:27005"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:01: "bar<38><STEAM_1:1:54321><>" ',
+        'connected, address "12.34.56.79:27005"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:02: "foo<32><STEAM_1:0:12345>" ',
+        'switched from team <Unassigned> to <TERRORIST>',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:02: "bar<38><STEAM_1:1:54321>" ',
+        'switched from team <Unassigned> to <CT>',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 01:01:14: "foo<32><STEAM_1:0:12345><TERRORIST>" ',
+        '[254 -370 7] attacked "bar<38><STEAM_1:1:54321><CT>" ',
+        '[-428 -843 114] with "ak47" (damage "27") (damage_armor "4") ',
+        '(health "73") (armor "87") (hitgroup "chest")',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 01:01:15: "foo<32><STEAM_1:0:12345><TERRORIST>" ',
+        '[-761 -836 196] killed "bar<38><STEAM_1:1:54321><CT>" ',
+        '[-793 -848 130] with "ak47" (headshot)',
+    ]),
+    'L 01/12/2013 - 01:01:20: Team "TERRORIST" scored "1" with "1" players',
+]
+
+
+def test_match_state():
+    """Test MatchState updates, snapshot and diff"""
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in LOG_LINES[:5]:
+        parser.parse_line(line)
+    state = MatchState()
+    state.consume(parser.events)
+    snapshot = state.snapshot()
+    assert len(snapshot['players']) == 2
+    assert len(state.team_members('CT')) == 1
+
+    parser.events.clear()
+    for line in LOG_LINES[5:]:
+        parser.parse_line(line)
+    state.consume(parser.events)
+    foo = state.player(SteamId('STEAM_1:0:12345'))
+    assert foo.kills == 1 and foo.damage == 27 and foo.team == 'TERRORIST'
+    diff = state.diff(snapshot)
+    assert diff['score'] == {'TERRORIST': 1}
+    assert 'mapname' in diff
+    assert len(diff['players']) == 2
+    assert state.diff(state.version) == {'version': state.version,
+                                         'players': {}}
+
+
+def test_match_state_bots():
+    """Test renamed bots and reloading the same map"""
+    lines = [
+        'L 01/12/2013 - 00:57:00: Loading map "de_dust2"',
+        'L 01/12/2013 - 00:57:01: "Dave<3><BOT><>" connected, address ""',
+        'L 01/12/2013 - 00:57:01: "Rick<4><BOT><>" connected, address ""',
+        'L 01/12/2013 - 00:57:02: "Dave<3><BOT><>" changed name to "Bob"',
+        ''.join([
+            'L 01/12/2013 - 00:57:03: "Bob<3><BOT><TERRORIST>" ',
+            '[-761 -836 196] killed "Rick<4><BOT><CT>" ',
+            '[-793 -848 130] with "ak47"',
+        ]),
+    ]
+    parser = SourceLogParser()
+    parser.add_event_types(csgo.CSGO_EVENTS)
+    for line in lines:
+        parser.parse_line(line)
+    state = MatchState()
+    state.consume(parser.events)
+    assert len(state.players) == 2
+    assert state.player('Bob').kills == 1
+    assert state.player('Rick').deaths == 1
+    assert state.player('Dave') is None
+    restored = MatchState.restore(state.snapshot())
+    assert sorted(restored.players) == sorted(state.players)
+
+    version = state.version
+    parser.events.clear()
+    parser.parse_line(lines[0])
+    state.consume(parser.events)
+    assert state.player('Bob').kills == 0
+    assert 'mapname' in state.diff(version)
@@ -0,0 +1,39 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.merge"""
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from srcds.logparser import SourceLogParser
+from srcds.merge import merge_events
+
+
+LINE = 'L 01/12/2013 - 01:%02d:%02d: World triggered "Round_Start"'
+
+
+def _events(times):
+    parser = SourceLogParser()
+    return parser.iter_parse(LINE % (m, s) for (m, s) in times)
+
+
+def test_merge_events():
+    """Test merge_events ordering, ties and skew"""
+    merged = merge_events([
+        ('a', _events([(0, 0), (0, 10), (0, 20)])),
+        ('b', _events([(0, 5), (0, 10), (0, 30)])),
+        ('c', _events([])),
+    ])
+    assert [(source, e.timestamp.second) for (source, e) in merged] == [
+        ('a', 0), ('b', 5), ('a', 10), ('b', 10), ('a', 20), ('b', 30)]
+    # b's clock is 8 seconds fast
+    merged = merge_events({
+        'a': _events([(0, 0), (0, 10)]),
+        'b': _events([(0, 5), (0, 15)]),
+    }, skew={'b': -8})
+    events = list(merged)
+    assert [source for (source, _) in events] == ['b', 'a', 'b', 'a']
+    assert events[0][1].timestamp.second == 5
+    merged = merge_events({'a': _events([(0, 0)]), 'b': _events([(0, 1)])},
+                          skew={'a': timedelta(seconds=2)})
+    assert [source for (source, _) in merged] == ['b', 'a']
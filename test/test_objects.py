@@ -0,0 +1,49 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.objects"""
+
+from __future__ import unicode_literals
+
+from srcds.objects import SteamId
+
+
+def test_steam_id():
+    """Test SteamId formats"""
+    id64 = 76561197960290418
+    steam2 = SteamId('STEAM_1:0:12345')
+    steam3 = SteamId('[U:1:24690]')
+    decimal = SteamId('%d' % id64)
+    for steam_id in (steam2, steam3, decimal, SteamId(id64)):
+        assert steam_id.id64() == id64
+        assert steam_id.id3() == '[U:1:24690]'
+    assert str(steam2) == 'STEAM_1:0:12345'
+    assert str(steam3) == '[U:1:24690]'
+    assert str(decimal) == '%d' % id64
+    assert str(SteamId(id64)) == 'STEAM_1:0:12345'
+    assert str(SteamId('[G:1:123:4]')) == '[G:1:123:4]'
+    assert SteamId('[G:1:123]').instance == 0
+    assert str(SteamId('BOT')) == 'BOT'
+    for value in ('STEAM_1:0', 'STEAM_9:0:1', '[X:1:2]', '[U:1:x]', 'foo'):
+        try:
+            SteamId(value)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_steam_id_equality():
+    """Test SteamId comparison and hashing"""
+    steam2 = SteamId('STEAM_1:0:12345')
+    steam3 = SteamId('[U:1:24690]')
+    assert steam2 == steam3
+    assert not steam2 != steam3
+    assert steam2 != SteamId('STEAM_1:1:12345')
+    assert SteamId('BOT') == SteamId('BOT')
+    assert SteamId('BOT') != SteamId('Console')
+    assert steam2 != steam2.id64()
+    assert len(set([steam2, steam3, SteamId(steam2.id64())])) == 1
+    assert {steam2: 1}[steam3] == 1
+    # legacy universe 0 IDs are the same accounts
+    steam0 = SteamId('STEAM_0:0:12345')
+    assert steam0 == steam3 and hash(steam0) == hash(steam3)
+    assert steam0.canonical_id64() == steam3.id64()
+    assert str(steam0) == 'STEAM_0:0:12345'
@@ -0,0 +1,219 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.query"""
+
+from __future__ import unicode_literals
+
+import bz2
+import socket
+import struct
+import threading
+import zlib
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from srcds import query
+from srcds.objects import SteamId
+
+
+CHALLENGE = b'\x01\x02\x03\x04'
+SERVER_STEAM_ID = 85568392920051769
+
+
+def _string(value):
+    return value.encode('utf-8') + b'\x00'
+
+
+def _info_response(port):
+    return (query.SINGLE_PACKET + query.S2A_INFO + b'\x11'
+            + _string('pysrcds test') + _string('de_dust2')
+            + _string('csgo') + _string('Counter-Strike: Global Offensive')
+            + struct.pack('<h', 730) + b'\x02\x10\x01' + b'dl\x00\x01'
+            + _string('1.37.0.0') + b'\xb1' + struct.pack('<H', port)
+            + struct.pack('<Q', SERVER_STEAM_ID) + _string('secure')
+            + struct.pack('<Q', 730))
+
+
+def _players_response():
+    return (query.SINGLE_PACKET + query.S2A_PLAYER + b'\x02'
+            + b'\x00' + _string('Player') + struct.pack('<lf', 12, 61.5)
+            + b'\x00' + _string('\u00e9l\u00e8ve') + struct.pack('<lf', -1, 2))
+
+
+RULES = dict(('sv_rule_%d' % i, '%d' % i) for i in range(400))
+
+
+def _split(payload, packet_id, compress=False, size=1200):
+    if compress:
+        packet_id |= 0x80000000
+        data = bz2.compress(payload)
+        data = struct.pack('<lL', len(payload),
+                           zlib.crc32(payload) & 0xffffffff) + data
+    else:
+        data = payload
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    return [query.SPLIT_PACKET
+            + struct.pack('<LBBh', packet_id, len(chunks), i, size) + chunk
+            for (i, chunk) in enumerate(chunks)]
+
+
+class _FakeQueryHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        (data, sock) = self.request
+        server = self.server
+        server.requests.append(data)
+        header = data[4:5]
+        if header == query.A2S_INFO:
+            challenge = data[4 + len(b'TSource Engine Query\x00'):]
+        else:
+            challenge = data[5:9]
+        if server.drop > 0:
+            server.drop -= 1
+            return
+        if challenge != CHALLENGE or server.endless_challenges:
+            sock.sendto(query.SINGLE_PACKET + query.S2C_CHALLENGE + CHALLENGE,
+                        self.client_address)
+            return
+        if header == query.A2S_INFO:
+            packets = [_info_response(server.server_address[1])]
+        elif header == query.A2S_PLAYER:
+            packets = [_players_response()]
+        else:
+            payload = (query.SINGLE_PACKET + query.S2A_RULES
+                       + struct.pack('<h', len(RULES))
+                       + b''.join(_string(k) + _string(v)
+                                  for (k, v) in sorted(RULES.items())))
+            packets = _split(payload, 7, compress=server.compress)
+            # fragments may arrive out of order
+            packets.reverse()
+        for packet in packets:
+            sock.sendto(packet, self.client_address)
+
+
+class FakeQueryServer(socketserver.UDPServer):
+
+    """Fake A2S server listening on a loopback port
+
+    Every query is answered with a challenge first. Rules responses are
+    split (and bz2 compressed if compress is set), and the first drop
+    requests are ignored. If endless_challenges is set, every request is
+    answered with a challenge.
+
+    """
+
+    def __init__(self, compress=False, drop=0, endless_challenges=False):
+        socketserver.UDPServer.__init__(self, ('127.0.0.1', 0),
+                                        _FakeQueryHandler)
+        self.compress = compress
+        self.drop = drop
+        self.endless_challenges = endless_challenges
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def address(self):
+        return self.server_address
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def test_query_client():
+    """Test QueryClient info, players and rules queries"""
+    server = FakeQueryServer()
+    try:
+        with query.QueryClient(timeout=1.0) as client:
+            info = client.info(server.address)
+            assert info.name == 'pysrcds test'
+            assert info.map == 'de_dust2'
+            assert info.app_id == 730
+            assert (info.players, info.max_players, info.bots) == (2, 16, 1)
+            assert info.server_type == 'd'
+            assert not info.password
+            assert info.vac
+            assert info.port == server.address[1]
+            assert info.steam_id == SteamId(SERVER_STEAM_ID)
+            assert '%s' % info.steam_id == '[G:1:12345]'
+            assert info.keywords == 'secure'
+            assert info.game_id == 730
+            players = client.players(server.address)
+            assert [(p.name, p.score, p.duration) for p in players] == [
+                ('Player', 12, 61.5), ('\u00e9l\u00e8ve', -1, 2.0)]
+            assert client.rules(server.address) == RULES
+    finally:
+        server.close()
+
+
+def test_query_batch():
+    """Test batched queries, compressed responses, retries and timeouts"""
+    compressed = FakeQueryServer(compress=True)
+    lossy = FakeQueryServer(drop=1)
+    stubborn = FakeQueryServer(endless_challenges=True)
+    # closed port, nothing answers
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    silent = sock.getsockname()
+    try:
+        client = query.QueryClient(timeout=0.2, retries=1)
+        results = client.query([
+            (compressed.address, 'rules'),
+            (compressed.address, 'info'),
+            (lossy.address, 'players'),
+            (silent, 'info'),
+            (stubborn.address, 'info'),
+        ])
+        assert results[0] == RULES
+        assert results[1].name == 'pysrcds test'
+        assert len(results[2]) == 2
+        assert isinstance(results[3], query.QueryTimeoutError)
+        assert isinstance(results[4], query.QueryError)
+        assert not isinstance(results[4], query.QueryTimeoutError)
+        # the first request plus max_challenges challenge responses
+        assert len(stubborn.requests) == 4
+        # the dropped request was resent
+        assert len(lossy.requests) == 3
+        client.close()
+    finally:
+        compressed.close()
+        lossy.close()
+        stubborn.close()
+        sock.close()
+
+
+def test_query_errors():
+    """Test that per-server failures do not abort a batch"""
+    server = FakeQueryServer()
+    try:
+        with query.QueryClient(timeout=0.2, retries=0) as client:
+            results = client.query([
+                (('no such host.invalid', 27015), 'info'),
+                # sending to the broadcast address is not permitted
+                (('255.255.255.255', 27015), 'info'),
+                (server.address, 'info'),
+            ])
+            assert isinstance(results[0], query.QueryError)
+            assert isinstance(results[1], query.QueryError)
+            assert not isinstance(results[1], query.QueryTimeoutError)
+            assert results[2].name == 'pysrcds test'
+
+            bad_packets = [
+                # fragment number out of range
+                struct.pack('<LBBh', 1, 2, 5, 1200) + b'x',
+                # truncated compressed header
+                struct.pack('<LBBh', 0x80000001, 1, 0, 1200) + b'xy',
+            ]
+            for packet in bad_packets:
+                pending = query._Query(server.address, 'rules')
+                try:
+                    client._reassemble(pending, query.SPLIT_PACKET + packet)
+                    assert False
+                except query.QueryError:
+                    pass
+    finally:
+        server.close()
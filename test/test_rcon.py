@@ -0,0 +1,210 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.rcon"""
+
+from __future__ import unicode_literals
+
+import socket
+import struct
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from srcds import rcon
+
+
+class _FakeRconHandler(socketserver.BaseRequestHandler):
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _send(self, pkt_id, pkt_type, body=b''):
+        self.request.sendall(struct.pack('<3i', len(body) + 10, pkt_id,
+                                         pkt_type) + body + b'\x00\x00')
+
+    def handle(self):
+        server = self.server
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            header = self._recv_exact(4)
+            if header is None:
+                server.disconnects += 1
+                return
+            (size,) = struct.unpack('<i', header)
+            data = self._recv_exact(size)
+            if data is None:
+                return
+            (pkt_id, pkt_type) = struct.unpack('<2i', data[:8])
+            body = data[8:-2].decode('utf-8')
+            if pkt_type == rcon.SERVERDATA_AUTH:
+                self._send(pkt_id, rcon.SERVERDATA_RESPONSE_VALUE)
+                if body != server.password:
+                    pkt_id = -1
+                self._send(pkt_id, rcon.SERVERDATA_AUTH_RESPONSE)
+            elif pkt_type == rcon.SERVERDATA_EXECCOMMAND:
+                server.commands.append(body)
+                response = server.responses.get(body, '')
+                if callable(response):
+                    response = response(body)
+                if response is None:
+                    # drop the connection
+                    return
+                if isinstance(response, int):
+                    # send an empty packet of an unexpected type
+                    self._send(pkt_id, response)
+                    continue
+                response = response.encode('utf-8')
+                for i in range(0, max(len(response), 1), 4096):
+                    self._send(pkt_id, rcon.SERVERDATA_RESPONSE_VALUE,
+                               response[i:i + 4096])
+            else:
+                # mirror the empty response value packet, then send the
+                # extra response packet
+                self._send(pkt_id, rcon.SERVERDATA_RESPONSE_VALUE)
+                self._send(pkt_id, rcon.SERVERDATA_RESPONSE_VALUE,
+                           b'\x00\x01\x00\x00')
+
+
+class FakeRconServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    """Fake Source RCON server listening on a loopback port
+
+    responses maps command strings to response strings (or callables which
+    take the command and return the response). A response of None closes
+    the connection, and an int response is sent as an empty packet of that
+    type. Executed commands are recorded in commands, and the number of
+    connections closed by the client in disconnects.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password='password', responses=None):
+        socketserver.TCPServer.__init__(self, ('127.0.0.1', 0),
+                                        _FakeRconHandler)
+        self.password = password
+        self.responses = responses or {}
+        self.commands = []
+        self.disconnects = 0
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def test_rcon_packet():
+    """Test RconPacket"""
+    pkt = rcon.RconPacket(3, rcon.SERVERDATA_EXECCOMMAND, 'caf\xe9')
+    assert pkt.body == b'caf\xc3\xa9'
+    assert pkt.size() == 15
+    assert pkt.pack() == struct.pack('<3i5s2x', 15, 3, 2, b'caf\xc3\xa9')
+    assert '%s' % pkt == 'caf\xe9'
+    pkt = rcon.RconPacket(3, rcon.SERVERDATA_EXECCOMMAND, 'caf\xe9',
+                          encoding='latin-1')
+    assert pkt.body == b'caf\xe9'
+
+
+# response which spans several packets, with multi-byte characters split
+# across packet boundaries
+LONG_RESPONSE = ''.join('cvar_%d : \u00e9\u00e9\u00e9 : help\n' % i
+                        for i in range(2000))
+
+
+def test_rcon_connection():
+    """Test RconConnection commands and multi-packet responses"""
+    server = FakeRconServer(responses={'echo': 'hello',
+                                       'cvarlist': LONG_RESPONSE})
+    try:
+        conn = rcon.RconConnection('127.0.0.1', server.port,
+                                   password='password')
+        assert conn.exec_command('echo') == b'hello'
+        assert conn.exec_command('cvarlist') == LONG_RESPONSE.encode('utf-8')
+        chunks = list(conn.exec_command_iter('cvarlist'))
+        assert len(chunks) > 1
+        assert ''.join(chunks) == LONG_RESPONSE
+        # stopping early must leave the connection usable
+        chunks = conn.exec_command_iter('cvarlist')
+        next(chunks)
+        chunks.close()
+        assert conn.exec_command('echo') == b'hello'
+        del server.commands[:]
+        responses = conn.exec_commands(['echo', 'cvarlist'] * 20, window=8)
+        assert responses == [b'hello', LONG_RESPONSE.encode('utf-8')] * 20
+        assert server.commands == ['echo', 'cvarlist'] * 20
+        # a window larger than IOV_MAX buffers
+        assert conn.exec_commands(['echo'] * 400, window=400) == [
+            b'hello'] * 400
+        # an error with responses in flight closes the connection
+        server.responses['bogus'] = rcon.SERVERDATA_AUTH_RESPONSE
+        try:
+            conn.exec_commands(['echo', 'bogus', 'echo'])
+            assert False
+        except rcon.RconError:
+            pass
+        assert conn.closed
+        try:
+            rcon.RconConnection('127.0.0.1', server.port, password='wrong')
+            assert False
+        except rcon.RconAuthError:
+            # the socket is closed when authentication fails, even while
+            # the traceback still references the connection
+            for _ in range(100):
+                if server.disconnects:
+                    break
+                time.sleep(0.01)
+            assert server.disconnects == 1
+    finally:
+        server.close()
+
+
+def test_rcon_timeouts():
+    """Test RconConnection timeouts and closed connections"""
+    def slow(command):
+        time.sleep(0.5)
+        return 'done'
+
+    server = FakeRconServer(responses={'slow': slow, 'echo': 'hello',
+                                       'quit': None})
+    try:
+        conn = rcon.RconConnection('127.0.0.1', server.port,
+                                   password='password', read_timeout=5)
+        start = time.time()
+        try:
+            conn.exec_command('slow', timeout=0.1)
+            assert False
+        except rcon.RconTimeoutError:
+            pass
+        assert time.time() - start < 0.4
+        try:
+            conn.exec_command('echo')
+            assert False
+        except rcon.RconClosedError:
+            pass
+
+        conn = rcon.RconConnection('127.0.0.1', server.port,
+                                   password='password', command_timeout=5)
+        assert conn.exec_command('slow') == b'done'
+        try:
+            conn.exec_command('quit')
+            assert False
+        except rcon.RconClosedError:
+            pass
+    finally:
+        server.close()
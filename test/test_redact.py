@@ -0,0 +1,67 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.redact"""
+
+from __future__ import unicode_literals
+
+import io
+
+from srcds.logparser import SourceLogParser
+from srcds.objects import SteamId
+from srcds.redact import Redactor
+
+
+LOG_LINES = [
+    ''.join([
+        'L 01/12/2013 - 00:57:01: Rcon: "rcon 1234567890 "secret" ',
+        'sv_password hunter2" from "12.34.56.78:27005"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:01: Rcon: "rcon 1234567890 "secret" ',
+        'logaddress_add 98.76.54.32:27500" from "12.34.56.78:27005"',
+    ]),
+    ''.join([
+        'L 01/12/2013 - 00:57:01: "foobar<21><STEAM_0:0:12345><>" ',
+        'connected, address "12.34.56.78:27005"',
+    ]),
+    'L 01/12/2013 - 00:57:02: "foobar<21><STEAM_0:0:12345><>" say "hi"',
+]
+
+
+def test_redactor():
+    """Test Redactor"""
+    parser = SourceLogParser()
+    for line in LOG_LINES:
+        parser.parse_line(line)
+    fobj = io.StringIO()
+    Redactor(steam_ids=True, key=b'key').write(parser.events, fobj)
+    text = fobj.getvalue()
+    for secret in ('secret', 'hunter2', '12.34.56.78', '98.76.54.32',
+                   'STEAM_0:0:12345'):
+        assert secret not in text
+    lines = text.splitlines()
+    assert 'sv_password REDACTED' in lines[0]
+    assert 'logaddress_add 0.0.0.0:27500' in lines[1]
+    # pseudonyms are consistent within and across redactors with the same
+    # key
+    steam_id = lines[2].split('<')[2]
+    assert steam_id in lines[3]
+    parser = SourceLogParser()
+    parser.parse_line(LOG_LINES[3])
+    event = Redactor(steam_ids=True, key=b'key').redact(parser.events[0])
+    assert str(event) == lines[3]
+
+
+def test_pseudonym_collisions():
+    """Test that different players never share a pseudonym"""
+    (first, second) = (SteamId('STEAM_1:0:1'), SteamId('STEAM_1:0:2'))
+    pseudonym = Redactor(key=b'key').pseudonym(second)
+    # make the second player's pseudonym collide with the first player's
+    redactor = Redactor(key=b'key')
+    redactor._accounts[pseudonym.id64() & 0xffffffff] = first.id64()
+    assert redactor.pseudonym(second) != pseudonym
+    assert redactor.pseudonym(second) != redactor.pseudonym(first)
+    assert Redactor(key=b'key').pseudonym(second) == pseudonym
+    # the same account in universe 0 and SteamID3 forms
+    redactor = Redactor(key=b'key')
+    assert (redactor.pseudonym(SteamId('STEAM_0:0:2'))
+            == redactor.pseudonym(SteamId('[U:1:4]')))
@@ -0,0 +1,62 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.reorder"""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from srcds.reorder import ReorderBuffer, line_timestamp, reorder_lines
+
+
+LINE = 'L 01/12/2013 - 01:00:%02d: World triggered "Round_Start" %s'
+
+
+def test_line_timestamp():
+    """Test line_timestamp"""
+    assert line_timestamp(LINE % (5, '')) == datetime(2013, 1, 12, 1, 0, 5)
+    assert line_timestamp('"foo" = "bar"') is None
+    assert line_timestamp('L 13/99/2013 - 01:00:00: x') is None
+
+
+def test_reorder_buffer():
+    """Test ReorderBuffer ordering, dedup and bounds"""
+    buf = ReorderBuffer(window=2)
+    assert buf.push(LINE % (1, 'a')) == []
+    assert buf.push(LINE % (0, 'b')) == []
+    # duplicate
+    assert buf.push(LINE % (1, 'a')) == []
+    assert buf.duplicates == 1
+    assert buf.push(LINE % (1, 'c')) == []
+    assert buf.push(LINE % (3, 'd')) == [LINE % (0, 'b'), LINE % (1, 'a'),
+                                         LINE % (1, 'c')]
+    # behind the window, released immediately
+    assert buf.push(LINE % (0, 'e')) == [LINE % (0, 'e')]
+    assert buf.late == 1
+    assert len(buf) == 1
+    assert buf.flush() == [LINE % (3, 'd')]
+
+    buf = ReorderBuffer(window=60, max_size=3, dedup_size=2)
+    released = buf.push_all(LINE % (i, i) for i in range(5))
+    assert released == [LINE % (0, 0), LINE % (1, 1)]
+    assert len(buf) == 3
+    # only the last 2 distinct lines are remembered
+    assert buf.push(LINE % (4, 4)) == []
+    assert buf.push(LINE % (2, 2)) == [LINE % (2, 2)]
+    assert buf.duplicates == 1
+
+    lines = [LINE % (i, i) for i in (2, 0, 1, 1, 4, 3)]
+    assert list(reorder_lines(lines, window=1)) == [
+        LINE % (i, i) for i in range(5)]
+
+
+def test_reorder_untimestamped():
+    """Test ReorderBuffer placement of lines without a timestamp"""
+    buf = ReorderBuffer(window=10)
+    assert buf.push('"before" = "1"') == ['"before" = "1"']
+    buf.push(LINE % (5, 'a'))
+    buf.push(LINE % (1, 'b'))
+    # sorts with the newest timestamp (5), not that of the previous line
+    buf.push('"cvar" = "1"')
+    buf.push(LINE % (3, 'c'))
+    assert buf.flush() == [LINE % (1, 'b'), LINE % (3, 'c'), LINE % (5, 'a'),
+                           '"cvar" = "1"']
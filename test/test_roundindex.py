@@ -0,0 +1,98 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.roundindex"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from srcds.events import generic
+from srcds.logparser import SourceLogParser
+from srcds.roundindex import RoundIndex
+
+
+def _log_lines(first_minute, count, mapname):
+    lines = [
+        'L 01/12/2013 - 01:%02d:00: Loading map "%s"' % (first_minute,
+                                                       mapname),
+        'L 01/12/2013 - 01:%02d:00: Started map "%s" (CRC "1")' % (
+            first_minute, mapname),
+    ]
+    for minute in range(first_minute, first_minute + count):
+        lines.extend([
+            'L 01/12/2013 - 01:%02d:00: World triggered "Round_Start"'
+            % minute,
+            'L 01/12/2013 - 01:%02d:10: "foo<2><STEAM_1:0:1><CT>" say '
+            '"round %d"' % (minute, minute),
+            'L 01/12/2013 - 01:%02d:50: World triggered "Round_End"'
+            % minute,
+        ])
+    return lines
+
+
+def test_round_index():
+    """Test RoundIndex building, updates and round reads"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        log_path = os.path.join(tmpdir, 'test.log')
+        with open(log_path, 'w') as fobj:
+            fobj.write('\n'.join(_log_lines(0, 3, 'de_dust2')) + '\n')
+        index = RoundIndex.load(log_path)
+        assert os.path.exists(RoundIndex.sidecar_path(log_path))
+        assert len(index) == 3
+        assert [r[3] for r in index.rounds] == ['de_dust2'] * 3
+        assert all(r[1] is not None for r in index.rounds)
+
+        parser = SourceLogParser()
+        index.read_round(parser, 2)
+        says = [e for e in parser.events if isinstance(e, generic.ChatEvent)]
+        assert [e.message for e in says] == ['round 1']
+
+        # append a partial round on a new map
+        with open(log_path, 'a') as fobj:
+            fobj.write('\n'.join(_log_lines(5, 1, 'de_nuke')[:-1]) + '\n'
+                       + 'L 01/12/2013 - 01:05:5')
+        index = RoundIndex.load(log_path)
+        assert len(index) == 4
+        assert index.rounds[3][1] is None
+        assert index.rounds[3][3] == 'de_nuke'
+        assert [m[2] for m in index.maps] == ['de_dust2', 'de_nuke']
+        assert RoundIndex.load(log_path).to_dict() == index.to_dict()
+
+        assert index.round_at(datetime(2013, 1, 12, 0, 59)) == 0
+        assert index.round_at(datetime(2013, 1, 12, 1, 2, 30)) == 3
+        assert index.round_at(datetime(2013, 1, 12, 1, 6)) == 4
+        (start, end) = index.find_time(datetime(2013, 1, 12, 1, 6))
+        assert end == index.size
+        parser = SourceLogParser(index=True)
+        index.read_round(parser, 2, 4)
+        says = [e for e in parser.events if isinstance(e, generic.ChatEvent)]
+        assert [e.message for e in says] == ['round 1', 'round 2', 'round 5']
+        assert parser.index.round_range(1) == (0, 3)
+
+        # reloading the same map starts a new map entry
+        with open(log_path, 'a') as fobj:
+            fobj.write('0: x\n' + '\n'.join(_log_lines(7, 1, 'de_nuke'))
+                       + '\n')
+        index = RoundIndex.load(log_path)
+        assert [(m[2], m[3]) for m in index.maps] == [
+            ('de_dust2', 'Started'), ('de_nuke', 'Started'),
+            ('de_nuke', 'Started')]
+
+        # a rotated log which is larger than the indexed size
+        rotated_path = os.path.join(tmpdir, 'rotated.log')
+        with open(rotated_path, 'w') as fobj:
+            fobj.write('L 01/13/2013 - 00:00:00: Log file started\n'
+                       + '\n'.join(_log_lines(0, 8, 'de_inferno')) + '\n')
+        assert os.path.getsize(rotated_path) > index.size
+        os.rename(rotated_path, log_path)
+        index = RoundIndex.load(log_path)
+        assert len(index) == 8
+        assert [m[2] for m in index.maps] == ['de_inferno']
+        assert index.rounds[0][0] == len(
+            'L 01/13/2013 - 00:00:00: Log file started\n'
+            + '\n'.join(_log_lines(0, 8, 'de_inferno')[:2]) + '\n')
+    finally:
+        shutil.rmtree(tmpdir)
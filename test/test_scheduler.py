@@ -0,0 +1,86 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.scheduler"""
+
+from __future__ import unicode_literals
+
+from srcds.scheduler import (PRIORITY_BULK, PRIORITY_URGENT, RconScheduler,
+                             TokenBucket)
+
+
+class FakeConnection(object):
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def exec_command(self, command):
+        if command == 'fail':
+            raise ValueError(command)
+        self.log.append((self.name, command))
+        return command.encode('utf-8')
+
+
+def test_token_bucket():
+    """Test TokenBucket"""
+    bucket = TokenBucket(2, burst=2)
+    now = bucket._time
+    assert bucket.try_acquire(now=now)
+    assert bucket.try_acquire(now=now)
+    assert not bucket.try_acquire(now=now)
+    assert bucket.delay(now=now) == 0.5
+    assert bucket.try_acquire(now=now + 0.5)
+    assert bucket.delay(now=now + 10) == 0
+    assert bucket.tokens == 2
+    for rate in (0, -1):
+        try:
+            TokenBucket(rate)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_scheduler():
+    """Test RconScheduler priorities, coalescing and fairness"""
+    log = []
+    scheduler = RconScheduler(rate=1000, burst=1000)
+    scheduler.add_server('a', FakeConnection(log, 'a'))
+    scheduler.add_server('b', FakeConnection(log, 'b'))
+    bulk = [scheduler.submit('a', 'sv_cvar%d 1' % i, PRIORITY_BULK)
+            for i in range(3)]
+    status = scheduler.submit('a', 'status')
+    assert scheduler.submit('a', 'status', PRIORITY_URGENT) is status
+    kick = scheduler.submit('a', 'kickid 2', PRIORITY_URGENT)
+    other = scheduler.submit('b', 'status')
+    failed = scheduler.submit('b', 'fail')
+    assert scheduler.run_once() == 7
+    assert log[:3] == [('a', 'status'), ('b', 'status'), ('a', 'kickid 2')]
+    assert [entry for entry in log if entry[0] == 'a'][2:] == [
+        ('a', 'sv_cvar%d 1' % i) for i in range(3)]
+    assert status.result() == b'status'
+    assert other.done() and kick.done() and all(r.done() for r in bulk)
+    try:
+        failed.result()
+        assert False
+    except ValueError:
+        pass
+    assert scheduler.next_delay() is None
+
+
+def test_scheduler_rate_limit():
+    """Test RconScheduler rate limits with worker threads"""
+    log = []
+    scheduler = RconScheduler(rate=1000, burst=2)
+    scheduler.add_server('a', FakeConnection(log, 'a'))
+    scheduler.add_server('slow', FakeConnection(log, 'slow'), rate=0.01,
+                         burst=1)
+    results = [scheduler.submit(server, 'say %d' % i)
+               for i in range(10) for server in ('a', 'slow')]
+    scheduler.start(workers=2)
+    try:
+        for result in results[::2]:
+            result.result(timeout=5)
+    finally:
+        scheduler.stop()
+    assert [entry for entry in log if entry[0] == 'slow'] == [
+        ('slow', 'say 0')]
+    assert scheduler.next_delay() > 1
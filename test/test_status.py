@@ -0,0 +1,88 @@
+# Copyright (C) 2013 Peter Rowlands
+"""Tests for srcds.status"""
+
+from __future__ import unicode_literals
+
+from srcds.objects import SteamId
+from srcds.status import StatusCache, parse_status
+
+
+CSGO_STATUS = '\n'.join([
+    'hostname: Test Server',
+    'version : 1.37.0.1/13701 1118/7519 secure  [G:1:123456] ',
+    'udp/ip  : 12.34.56.78:27015  (public ip: 12.34.56.78)',
+    'os      :  Linux',
+    'type    :  community dedicated',
+    'map     : de_dust2',
+    'players : 2 humans, 1 bots (20/0 max) (not hibernating)',
+    '',
+    '# userid name uniqueid connected ping loss state rate adr',
+    '#  2 1 "foo" STEAM_1:0:12345 05:22 35 0 active 196608 1.2.3.4:27005',
+    '#  3 2 "bar "baz"" [U:1:108642] 1:02:03 50 2 spawning 80000 '
+    '5.6.7.8:27005',
+    '# 4 "Bot" BOT active 64',
+    '#end',
+])
+
+TF2_STATUS = '\n'.join([
+    'hostname: TF2 Server',
+    'map     : ctf_2fort at: 0 x, 0 y, 0 z',
+    'players : 1 humans, 0 bots (24 max)',
+    '# userid name                uniqueid            connected ping loss '
+    'state  adr',
+    '#      2 "foo"               STEAM_ID_PENDING    00:25       50    0 '
+    'active 1.2.3.4:27005',
+])
+
+
+def test_parse_status():
+    """Test parse_status"""
+    status = parse_status(CSGO_STATUS.encode('utf-8'))
+    assert status.hostname == 'Test Server'
+    assert status.map == 'de_dust2'
+    assert (status.humans, status.bots, status.max_players) == (2, 1, 20)
+    assert status.player_count == 3
+    assert status.info['type'] == 'community dedicated'
+    assert len(status.players) == 3
+    foo = status.player(SteamId('STEAM_1:0:12345'))
+    assert (foo.userid, foo.name, foo.connected) == (2, 'foo', 322)
+    assert (foo.ping, foo.loss, foo.rate) == (35, 0, 196608)
+    assert foo.address == ('1.2.3.4', 27005)
+    bar = status.players[1]
+    assert bar.name == 'bar "baz"'
+    assert str(bar.steam_id) == '[U:1:108642]'
+    assert (bar.connected, bar.state) == (3723, 'spawning')
+    bot = status.players[2]
+    assert bot.is_bot
+    assert (bot.ping, bot.connected, bot.rate) == (None, None, 64)
+
+    status = parse_status(TF2_STATUS)
+    assert status.map == 'ctf_2fort'
+    assert (status.humans, status.bots, status.max_players) == (1, 0, 24)
+    assert status.players[0].steam_id is None
+    assert status.players[0].address == ('1.2.3.4', 27005)
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.commands = []
+
+    def exec_command(self, command):
+        self.commands.append(command)
+        return CSGO_STATUS
+
+
+def test_status_cache():
+    """Test StatusCache"""
+    cache = StatusCache(ttl=60)
+    conn = FakeConnection()
+    other = FakeConnection()
+    status = cache.get(conn)
+    assert cache.get(conn) is status
+    assert cache.get(other) is not status
+    assert conn.commands == ['status']
+    assert cache.get(conn, max_age=0) is not status
+    cache.invalidate(conn)
+    cache.get(conn)
+    assert len(conn.commands) == 3